@@ -1,5 +1,8 @@
 import streamlit as st
-from utils import authenticate, load_data
+# A tela de login só carrega estes módulos leves; pandas, o backend e as bibliotecas do
+# Google entram no primeiro acesso aos dados (ver startup.py)
+from auth import authenticate
+from startup import warm_up
 
 st.set_page_config(page_title="Diário de Campo VISA", layout="wide", initial_sidebar_state="expanded")
 
@@ -23,20 +26,24 @@ if st.session_state['logged_in']:
         st.session_state['username'] = None
         st.session_state['role'] = None
         st.success("Sessão encerrada.")
-        st.experimental_rerun() 
+        st.rerun()
     
+    from metrics import start_page_run
+    from utils import load_data
+
     # Conteúdo Principal (Visão Geral)
+    run = start_page_run("Visão Geral")
+    run.stage("dados")
     st.title("📒 Visão Geral do Diário de Campo")
     
-    df = load_data()
-    total_inspecoes = len(df)
-    
     # Exibir informações conforme o perfil
     if st.session_state['role'] == 'inspetor':
-        df_user = df[df['inspetor_id'] == st.session_state['username']]
+        # Apenas os registros do próprio inspetor são carregados
+        df_user = load_data(inspetor_id=st.session_state['username'])
         total_inspecoes_user = len(df_user)
         st.info(f"Você tem **{total_inspecoes_user}** inspeções registradas. Acesse **Minhas Inspeções** para ver seus prazos!")
     else:
+        total_inspecoes = len(load_data())
         st.success(f"Há **{total_inspecoes}** inspeções registradas no total.")
         st.warning("Acesse **Painel Coordenação** ou **Indicadores** para gerenciar a equipe.")
 
@@ -45,6 +52,7 @@ if st.session_state['logged_in']:
     Use o menu lateral para navegar entre as funcionalidades.
     Este é o ponto de partida para a gestão da Vigilância Sanitária baseada em dados e prazos.
     """)
+    run.finish()
 
 # --- TELA DE LOGIN ---
 if not st.session_state['logged_in']:
@@ -66,7 +74,9 @@ if not st.session_state['logged_in']:
                     st.session_state['username'] = username
                     st.session_state['role'] = role
                     st.success(f"Login efetuado! Bem-vindo(a), {role.capitalize()}.")
-                    st.experimental_rerun() 
+                    # Os dados começam a ser carregados em segundo plano antes da próxima página
+                    warm_up()
+                    st.rerun()
                 else:
                     st.error("Usuário ou senha inválidos.")
     with col2:
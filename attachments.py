@@ -0,0 +1,154 @@
+"""Anexos dos processos (fotos e documentos), guardados fora da tabela de inspeções.
+
+Cada arquivo é gravado uma única vez em disco, com o nome igual ao seu SHA-256: o
+mesmo arquivo enviado de novo (no mesmo ou em outro processo) não ocupa espaço extra.
+Um índice SQLite liga os arquivos aos processos, e as miniaturas das fotos são geradas
+na primeira vez que são pedidas e guardadas junto aos arquivos.
+
+Estrutura em 'root':
+    objetos/ab/abcd...            conteúdo dos arquivos, pelo SHA-256
+    miniaturas/abcd..._256.jpg    miniaturas geradas sob demanda
+    anexos.db                     índice processo -> arquivos
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+
+import pandas as pd
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from metrics import timed
+
+# --- 1. CONFIGURAÇÃO ---
+# Os arquivos são lidos e gravados em blocos: um envio grande nunca é copiado inteiro para a memória
+CHUNK_SIZE = 1024 * 1024
+# Lado maior das miniaturas, em pixels
+THUMBNAIL_SIZE = 256
+ATTACHMENT_COLUMNS = ["ID", "sha256", "nome", "tipo", "tamanho", "autor", "data_hora"]
+
+
+def is_image(mime):
+    return bool(mime) and str(mime).startswith("image/")
+
+
+# --- 2. ARMAZENAMENTO ---
+class AttachmentStore:
+    """Arquivos endereçados pelo conteúdo (SHA-256), com um índice por processo."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS anexos (
+            ID INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            nome TEXT,
+            tipo TEXT,
+            tamanho INTEGER,
+            autor TEXT,
+            data_hora TEXT,
+            PRIMARY KEY (ID, sha256)
+        );
+        CREATE INDEX IF NOT EXISTS idx_anexos_sha ON anexos (sha256);
+    """
+
+    def __init__(self, root):
+        self.root = root
+        for folder in ("objetos", "miniaturas", "tmp"):
+            os.makedirs(os.path.join(root, folder), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "anexos.db"), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+
+    def _object_path(self, sha256):
+        return os.path.join(self.root, "objetos", sha256[:2], sha256)
+
+    def _temp_file(self, suffix=""):
+        # Arquivos temporários ficam no mesmo disco, para que os.replace seja uma renomeação atômica
+        return tempfile.mkstemp(dir=os.path.join(self.root, "tmp"), suffix=suffix)
+
+    @timed("anexos: gravação")
+    def add(self, inspection_id, fileobj, name, mime=None, autor=None):
+        """Grava o conteúdo de 'fileobj' e o associa ao processo; devolve o SHA-256.
+
+        O arquivo é copiado em blocos para um temporário enquanto o hash é calculado;
+        se o conteúdo já estiver guardado, o temporário é descartado.
+        """
+        if hasattr(fileobj, "seek"):
+            fileobj.seek(0)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = self._temp_file()
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            path = self._object_path(sha256)
+            if os.path.exists(path):
+                os.remove(tmp)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        with self._lock, self._conn:
+            # O mesmo arquivo anexado duas vezes ao mesmo processo é registrado uma vez
+            self._conn.execute(
+                f"INSERT OR IGNORE INTO anexos ({', '.join(ATTACHMENT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (int(inspection_id), sha256, name, mime, size, autor, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+        return sha256
+
+    @timed("anexos: lista do processo")
+    def list(self, inspection_id):
+        """Anexos do processo, do mais recente ao mais antigo (só os dados do índice, sem ler os arquivos)."""
+        with self._lock:
+            return pd.read_sql_query(
+                f"SELECT {', '.join(ATTACHMENT_COLUMNS)} FROM anexos WHERE ID = ? ORDER BY data_hora DESC, rowid DESC",
+                self._conn, params=(int(inspection_id),)
+            )
+
+    def move(self, hashes, old_id, new_id):
+        """Passa os anexos indicados para outro número de processo (registro gravado com outro ID)."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE OR IGNORE anexos SET ID = ? WHERE ID = ? AND sha256 = ?",
+                [(int(new_id), int(old_id), sha256) for sha256 in hashes]
+            )
+
+    def open(self, sha256):
+        """Abre o arquivo para leitura (em blocos, pelo chamador)."""
+        return open(self._object_path(sha256), "rb")
+
+    def read(self, sha256):
+        with self.open(sha256) as f:
+            return f.read()
+
+    @timed("anexos: miniatura")
+    def thumbnail(self, sha256, size=THUMBNAIL_SIZE):
+        """Caminho da miniatura JPEG do arquivo, gerada na primeira vez; None se não for uma imagem."""
+        path = os.path.join(self.root, "miniaturas", f"{sha256}_{size}.jpg")
+        if os.path.exists(path):
+            return path
+        fd, tmp = self._temp_file(suffix=".jpg")
+        os.close(fd)
+        try:
+            with Image.open(self._object_path(sha256)) as image:
+                # Em JPEG, o draft decodifica a foto já reduzida, sem carregar a resolução original
+                image.draft("RGB", (size, size))
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((size, size))
+                image.convert("RGB").save(tmp, "JPEG", quality=80)
+        except (UnidentifiedImageError, OSError):
+            os.remove(tmp)
+            return None
+        os.replace(tmp, path)
+        return path
@@ -0,0 +1,20 @@
+"""Usuários e autenticação do app.
+
+Módulo leve de propósito: a tela de login (app.py) o importa sem carregar pandas,
+o backend de armazenamento ou as bibliotecas do Google.
+"""
+
+# --- 1. CONFIGURAÇÃO DE USUÁRIOS (Inalterada) ---
+USERS = {
+    "joao.insp": ("insp123", "inspetor"),
+    "maria.coord": ("coord456", "coordenador"),
+    "chefe.geren": ("geren789", "gerencia")
+}
+
+
+# --- 2. FUNÇÕES DE AUTENTICAÇÃO ---
+def authenticate(username, password):
+    """Verifica credenciais e retorna o perfil."""
+    if username in USERS and USERS[username][0] == password:
+        return True, USERS[username][1]
+    return False, None
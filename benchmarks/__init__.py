@@ -0,0 +1 @@
+"""Benchmarks do Diário de Campo com dados sintéticos e uma Planilha Google falsa (python -m benchmarks)."""
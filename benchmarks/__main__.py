@@ -0,0 +1,98 @@
+"""Executa os cenários de benchmark com dados sintéticos e uma Planilha Google falsa.
+
+Uso (na raiz do projeto):
+    python -m benchmarks --sizes 1000 10000 100000 1000000
+    python -m benchmarks --sizes 10000 --only prazo --json resultados.json
+    python -m benchmarks --sizes 10000 --only arquivo --latencia 150
+    python -m benchmarks.startup            # tempo de inicialização do app
+
+Para cada cenário e tamanho, informa o tempo (mediana de --repeat execuções), o pico de
+memória alocada durante a operação e as chamadas/bytes que chegariam à API do Google.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from streamlit.logger import set_log_level
+
+
+def _measure(setup, data, repeat):
+    times = []
+    for _ in range(repeat):
+        client, operation = setup(data)
+        if client is not None:
+            client.stats.reset()
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+
+    # Memória e tráfego em uma execução à parte: tracemalloc e a contagem de bytes distorcem o tempo
+    client, operation = setup(data)
+    if client is not None:
+        client.stats.count_bytes = True
+        client.stats.reset()
+    tracemalloc.start()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'seconds': statistics.median(times),
+        'peak_bytes': peak,
+        'api': client.stats.snapshot() if client is not None else None,
+    }
+
+
+def _format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def _format_row(result):
+    api = result['api']
+    calls = "-" if api is None else str(api['calls'])
+    traffic = "-" if api is None else f"{_format_bytes(api['bytes_sent'])} / {_format_bytes(api['bytes_received'])}"
+    return f"{result['scenario']:<45} {result['rows']:>9} {result['seconds'] * 1000:>11.1f} {_format_bytes(result['peak_bytes']):>10} {calls:>7}  {traffic}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="quantidades de inspeções geradas")
+    parser.add_argument("--repeat", type=int, default=3, help="execuções cronometradas por cenário")
+    parser.add_argument("--seed", type=int, default=0, help="semente dos dados sintéticos")
+    parser.add_argument("--only", help="executa apenas os cenários cujo nome contém este texto")
+    parser.add_argument("--json", help="grava os resultados neste arquivo JSON")
+    parser.add_argument("--latencia", type=float, default=0, help="tempo de resposta simulado de cada requisição à API, em ms")
+    args = parser.parse_args(argv)
+
+    from benchmarks.scenarios import SCENARIOS, Dataset
+    # Fora do 'streamlit run' os caches do Streamlit avisam a cada uso que não há sessão ativa
+    set_log_level("error")
+
+    results = []
+    print(f"{'cenário':<45} {'linhas':>9} {'tempo (ms)':>11} {'memória':>10} {'chamadas':>7}  enviado / recebido")
+    for n in args.sizes:
+        data = Dataset(n, seed=args.seed, latency=args.latencia / 1000)
+        for name, setup, max_rows in SCENARIOS:
+            if args.only and args.only.lower() not in name.lower():
+                continue
+            if max_rows is not None and n > max_rows:
+                print(f"{name:<45} {n:>9}   (ignorado: limite de {max_rows} linhas)")
+                continue
+            result = {'scenario': name, 'rows': n, **_measure(setup, data, args.repeat)}
+            results.append(result)
+            print(_format_row(result), flush=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
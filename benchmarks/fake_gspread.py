@@ -0,0 +1,257 @@
+"""Cliente gspread falso, em memória, para medir o app sem acessar a API do Google.
+
+Implementa apenas as chamadas usadas pelo SheetsStore e pelo gspread_dataframe e conta,
+para cada uma, o número de requisições e o volume (aproximado) de bytes trafegados.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol, extract_id_from_url, rowcol_to_a1
+
+from metrics import count_api_call
+
+FAKE_URL = "https://docs.google.com/spreadsheets/d/benchmark-fake-sheet/edit"
+
+
+def _payload_size(value):
+    """Tamanho aproximado do corpo JSON de uma requisição ou resposta."""
+    return len(json.dumps(value, default=str, ensure_ascii=False).encode("utf-8"))
+
+
+def _user_entered(value):
+    """Converte o texto digitado como o Sheets faria com USER_ENTERED (números viram números)."""
+    if isinstance(value, str) and value.strip():
+        for cast in (int, float):
+            try:
+                return cast(value)
+            except ValueError:
+                pass
+    return value
+
+
+class ApiStats:
+    """Contadores de requisições e bytes, por método da API."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Serializar o corpo custa tempo: as medições de tempo desligam a contagem de bytes
+        self.count_bytes = True
+        # Tempo de resposta simulado de cada requisição, em segundos (0 = instantâneo)
+        self.latency = 0.0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = Counter()
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def record(self, method, sent=None, received=None):
+        # Também entra na contagem de chamadas da página de Latência, como as requisições reais
+        count_api_call()
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[method] += 1
+            if not self.count_bytes:
+                return
+            self.bytes_sent += _payload_size(sent) if sent is not None else 0
+            self.bytes_received += _payload_size(received) if received is not None else 0
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'calls': sum(self.calls.values()),
+                'by_method': dict(self.calls),
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+            }
+
+
+class FakeWorksheet:
+    """Aba em memória: uma lista de linhas, com os valores como o Sheets os devolveria sem formatação."""
+
+    def __init__(self, spreadsheet, title, values, sheet_id=0):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.values = [list(row) for row in values]
+        self.row_count = max(len(self.values), 1000)
+        self.col_count = max((len(row) for row in self.values), default=26)
+
+    @property
+    def stats(self):
+        return self.spreadsheet.client.stats
+
+    def _touch(self):
+        self.spreadsheet.client.touch()
+
+    def _grid(self, range_name):
+        if range_name is None:
+            return 0, len(self.values), 0, self.col_count
+        grid = a1_range_to_grid_range(range_name)
+        return (grid.get('startRowIndex', 0), grid.get('endRowIndex', len(self.values)),
+                grid.get('startColumnIndex', 0), grid.get('endColumnIndex', self.col_count))
+
+    def _render(self, rows, value_render_option):
+        if value_render_option == 'UNFORMATTED_VALUE':
+            return rows
+        return [["" if value is None else str(value) for value in row] for row in rows]
+
+    def _read(self, range_name, value_render_option):
+        start_row, end_row, start_col, end_col = self._grid(range_name)
+        rows = [row[start_col:end_col] for row in self.values[start_row:end_row]]
+        # A API omite células vazias no fim das linhas e linhas vazias no fim do intervalo
+        rows = [row[:max((i + 1 for i, v in enumerate(row) if v not in ("", None)), default=0)] for row in rows]
+        while rows and not rows[-1]:
+            rows.pop()
+        return [list(row) for row in self._render(rows, value_render_option)]
+
+    def get_values(self, range_name=None, value_render_option=None, date_time_render_option=None, **kwargs):
+        rows = self._read(range_name, value_render_option)
+        self.stats.record('values.get', received={'values': rows})
+        return rows
+
+    get = get_values
+
+    def batch_get(self, ranges, value_render_option=None, date_time_render_option=None, **kwargs):
+        # Uma única requisição para todos os intervalos
+        result = [self._read(range_name, value_render_option) for range_name in ranges]
+        self.stats.record('values.batchGet', received={'valueRanges': result})
+        return result
+
+    def col_values(self, col, value_render_option='FORMATTED_VALUE'):
+        values = [row[col - 1] if len(row) >= col else "" for row in self.values]
+        while values and values[-1] in ("", None):
+            values.pop()
+        values = self._render([values], value_render_option)[0]
+        self.stats.record('values.get', received={'values': [values]})
+        return values
+
+    def find(self, query, in_column=None, **kwargs):
+        # O gspread lê a aba inteira e procura localmente
+        self.stats.record('values.get', received={'values': self.values})
+        for row_index, row in enumerate(self.values, start=1):
+            for col_index, value in enumerate(row, start=1):
+                if in_column is not None and col_index != in_column:
+                    continue
+                if str(value) == str(query):
+                    return type('Cell', (), {'row': row_index, 'col': col_index, 'value': value})()
+        return None
+
+    def _write(self, row, col, value):
+        while len(self.values) < row:
+            self.values.append([])
+        line = self.values[row - 1]
+        line.extend([""] * (col - len(line)))
+        line[col - 1] = value
+        # Como no Sheets, gravar além da última coluna amplia a grade
+        self.col_count = max(self.col_count, col)
+
+    def append_rows(self, values, value_input_option='RAW', table_range=None, **kwargs):
+        # A tabela termina na última linha com algum valor
+        last = len(self.values)
+        while last and not any(v not in ("", None) for v in self.values[last - 1]):
+            last -= 1
+        del self.values[last:]
+        first_row = last + 1
+        for row in values:
+            self.values.append([_user_entered(v) if value_input_option == 'USER_ENTERED' else v for v in row])
+        self.row_count = max(self.row_count, len(self.values))
+        self.col_count = max(self.col_count, max(len(row) for row in values))
+        self._touch()
+        updated_range = f"{self.title}!{rowcol_to_a1(first_row, 1)}:{rowcol_to_a1(len(self.values), max(len(r) for r in values))}"
+        response = {'updates': {'updatedRange': updated_range, 'updatedRows': len(values)}}
+        self.stats.record('values.append', sent={'values': values}, received=response)
+        return response
+
+    def batch_update(self, data, value_input_option='RAW', **kwargs):
+        for item in data:
+            row, col = a1_to_rowcol(item['range'].split(':')[0])
+            for r, line in enumerate(item['values']):
+                for c, value in enumerate(line):
+                    self._write(row + r, col + c, _user_entered(value) if value_input_option == 'USER_ENTERED' else value)
+        self._touch()
+        response = {'totalUpdatedCells': sum(len(line) for item in data for line in item['values'])}
+        self.stats.record('values.batchUpdate', sent={'data': data}, received=response)
+        return response
+
+    def update_cells(self, cells, value_input_option='RAW'):
+        for cell in cells:
+            value = cell.value
+            self._write(cell.row, cell.col, _user_entered(value) if value_input_option == 'USER_ENTERED' else value)
+        self._touch()
+        self.stats.record('values.update', sent={'values': [cell.value for cell in cells]})
+
+    def resize(self, rows=None, cols=None):
+        if rows is not None:
+            self.row_count = rows
+            del self.values[rows:]
+        if cols is not None:
+            self.col_count = cols
+            self.values = [row[:cols] for row in self.values]
+        self._touch()
+        self.stats.record('batchUpdate', sent={'rows': rows, 'cols': cols})
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, spreadsheet_id, worksheets):
+        self.client = client
+        self.id = spreadsheet_id
+        self._worksheets = {title: FakeWorksheet(self, title, values, n) for n, (title, values) in enumerate(worksheets.items())}
+
+    def worksheets(self):
+        self.client.stats.record('spreadsheets.get', received={'sheets': list(self._worksheets)})
+        return list(self._worksheets.values())
+
+    def batch_update(self, body):
+        # Apenas a remoção de linhas (deleteDimension), usada pelo arquivamento
+        by_id = {worksheet.id: worksheet for worksheet in self._worksheets.values()}
+        for request in body['requests']:
+            grid = request['deleteDimension']['range']
+            del by_id[grid['sheetId']].values[grid['startIndex']:grid['endIndex']]
+        self.client.touch()
+        self.client.stats.record('batchUpdate', sent=body)
+        return {'replies': [{} for _ in body['requests']]}
+
+    def worksheet(self, title):
+        # Como no gspread, localizar a aba consulta os metadados da planilha
+        self.client.stats.record('spreadsheets.get', received={'sheets': list(self._worksheets)})
+        if title not in self._worksheets:
+            raise WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def add_worksheet(self, title, rows=1000, cols=26, **kwargs):
+        self._worksheets[title] = FakeWorksheet(self, title, [], len(self._worksheets))
+        self.client.touch()
+        self.client.stats.record('batchUpdate', sent={'title': title})
+        return self._worksheets[title]
+
+
+class FakeClient:
+    """Substituto do gspread.Client com uma única planilha em memória."""
+
+    def __init__(self, worksheets, url=FAKE_URL):
+        self.url = url
+        self.stats = ApiStats()
+        self._revision = 0
+        self.spreadsheet = FakeSpreadsheet(self, extract_id_from_url(url), worksheets)
+        self.touch()
+
+    def touch(self):
+        """Registra uma modificação, como o 'modifiedTime' do Drive."""
+        self._revision += 1
+        self.modified_time = f"{datetime.now(timezone.utc).isoformat()}#{self._revision}"
+
+    def open_by_url(self, url):
+        self.stats.record('spreadsheets.get', received={'id': self.spreadsheet.id})
+        return self.spreadsheet
+
+    def get_file_drive_metadata(self, file_id):
+        metadata = {'id': file_id, 'modifiedTime': self.modified_time}
+        self.stats.record('drive.files.get', received=metadata)
+        return metadata
@@ -0,0 +1,300 @@
+"""Cenários medidos: leitura, gravação, prazos e indicadores sobre a Planilha falsa.
+
+Cada cenário prepara o estado fora da medição e devolve a operação a ser cronometrada.
+"""
+import tempfile
+
+import pandas as pd
+
+import utils
+from shared_cache import SharedFrameCache
+from storage import SheetsStore
+from benchmarks.fake_gspread import FAKE_URL, FakeClient
+from benchmarks.synthetic import as_sheet_values, generate_inspections, new_record
+
+
+class Dataset:
+    """Inspeções sintéticas de um tamanho, geradas uma vez e reaproveitadas pelos cenários."""
+
+    def __init__(self, n, seed=0, latency=0.0):
+        self.n = n
+        self.latency = latency
+        self.df = generate_inspections(n, seed=seed)
+        self.values = as_sheet_values(self.df)
+        self._typed = None
+
+    @property
+    def typed(self):
+        if self._typed is None:
+            self._typed = utils._to_typed_frame(self.df)
+        return self._typed
+
+    def install(self, archive_years=()):
+        """Cria uma Planilha falsa com os dados e a conecta ao app; devolve o cliente falso.
+
+        Cada ano de 'archive_years' ganha uma aba de arquivo com uma cópia das linhas.
+        """
+        tabs = {'Sheet1': self.values}
+        tabs.update({f"{SheetsStore.ARCHIVE_PREFIX}{year}": self.values for year in archive_years})
+        client = FakeClient(tabs)
+        # A contagem de bytes é ligada apenas na execução que mede o tráfego
+        client.stats.count_bytes = False
+        client.stats.latency = self.latency
+        utils.set_store(SheetsStore(lambda: client, FAKE_URL))
+        return client
+
+
+def _expire_check():
+    """Faz a próxima leitura consultar o sinal de versão, como após SYNC_CHECK_INTERVAL."""
+    utils._get_data_cache().checked_at = float('-inf')
+
+
+# --- Leitura ---
+def initialize_cold(data):
+    client = data.install()
+    return client, utils.initialize_data
+
+def initialize_warm(data):
+    client = data.install()
+    utils.initialize_data()
+
+    def run():
+        _expire_check()
+        return utils.initialize_data()
+    return client, run
+
+def initialize_cold_shared(data):
+    client = data.install()
+    store = utils.get_store()
+    # Outra réplica já leu esta versão e a gravou no cache compartilhado
+    shared = SharedFrameCache(tempfile.mkdtemp(prefix="cache_compartilhado_"), "benchmark")
+    version = store.version()
+    shared.save(version, utils._to_typed_frame(store.load()), store.load_state())
+    client.stats.reset()
+
+    def run():
+        df, state = shared.load(version)
+        store.restore_load_state(df, state)
+        return df
+    return client, run
+
+def load_appended_by_other_replica(data):
+    client = data.install()
+    utils.initialize_data()
+    # Outra réplica acrescenta uma inspeção diretamente na Planilha
+    record = new_record(data.n + 1)
+    client.spreadsheet.worksheet('Sheet1').append_rows(as_sheet_values(pd.DataFrame([record]))[1:], value_input_option='USER_ENTERED')
+    client.stats.reset()
+
+    def run():
+        _expire_check()
+        return utils.load_data()
+    return client, run
+
+
+def inspector_rows_mask(data):
+    client = data.install()
+    utils.initialize_data()
+
+    def run():
+        # Filtro feito pelas páginas antes da consulta por inspetor
+        df = utils.load_data()
+        return df[df['inspetor_id'] == "inspetor01"].copy()
+    return client, run
+
+def inspector_rows_indexed(data):
+    client = data.install()
+    utils.load_data(inspetor_id="inspetor01")
+    return client, lambda: utils.load_data(inspetor_id="inspetor01")
+
+
+def _archive_tabs(data):
+    years = list(range(2019, 2024))
+    client = data.install(archive_years=years)
+    utils.initialize_data()
+    utils._load_archive_year.clear()
+    return client, years
+
+def archive_years_serial(data):
+    client, years = _archive_tabs(data)
+    return client, lambda: [utils._load_archive_year(year) for year in years]
+
+def archive_years_parallel(data):
+    client, years = _archive_tabs(data)
+    return client, lambda: utils.load_archive(years)
+
+
+# --- Gravação ---
+def save_full(data):
+    client = data.install()
+    df = utils.initialize_data()
+    return client, lambda: utils.save_data(df)
+
+def append_one(data):
+    client = data.install()
+    utils.initialize_data()
+    return client, lambda: utils.append_inspection(new_record(data.n + 1))
+
+def update_one(data):
+    client = data.install()
+    utils.initialize_data()
+    target = data.n // 2
+    return client, lambda: utils.update_inspection(target, {'status': "Concluído", 'comentarios': "Processo finalizado."})
+
+
+# --- Prazos ---
+def deadlines_row_by_row(data):
+    df = data.typed
+    return None, lambda: df.apply(utils.get_deadline_status, axis=1)
+
+def deadlines_vectorized(data):
+    df = data.typed
+    return None, lambda: utils.classify_deadlines(df)
+
+def deadline_alerts_by_color(data):
+    client = data.install()
+    utils.initialize_data()
+
+    def run():
+        # Contagem feita pelas páginas antes do índice de prazos
+        df = utils.load_data()
+        df = df.join(utils.classify_deadlines(df))
+        pendente = df[df['status'] == 'Em Andamento']
+        return len(pendente), (pendente['cor'] == 'red').sum(), (pendente['cor'] == 'orange').sum()
+    return client, run
+
+def deadline_alerts_indexed(data):
+    client = data.install()
+    utils.deadline_counts()
+    return client, utils.deadline_counts
+
+
+# --- Estabelecimentos ---
+def _busiest_cnpj(data):
+    return data.df['cnpj'].value_counts().index[0]
+
+def establishment_scan(data):
+    client = data.install()
+    utils.initialize_data()
+    cnpj = utils.normalize_cnpj(_busiest_cnpj(data))
+
+    def run():
+        # Busca feita percorrendo a tabela, como antes do índice
+        df = utils.load_data()
+        return df[df['cnpj'].map(utils.normalize_cnpj) == cnpj]
+    return client, run
+
+def establishment_indexed(data):
+    client = data.install()
+    cnpj = _busiest_cnpj(data)
+    utils.establishment_history(cnpj)
+    return client, lambda: utils.establishment_history(cnpj)
+
+
+# --- Busca nos textos ---
+# Sem o acento de "câmara": a busca ignora acentos e maiúsculas
+SEARCH_QUERY = "camara fria"
+
+def text_search_scan(data):
+    client = data.install()
+    utils.initialize_data()
+    from search import normalize_text
+
+    def run():
+        # Busca percorrendo os textos a cada consulta
+        df = utils.load_data()
+        texts = (df['obs_inspetor'].fillna("") + " " + df['comentarios'].fillna("")).map(normalize_text)
+        found = pd.Series(True, index=df.index)
+        for term in SEARCH_QUERY.split():
+            found &= texts.str.contains(term, regex=False)
+        return df[found].head(utils.SEARCH_PAGE_SIZE)
+    return client, run
+
+def text_search_index_build(data):
+    client = data.install()
+    utils.initialize_data()
+
+    def run():
+        utils.get_search_index().clear()
+        utils._get_data_cache().search_pending = None
+        return utils._sync_search_index()
+    return client, run
+
+def text_search_indexed(data):
+    client = data.install()
+    utils.search_texts(SEARCH_QUERY)
+    return client, lambda: utils.search_texts(SEARCH_QUERY)
+
+
+# --- Indicadores ---
+def indicators_groupby(data):
+    df = data.typed
+
+    def run():
+        # Cálculo feito a cada visita pela página de indicadores original
+        df.groupby(['risco', 'status'], observed=True).size()
+        prod = df.groupby('inspetor_id', observed=True).size().reset_index(name='Total de Inspeções')
+        done = df[df['status'] == 'Concluído'].groupby('inspetor_id', observed=True).size().reset_index(name='Concluídas')
+        return pd.merge(prod, done, on='inspetor_id', how='left').fillna(0)
+    return None, run
+
+def indicators_summary_build(data):
+    df = data.typed
+    return None, lambda: utils._IndicatorSummary.from_frame(df)
+
+def indicators_summary_cached(data):
+    client = data.install()
+    utils.initialize_data()
+    return client, utils.get_indicator_summary
+
+
+# --- Séries temporais ---
+def _last_year(data):
+    end = pd.Timestamp.today().normalize()
+    return (end - pd.DateOffset(years=1)).date(), end.date()
+
+def time_series_adhoc(data):
+    df = data.typed
+    start, end = _last_year(data)
+
+    def run():
+        # Séries calculadas do zero a cada execução, só para o período pedido
+        part = df[(df['data_inspecao'] >= pd.Timestamp(start)) | (df['data_conclusao'] >= pd.Timestamp(start))]
+        return utils._build_time_series(part)
+    return None, run
+
+def time_series_cached(data):
+    client = data.install()
+    start, end = _last_year(data)
+    utils.get_time_series("M", "risco", start, end)
+    return client, lambda: utils.get_time_series("W", "inspetor_id", start, end)
+
+
+# (nome, função de preparo, número máximo de linhas; None = sem limite)
+SCENARIOS = [
+    ("initialize_data (leitura a frio)", initialize_cold, None),
+    ("leitura a frio (cache compartilhado, Arrow)", initialize_cold_shared, None),
+    ("initialize_data (cache, versão inalterada)", initialize_warm, None),
+    ("load_data (1 linha nova de outra réplica)", load_appended_by_other_replica, None),
+    ("registros de um inspetor (máscara)", inspector_rows_mask, None),
+    ("load_data(inspetor_id=...) (índice)", inspector_rows_indexed, None),
+    ("arquivo de 5 anos (uma aba após a outra)", archive_years_serial, 100_000),
+    ("arquivo de 5 anos (load_archive, em paralelo)", archive_years_parallel, 100_000),
+    ("save_data (regravação completa)", save_full, None),
+    ("append_inspection (1 registro)", append_one, None),
+    ("update_inspection (1 registro)", update_one, None),
+    ("get_deadline_status (linha a linha)", deadlines_row_by_row, 10_000),
+    ("classify_deadlines (vetorizado)", deadlines_vectorized, None),
+    ("alertas de prazo (classificação por cor)", deadline_alerts_by_color, None),
+    ("deadline_counts (índice de prazos)", deadline_alerts_indexed, None),
+    ("histórico do estabelecimento (varredura)", establishment_scan, 100_000),
+    ("histórico do estabelecimento (índice por CNPJ)", establishment_indexed, None),
+    ("busca nos textos (varredura)", text_search_scan, 100_000),
+    ("busca nos textos (construção do índice)", text_search_index_build, 100_000),
+    ("busca nos textos (índice FTS5, 1ª página)", text_search_indexed, None),
+    ("séries temporais (cálculo a cada execução)", time_series_adhoc, None),
+    ("séries temporais (cache, recorte do período)", time_series_cached, None),
+    ("indicadores via groupby (página original)", indicators_groupby, None),
+    ("resumo de indicadores (construção)", indicators_summary_build, None),
+    ("get_indicator_summary (em cache)", indicators_summary_cached, None),
+]
@@ -0,0 +1,72 @@
+"""Relatório do tempo de inicialização do app, medido em processos Python novos.
+
+Uso (na raiz do projeto):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 5 --linhas 100000
+
+Cada etapa roda em um processo à parte (sem módulos já carregados), depois do import
+do Streamlit, que o servidor já fez ao iniciar. O tempo informado é a mediana de
+--repeat execuções.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# (etapa, preparo fora da medição, código medido)
+STEPS = [
+    ("tela de login (auth, startup)", "", "import auth, startup"),
+    ("módulos de dados (import utils)", "", "import utils"),
+    ("cliente da Planilha (gspread)", "import utils", "import gspread, gspread_dataframe"),
+    ("gráficos (plotly.express)", "import utils", "import plotly.express"),
+    ("anexos (Pillow)", "import utils", "import attachments"),
+    ("primeira leitura (initialize_data)",
+     "import utils\n"
+     "from benchmarks.scenarios import Dataset\n"
+     "Dataset({linhas}).install()",
+     "utils.initialize_data()"),
+]
+
+_TEMPLATE = """
+import time
+import streamlit
+from streamlit.logger import set_log_level
+set_log_level("error")
+{setup}
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+
+def _run(setup, code):
+    output = subprocess.run(
+        [sys.executable, "-c", _TEMPLATE.format(setup=setup, code=code)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="processos medidos por etapa")
+    parser.add_argument("--linhas", type=int, default=10_000, help="inspeções na Planilha falsa da primeira leitura")
+    parser.add_argument("--json", help="grava os resultados neste arquivo JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'etapa':<40} {'tempo (ms)':>11}")
+    for name, setup, code in STEPS:
+        seconds = statistics.median(_run(setup.format(linhas=args.linhas), code) for _ in range(args.repeat))
+        results.append({'step': name, 'seconds': seconds})
+        print(f"{name:<40} {seconds * 1000:>11.1f}", flush=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Gerador determinístico de inspeções sintéticas, com distribuições próximas às do uso real."""
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from storage import COLUMNS, DATE_COLUMNS
+
+INSPETORES = [f"inspetor{n:02d}" for n in range(1, 31)]
+ATIVIDADES = (["Alimentos", "Saúde", "Saneantes", "Cosméticos", "Outro"], [0.5, 0.2, 0.1, 0.1, 0.1])
+RISCOS = (["Alto", "Médio", "Baixo"], [0.25, 0.45, 0.3])
+TIPOS = ["Restaurante", "Padaria", "Mercado", "Farmácia", "Clínica", "Lanchonete", "Distribuidora", "Salão"]
+NOMES = ["Boa Vista", "São José", "Porto", "Ipojuca", "Maracaípe", "Nossa Senhora", "Central", "Litoral",
+         "Esperança", "Dois Irmãos", "Pontal", "Serrambi"]
+ACHADOS = [
+    "Ausência de alvará sanitário.",
+    "Manipuladores sem touca e avental.",
+    "Produtos vencidos na área de venda.",
+    "Temperatura da câmara fria acima do permitido.",
+    "Ralos sem proteção.",
+    "Documentação de controle de pragas desatualizada.",
+    "Sem irregularidades aparentes.",
+]
+
+
+def _cnpj_digits(base):
+    """Acrescenta os dois dígitos verificadores a uma base de 12 dígitos."""
+    digits = list(base)
+    for weights in ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]):
+        rest = sum(d * w for d, w in zip(digits, weights)) % 11
+        digits.append(0 if rest < 2 else 11 - rest)
+    d = "".join(map(str, digits))
+    return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
+
+
+def _establishments(rng, count):
+    """Estabelecimentos (nome, CNPJ válido) reaproveitados por várias inspeções."""
+    bases = rng.integers(0, 10, size=(count, 8))
+    names = [f"{TIPOS[t]} {NOMES[n]} {i + 1}" for i, (t, n) in
+             enumerate(zip(rng.integers(0, len(TIPOS), count), rng.integers(0, len(NOMES), count)))]
+    cnpjs = [_cnpj_digits(list(base) + [0, 0, 0, 1]) for base in bases]
+    return names, cnpjs
+
+
+def generate_inspections(n, seed=0, years=5, today=None):
+    """Gera 'n' inspeções no formato gravado pelo app (datas 'YYYY-MM-DD', vazios como None).
+
+    A mesma semente produz sempre os mesmos dados, para comparar execuções.
+    """
+    rng = np.random.default_rng(seed)
+    today = today or date.today()
+
+    names, cnpjs = _establishments(rng, max(1, n // 3))
+    establishment = rng.integers(0, len(names), n)
+
+    # Inspeções espalhadas pelos últimos 'years' anos, mais recentes primeiro no ID
+    age = np.sort(rng.integers(0, 365 * years, n))[::-1]
+    inspected = np.datetime64(today) - age.astype("timedelta64[D]")
+    prazo_inspetor = inspected + rng.choice([10, 15, 30], n, p=[0.3, 0.5, 0.2]).astype("timedelta64[D]")
+    has_coord = rng.random(n) < 0.2
+    prazo_coord = prazo_inspetor + rng.integers(-5, 20, n).astype("timedelta64[D]")
+
+    # Processos antigos estão quase todos concluídos; os recentes, em sua maioria, em andamento
+    done_probability = np.where(age > 60, 0.95, 0.4)
+    draw = rng.random(n)
+    status = np.where(draw < done_probability, "Concluído", "Em Andamento")
+    status = np.where(rng.random(n) < 0.02, "Indeferido", status)
+    concluded = inspected + rng.integers(1, 60, n).astype("timedelta64[D]")
+    concluded = np.minimum(concluded, np.datetime64(today))
+
+    achados = rng.integers(0, len(ACHADOS), (n, 2))
+    df = pd.DataFrame({
+        'ID': np.arange(1, n + 1),
+        'inspetor_id': np.array(INSPETORES)[rng.integers(0, len(INSPETORES), n)],
+        'estabelecimento': np.array(names, dtype=object)[establishment],
+        'cnpj': np.array(cnpjs, dtype=object)[establishment],
+        'atividade': rng.choice(ATIVIDADES[0], n, p=ATIVIDADES[1]),
+        'risco': rng.choice(RISCOS[0], n, p=RISCOS[1]),
+        'data_inspecao': inspected,
+        'prazo_retorno_inspetor': prazo_inspetor,
+        'prazo_retorno_coord': np.where(has_coord, prazo_coord, np.datetime64("NaT")),
+        'status': status,
+        'data_conclusao': np.where(status == "Concluído", concluded, np.datetime64("NaT")),
+        'obs_inspetor': [f"{ACHADOS[a]} {ACHADOS[b]}" if a != b else ACHADOS[a] for a, b in achados],
+        'comentarios': "Processo iniciado pelo inspetor.",
+    })
+    for col in DATE_COLUMNS:
+        df[col] = pd.to_datetime(df[col]).dt.strftime("%Y-%m-%d").astype(object).where(df[col].notna(), None)
+    return df[COLUMNS]
+
+
+def new_record(inspection_id, seed=0):
+    """Um registro novo, como o enviado pelo formulário de Nova Inspeção."""
+    record = generate_inspections(1, seed=seed).iloc[0].to_dict()
+    record.update({'ID': inspection_id, 'status': "Em Andamento", 'data_conclusao': None,
+                   'data_inspecao': date.today().strftime("%Y-%m-%d"),
+                   'prazo_retorno_inspetor': (date.today() + timedelta(days=15)).strftime("%Y-%m-%d")})
+    return record
+
+
+def as_sheet_values(df):
+    """Cabeçalho e linhas como a API do Sheets devolve sem formatação (vazios como '')."""
+    values = df.astype(object).where(df.notna(), "").to_numpy().tolist()
+    return [list(df.columns)] + values
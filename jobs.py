@@ -0,0 +1,75 @@
+"""Tarefas de manutenção executadas fora do app (ex.: agendadas no cron), na raiz do projeto.
+
+Uso:
+    python jobs.py arquivar                # concluídos há mais de 'archive_after_days' dias (padrão 365)
+    python jobs.py arquivar --dias 180 --simular
+    python jobs.py resumo                  # prazos vencidos e vencendo, por inspetor (resumo diário)
+    python jobs.py resumo --dias 7
+
+As credenciais e o backend são lidos do mesmo .streamlit/secrets.toml usado pelo app.
+"""
+import argparse
+import sys
+from datetime import date
+
+from streamlit.logger import set_log_level
+
+
+def arquivar(args):
+    import utils
+    counts = utils.archive_concluded(max_age_days=args.dias, dry_run=args.simular)
+    if not counts:
+        print("Nenhum processo a arquivar.")
+        return 0
+    acao = "Seriam arquivados" if args.simular else "Arquivados"
+    for ano, n in sorted(counts.items()):
+        print(f"{acao} {n} processo(s) concluído(s) em {ano}.")
+    return 0
+
+
+def resumo(args):
+    import utils
+    por_inspetor = utils.deadline_counts_by_inspector(warning_days=args.dias)
+    if not por_inspetor:
+        print("Nenhum processo em andamento.")
+        return 0
+    print(f"Prazos em {date.today():%d/%m/%Y} (vencendo = próximos {args.dias} dias)")
+    print(f"{'inspetor':<20} {'em andamento':>12} {'vencidos':>9} {'vencendo':>9}")
+    for inspetor, n in sorted(por_inspetor.items(), key=lambda item: str(item[0])):
+        print(f"{str(inspetor or '(sem inspetor)'):<20} {n['em_andamento']:>12} {n['vencidos']:>9} {n['vencendo']:>9}")
+
+    vencidos = utils.due_processes(last_day=-1)
+    vencendo = utils.due_processes(0, args.dias)
+    print()
+    print(f"Vencidos ({len(vencidos)}): {', '.join(map(str, vencidos)) or '-'}")
+    print(f"Vencendo ({len(vencendo)}): {', '.join(map(str, vencendo)) or '-'}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python jobs.py", description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="tarefa", required=True)
+
+    p_arquivar = subparsers.add_parser("arquivar", help="move processos concluídos antigos para o arquivo por ano")
+    p_arquivar.add_argument("--dias", type=int, default=None, help="idade mínima da conclusão, em dias")
+    p_arquivar.add_argument("--simular", action="store_true", help="apenas informa o que seria arquivado")
+    p_arquivar.set_defaults(func=arquivar)
+
+    p_resumo = subparsers.add_parser("resumo", help="resumo diário dos prazos vencidos e vencendo, por inspetor")
+    p_resumo.add_argument("--dias", type=int, default=None, help="janela de 'vencendo', em dias (padrão 3)")
+    p_resumo.set_defaults(func=resumo)
+
+    args = parser.parse_args(argv)
+    # Fora do 'streamlit run' os caches do Streamlit avisam a cada uso que não há sessão ativa
+    set_log_level("error")
+    if args.func is arquivar and args.dias is None:
+        from utils import ARCHIVE_AFTER_DAYS
+        args.dias = ARCHIVE_AFTER_DAYS
+    elif args.func is resumo and args.dias is None:
+        from utils import DEADLINE_WARNING_DAYS
+        args.dias = DEADLINE_WARNING_DAYS
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Medição leve de latência do app: trechos cronometrados, etapas das páginas e chamadas à API.
+
+As medições ficam em um buffer circular em memória, compartilhado por todas as sessões
+deste processo, e alimentam a página de Latência (restrita à Gerência).
+"""
+import csv
+import functools
+import io
+import json
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# --- 1. ARMAZENAMENTO DAS MEDIÇÕES ---
+# Número máximo de medições guardadas; as mais antigas são descartadas
+BUFFER_SIZE = 5000
+EVENT_FIELDS = ["timestamp", "kind", "name", "seconds", "api_calls"]
+
+_lock = threading.Lock()
+_events = deque(maxlen=BUFFER_SIZE)
+# Total de execuções de cada trecho desde o início do processo (não limitado pelo buffer)
+_counts = Counter()
+# Chamadas à API feitas pela thread atual (cada rerun do Streamlit roda em uma thread)
+_local = threading.local()
+
+
+def _record(kind, name, seconds, api_calls):
+    event = {'timestamp': time.time(), 'kind': kind, 'name': name, 'seconds': seconds, 'api_calls': api_calls}
+    with _lock:
+        _events.append(event)
+        _counts[name] += 1
+
+
+def api_calls():
+    """Requisições à API do Google feitas até agora pela thread atual."""
+    return getattr(_local, 'api_calls', 0)
+
+
+def count_api_call(n=1):
+    """Registra 'n' requisições à API do Google feitas pela thread atual (ou em seu nome)."""
+    _local.api_calls = api_calls() + n
+
+
+def count_requests(client):
+    """Passa a contar todas as requisições HTTP feitas pelo cliente gspread."""
+    http_client = getattr(client, 'http_client', None)
+    if http_client is None or getattr(http_client, '_counted', False):
+        return client
+    request = http_client.request
+
+    @functools.wraps(request)
+    def counted_request(*args, **kwargs):
+        count_api_call()
+        return request(*args, **kwargs)
+
+    http_client.request = counted_request
+    http_client._counted = True
+    return client
+
+
+def clear():
+    """Descarta todas as medições."""
+    with _lock:
+        _events.clear()
+        _counts.clear()
+
+
+# --- 2. PONTOS DE MEDIÇÃO ---
+@contextmanager
+def span(name):
+    """Cronometra o bloco e registra o tempo e as chamadas à API feitas nele."""
+    start, calls = time.perf_counter(), api_calls()
+    try:
+        yield
+    finally:
+        _record('span', name, time.perf_counter() - start, api_calls() - calls)
+
+
+def timed(name):
+    """Decorador: cronometra cada chamada da função como o trecho 'name'."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class PageRun:
+    """Cronômetro de um rerun de página, dividido em etapas sequenciais."""
+
+    def __init__(self, page):
+        self.page = page
+        self.start = time.perf_counter()
+        self.api_start = api_calls()
+        self._stage = None
+
+    def stage(self, name):
+        """Encerra a etapa atual (se houver) e inicia a etapa 'name'."""
+        now = time.perf_counter()
+        if self._stage is not None:
+            stage_name, started, calls = self._stage
+            _record('stage', f"{self.page} › {stage_name}", now - started, api_calls() - calls)
+        self._stage = (name, now, api_calls()) if name is not None else None
+
+    def finish(self):
+        """Encerra a última etapa e registra o tempo total do rerun."""
+        self.stage(None)
+        _record('page', self.page, time.perf_counter() - self.start, api_calls() - self.api_start)
+
+
+def start_page_run(page):
+    """Inicia a medição de um rerun da página; chame finish() ao final do script."""
+    return PageRun(page)
+
+
+# --- 3. CONSULTA E EXPORTAÇÃO ---
+def events():
+    """Cópia das medições guardadas, da mais antiga para a mais recente."""
+    with _lock:
+        return list(_events)
+
+
+def events_frame():
+    df = pd.DataFrame(events(), columns=EVENT_FIELDS)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
+    return df
+
+
+def summary():
+    """Por trecho: execuções, latência p50/p95/p99 (ms) e média de chamadas à API."""
+    df = pd.DataFrame(events(), columns=EVENT_FIELDS)
+    with _lock:
+        counts = dict(_counts)
+    rows = []
+    for (kind, name), group in df.groupby(['kind', 'name'], sort=False):
+        p50, p95, p99 = np.percentile(group['seconds'].to_numpy() * 1000, [50, 95, 99])
+        rows.append({
+            'tipo': kind, 'trecho': name, 'execuções': counts.get(name, len(group)), 'amostras': len(group),
+            'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'api_por_execução': group['api_calls'].mean(),
+        })
+    return pd.DataFrame(rows, columns=['tipo', 'trecho', 'execuções', 'amostras', 'p50_ms', 'p95_ms', 'p99_ms', 'api_por_execução'])
+
+
+def export_json():
+    return json.dumps(events(), ensure_ascii=False)
+
+
+def export_csv():
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EVENT_FIELDS)
+    writer.writeheader()
+    writer.writerows(events())
+    return buffer.getvalue()
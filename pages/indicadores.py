@@ -1,27 +1,48 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-from utils import load_data
 
 # Verifica a permissão de acesso
 if 'logged_in' not in st.session_state or st.session_state['role'] not in ['coordenador', 'gerencia']:
     st.error("Acesso negado. Esta área é restrita a Coordenadores e Gerência.")
     st.stop()
 
+# Os demais módulos só são carregados depois da verificação de acesso
+import pandas as pd
+import plotly.express as px
+from datetime import timedelta
+from utils import load_data, load_archive, get_archive_years, get_indicator_summary, get_time_series, time_series_range, data_version, ARCHIVE_AFTER_DAYS, TIME_SERIES_FREQS, TIME_SERIES_DIMENSIONS, DURATION_LABELS
+from metrics import start_page_run
+
+# Tempo de cada etapa da página (consultado na página de Latência)
+run = start_page_run("Indicadores")
+run.stage("resumo")
+
 st.title("📈 Dashboard e Indicadores de Gestão")
 
-df = load_data()
+# Os processos concluídos há mais tempo ficam no arquivo e só entram nos indicadores se pedidos
+anos_arquivo = get_archive_years()
+anos_selecionados = []
+if anos_arquivo:
+    anos_selecionados = st.multiselect(
+        "Incluir processos arquivados (ano de conclusão)",
+        options=anos_arquivo,
+        help=f"Por padrão, os indicadores consideram os processos em andamento e os concluídos nos últimos {ARCHIVE_AFTER_DAYS} dias."
+    )
 
-if df.empty:
+# Contagens pré-agregadas: o painel não percorre o histórico de inspeções a cada execução
+resumo = get_indicator_summary(archive_years=anos_selecionados)
+
+if resumo['total'] == 0:
     st.warning("Não há dados registrados para gerar indicadores.")
     st.stop()
 
 # --- 1. Indicadores Chave de Desempenho (KPIs) ---
+run.stage("gráficos")
 st.header("Indicadores de Produção")
 
-total_inspecoes = len(df)
-concluidos = len(df[df['status'] == 'Concluído'])
-em_andamento = len(df[df['status'] == 'Em Andamento'])
+por_status = resumo['status'].set_index('status')['Contagem']
+total_inspecoes = resumo['total']
+concluidos = int(por_status.get('Concluído', 0))
+em_andamento = int(por_status.get('Em Andamento', 0))
 perc_concluidos = f"{(concluidos / total_inspecoes * 100):.1f}%" if total_inspecoes > 0 else "0%"
 
 col_kpi = st.columns(3)
@@ -33,7 +54,7 @@ st.markdown("---")
 
 # --- 2. Gráfico de Status por Risco ---
 st.header("Status dos Processos por Classificação de Risco")
-df_risco = df.groupby(['risco', 'status']).size().reset_index(name='Contagem')
+df_risco = resumo['risco_status']
 
 fig_risco = px.bar(
     df_risco, 
@@ -52,8 +73,9 @@ st.markdown("---")
 # --- 3. Produtividade por Inspetor ---
 st.header("Produtividade da Equipe")
 
-df_prod = df.groupby('inspetor_id').size().reset_index(name='Total de Inspeções')
-df_prod_status = df[df['status'] == 'Concluído'].groupby('inspetor_id').size().reset_index(name='Concluídas')
+df_inspetor = resumo['inspetor_status']
+df_prod = df_inspetor.groupby('inspetor_id')['Contagem'].sum().reset_index(name='Total de Inspeções')
+df_prod_status = df_inspetor[df_inspetor['status'] == 'Concluído'][['inspetor_id', 'Contagem']].rename(columns={'Contagem': 'Concluídas'})
 
 df_prod = pd.merge(df_prod, df_prod_status, on='inspetor_id', how='left').fillna(0)
 df_prod['Concluídas'] = df_prod['Concluídas'].astype(int)
@@ -71,14 +93,86 @@ st.plotly_chart(fig_prod, use_container_width=True)
 
 st.markdown("---")
 
-# --- 4. Exportação de Dados ---
+# --- 4. Evolução no Tempo ---
+run.stage("séries temporais")
+st.header("Evolução no Tempo")
+
+# As séries ficam em cache por versão dos dados; mudar o período ou o detalhamento só recorta o que já foi calculado
+intervalo = time_series_range(archive_years=anos_selecionados)
+col_ts = st.columns([1, 1, 2])
+freq = col_ts[0].radio("Periodicidade", options=list(TIME_SERIES_FREQS), format_func=TIME_SERIES_FREQS.get, horizontal=True)
+detalhe = col_ts[1].selectbox("Detalhar por", options=[None, *TIME_SERIES_DIMENSIONS], format_func=lambda d: "Nenhum" if d is None else TIME_SERIES_DIMENSIONS[d])
+if intervalo is None:
+    st.info("Não há datas de inspeção registradas para montar as séries.")
+else:
+    primeiro, ultimo = intervalo
+    periodo_padrao = (max(primeiro, ultimo - timedelta(days=365)), ultimo)
+    periodo = col_ts[2].date_input("Período", value=periodo_padrao, min_value=primeiro, max_value=ultimo, format="DD/MM/YYYY")
+    # Enquanto só a data inicial foi escolhida, o período padrão continua valendo
+    inicio, fim = periodo if len(periodo) == 2 else periodo_padrao
+    series = get_time_series(freq, detalhe, inicio, fim, archive_years=anos_selecionados)
+    nome_grupo = TIME_SERIES_DIMENSIONS.get(detalhe, "Grupo")
+
+    prazo = series['prazo']
+    concluidos_periodo = int(prazo['concluidos'].sum())
+    com_prazo = int(prazo['com_prazo'].sum())
+    col_ts_kpi = st.columns(4)
+    col_ts_kpi[0].metric("Processos Abertos", int(series['fluxo']['abertos'].sum()))
+    col_ts_kpi[1].metric("Processos Concluídos", concluidos_periodo)
+    col_ts_kpi[2].metric("Concluídos no Prazo", f"{prazo['no_prazo'].sum() / com_prazo * 100:.1f}%" if com_prazo else "-")
+    col_ts_kpi[3].metric("Tempo Médio até a Conclusão", f"{prazo['dias'].sum() / concluidos_periodo:.1f} dias" if concluidos_periodo else "-")
+
+    fluxo = series['fluxo'].melt(id_vars=['periodo', 'grupo'], value_vars=['abertos', 'concluidos'], var_name='Situação', value_name='Processos')
+    fluxo['Situação'] = fluxo['Situação'].map({'abertos': 'Abertos', 'concluidos': 'Concluídos'})
+    fig_fluxo = px.line(
+        fluxo,
+        x='periodo',
+        y='Processos',
+        color='grupo' if detalhe else 'Situação',
+        line_dash='Situação' if detalhe else None,
+        markers=True,
+        title=f"Processos Abertos e Concluídos por {'Mês' if freq == 'M' else 'Semana'}",
+        labels={'periodo': 'Período', 'grupo': nome_grupo}
+    )
+    st.plotly_chart(fig_fluxo, use_container_width=True)
+
+    col_graf = st.columns(2)
+    fig_duracao = px.bar(
+        series['duracao'],
+        x='faixa',
+        y='processos',
+        color='grupo' if detalhe else None,
+        barmode='group',
+        title='Tempo entre a Inspeção e a Conclusão',
+        labels={'faixa': 'Dias até a conclusão', 'processos': 'Processos Concluídos', 'grupo': nome_grupo},
+        category_orders={'faixa': DURATION_LABELS}
+    )
+    col_graf[0].plotly_chart(fig_duracao, use_container_width=True)
+    fig_prazo = px.bar(
+        prazo,
+        x='grupo',
+        y='% no prazo',
+        title='Processos Concluídos até o Prazo Efetivo (%)',
+        labels={'grupo': nome_grupo},
+        range_y=[0, 100],
+        text='% no prazo'
+    )
+    col_graf[1].plotly_chart(fig_prazo, use_container_width=True)
+    st.caption("Abertos pela data da inspeção e concluídos pela data de conclusão. O prazo efetivo é o da Coordenação e, na falta dele, o do inspetor.")
+
+st.markdown("---")
+
+# --- 5. Exportação de Dados ---
+run.stage("exportação")
 st.header("Exportar Dados")
 
-@st.cache_data
-def convert_df(df):
+# A chave do cache é a versão dos dados, e não o DataFrame inteiro (que precisaria ser hasheado a cada execução)
+@st.cache_data(max_entries=2)
+def convert_df(versao, anos):
+    df = pd.concat([load_data(), load_archive(years=anos)], ignore_index=True) if anos else load_data()
     return df.to_csv(index=False).encode('utf-8')
 
-csv_data = convert_df(df)
+csv_data = convert_df(data_version(), tuple(anos_selecionados))
 
 st.download_button(
     label="Download de Todos os Dados (CSV)",
@@ -87,3 +181,5 @@ st.download_button(
     mime='text/csv',
     type="secondary"
 )
+
+run.finish()
@@ -0,0 +1,134 @@
+import streamlit as st
+
+# Verifica a permissão de acesso
+if 'logged_in' not in st.session_state or st.session_state['role'] != 'gerencia':
+    st.error("Acesso negado. Esta área é restrita à Gerência.")
+    st.stop()
+
+# Os demais módulos só são carregados depois da verificação de acesso
+import plotly.express as px
+import metrics
+import startup
+from utils import api_quota_status, SHEETS_QUOTA_PER_MINUTE
+
+st.title("⏱️ Latência e Uso da API")
+st.caption(f"Medições deste servidor desde o último reinício (até {metrics.BUFFER_SIZE} mais recentes).")
+
+resumo = metrics.summary()
+eventos = metrics.events_frame()
+
+if eventos.empty:
+    st.info("Ainda não há medições. Navegue pelas páginas do sistema e volte aqui.")
+    st.stop()
+
+meta_ms = st.number_input("Meta de latência por página (ms)", min_value=100, value=2000, step=100)
+
+# --- 1. Latência das Páginas ---
+st.header("Páginas")
+paginas = resumo[resumo['tipo'] == 'page'].copy()
+execucoes = eventos[eventos['kind'] == 'page']
+
+if paginas.empty:
+    st.info("Nenhuma execução completa de página foi registrada ainda.")
+else:
+    # Percentual de execuções dentro da meta, por página
+    dentro_meta = (execucoes['seconds'] * 1000 <= meta_ms).groupby(execucoes['name']).mean() * 100
+    paginas['dentro da meta (%)'] = paginas['trecho'].map(dentro_meta)
+
+    col_kpi = st.columns(3)
+    col_kpi[0].metric("Execuções de Página", len(execucoes))
+    col_kpi[1].metric("p95 Geral (ms)", f"{execucoes['seconds'].quantile(0.95) * 1000:.0f}")
+    col_kpi[2].metric("Dentro da Meta", f"{(execucoes['seconds'] * 1000 <= meta_ms).mean() * 100:.1f}%")
+
+    fig_paginas = px.bar(
+        paginas.melt(id_vars='trecho', value_vars=['p50_ms', 'p95_ms', 'p99_ms'], var_name='Percentil', value_name='ms'),
+        x='trecho',
+        y='ms',
+        color='Percentil',
+        barmode='group',
+        title='Latência por Página (p50 / p95 / p99)',
+        labels={'trecho': 'Página', 'ms': 'Tempo (ms)'}
+    )
+    fig_paginas.add_hline(y=meta_ms, line_dash="dash", line_color="red", annotation_text="Meta")
+    st.plotly_chart(fig_paginas, use_container_width=True)
+
+    fig_historico = px.scatter(
+        execucoes.assign(ms=execucoes['seconds'] * 1000),
+        x='timestamp',
+        y='ms',
+        color='name',
+        title='Histórico de Execuções',
+        labels={'timestamp': 'Horário (UTC)', 'ms': 'Tempo (ms)', 'name': 'Página'}
+    )
+    fig_historico.add_hline(y=meta_ms, line_dash="dash", line_color="red")
+    st.plotly_chart(fig_historico, use_container_width=True)
+
+st.markdown("---")
+
+# --- 2. Etapas e Trechos Instrumentados ---
+st.header("Onde o Tempo é Gasto")
+trechos = resumo[resumo['tipo'] != 'page'].sort_values('p95_ms', ascending=False)
+
+fig_trechos = px.bar(
+    trechos,
+    x='p95_ms',
+    y='trecho',
+    color='tipo',
+    orientation='h',
+    title='Latência p95 por Etapa de Página e por Função',
+    labels={'p95_ms': 'p95 (ms)', 'trecho': '', 'tipo': 'Tipo'},
+    hover_data=['execuções', 'p50_ms', 'p99_ms', 'api_por_execução']
+)
+fig_trechos.update_layout(yaxis={'categoryorder': 'total ascending'}, height=max(400, 28 * len(trechos)))
+st.plotly_chart(fig_trechos, use_container_width=True)
+
+st.dataframe(
+    resumo,
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "p50_ms": st.column_config.NumberColumn("p50 (ms)", format="%.1f"),
+        "p95_ms": st.column_config.NumberColumn("p95 (ms)", format="%.1f"),
+        "p99_ms": st.column_config.NumberColumn("p99 (ms)", format="%.1f"),
+        "api_por_execução": st.column_config.NumberColumn("Chamadas à API por execução", format="%.2f"),
+    }
+)
+
+st.markdown("---")
+
+# --- 3. Cota da API do Google Sheets ---
+st.header("Cota da API")
+st.caption(f"Requisições à Planilha limitadas a {SHEETS_QUOTA_PER_MINUTE} leituras e {SHEETS_QUOTA_PER_MINUTE} gravações por minuto, para todas as sessões deste servidor.")
+cota = api_quota_status()
+
+col_cota = st.columns(4)
+col_cota[0].metric("Aguardando a Cota Agora", cota['na fila'], delta=f"pico: {cota['pico da fila']}", delta_color="off")
+col_cota[1].metric("Recusadas pela Cota (429)", cota.get('recusadas pela cota (429)', 0))
+col_cota[2].metric("Novas Tentativas", cota.get('novas tentativas', 0))
+col_cota[3].metric("Leituras Coalescidas", cota.get('coalescidas', 0))
+with st.expander("Todos os contadores do agendador"):
+    st.json(cota)
+
+st.markdown("---")
+
+# --- 4. Inicialização do Servidor ---
+st.header("Inicialização")
+if startup.timings:
+    st.caption("Aquecimento do cache feito em segundo plano no primeiro login após o início deste servidor.")
+    col_ini = st.columns(len(startup.timings))
+    for col, (etapa, segundos) in zip(col_ini, startup.timings.items()):
+        col.metric(etapa.capitalize(), f"{segundos * 1000:.0f} ms")
+else:
+    st.info("O aquecimento do cache não foi executado neste servidor (desligado ou ainda sem login).")
+st.caption("Para o tempo de cada etapa em um processo novo, execute 'python -m benchmarks.startup'.")
+
+st.markdown("---")
+
+# --- 5. Exportação ---
+st.header("Exportar Medições")
+col_exp = st.columns(3)
+col_exp[0].download_button("Download (JSON)", metrics.export_json(), file_name="latencia.json", mime="application/json")
+col_exp[1].download_button("Download (CSV)", metrics.export_csv(), file_name="latencia.csv", mime="text/csv")
+if col_exp[2].button("Limpar Medições"):
+    metrics.clear()
+    st.rerun()
@@ -1,68 +1,65 @@
 import streamlit as st
-import pandas as pd
-from utils import load_data, save_data, get_deadline_status
-from datetime import date
 
 # Verifica o login.
 if 'logged_in' not in st.session_state or not st.session_state['logged_in']:
     st.error("Acesso negado. Faça login na página inicial.")
     st.stop()
 
+# Os demais módulos só são carregados depois da verificação de acesso
+from utils import load_data, with_archive, queue_update, queue_event, deadline_counts, show_write_status, show_process_table, show_attachments, save_attachments, STATUS_OPTIONS
+from metrics import start_page_run
+from datetime import date
+
+# Tempo de cada etapa da página (consultado na página de Latência)
+run = start_page_run("Minhas Inspeções")
+run.stage("dados")
+
 st.title("📅 Minhas Inspeções e Prazos")
+show_write_status()
 
-df = load_data()
 current_user = st.session_state['username']
 role = st.session_state['role']
 
 # --- Filtro de Dados ---
-# Inspetores só veem os próprios registros
-if role == 'inspetor':
-    df_user = df[df['inspetor_id'] == current_user].copy()
-else:
-    # Coordenadores e Gerência podem ver tudo
-    df_user = df.copy()
-
-# Aplica a lógica de status de prazo
-df_user['status_prazo'], df_user['cor'] = zip(*df_user.apply(get_deadline_status, axis=1))
+# Inspetores só recebem os próprios registros (regra aplicada na camada de dados);
+# Coordenadores e Gerência podem ver tudo
+df_user = load_data(inspetor_id=current_user) if role == 'inspetor' else load_data()
 
 st.markdown("---")
 
 # --- Dashboards de Alerta ---
-df_pendente = df_user[df_user['status'] == 'Em Andamento']
-
-vencidos = df_pendente[df_pendente['cor'] == 'red']
-vencendo = df_pendente[df_pendente['cor'] == 'orange']
+# Contagens vindas do índice de prazos, sem classificar as linhas
+alertas = deadline_counts(inspetor_id=current_user if role == 'inspetor' else None)
 
 col_alerts = st.columns(3)
-col_alerts[0].metric(label="Processos Em Andamento", value=len(df_pendente))
-col_alerts[1].metric(label="⚠️ Prazos Vencendo (3 dias)", value=len(vencendo), delta="🚨 Ação Imediata", delta_color="normal")
-col_alerts[2].metric(label="❌ Prazos VENCIDOS", value=len(vencidos), delta=f"{len(vencidos)} processos críticos", delta_color="inverse")
+col_alerts[0].metric(label="Processos Em Andamento", value=alertas['em_andamento'])
+col_alerts[1].metric(label="⚠️ Prazos Vencendo (3 dias)", value=alertas['vencendo'], delta="🚨 Ação Imediata", delta_color="normal")
+col_alerts[2].metric(label="❌ Prazos VENCIDOS", value=alertas['vencidos'], delta=f"{alertas['vencidos']} processos críticos", delta_color="inverse")
 
 st.markdown("---")
 
 # --- Lista Detalhada ---
+run.stage("tabela")
 st.subheader("Lista de Pendências e Processos")
 
 situacao_filtro = st.multiselect(
     "Filtrar por Situação",
-    options=df_user['status'].unique(),
+    options=STATUS_OPTIONS + [s for s in df_user['status'].dropna().unique() if s not in STATUS_OPTIONS],
     default=['Em Andamento']
 )
 
-df_filtrado = df_user[df_user['status'].isin(situacao_filtro)].sort_values(by='prazo_retorno_inspetor', ascending=True)
+df_filtrado = df_user[df_user['status'].isin(situacao_filtro)]
 
-# Função para estilizar a linha (alerta visual)
-def style_status(row):
-    color = row['cor']
-    if color == 'red':
-        return ['background-color: #FFDDDD'] * len(row) # Vermelho claro
-    elif color == 'orange':
-        return ['background-color: #FFF2CC'] * len(row) # Laranja claro
-    return [''] * len(row)
+# Concluídos antigos ficam no arquivo e só são lidos quando o filtro os inclui
+if 'Concluído' in situacao_filtro:
+    filtros_arquivo = {'inspetor_id': current_user} if role == 'inspetor' else {}
+    df_filtrado = with_archive(df_filtrado, status='Concluído', **filtros_arquivo)
 
-st.dataframe(
-    df_filtrado.drop(columns=['cor']).style.apply(style_status, axis=1),
-    use_container_width=True,
+# Tabela paginada: ordenação e filtros valem para todos os registros; status do prazo e destaque, só para a página visível
+pagina_visivel = show_process_table(
+    df_filtrado,
+    key="minhas_inspecoes",
+    filter_key=(current_user, tuple(situacao_filtro)),
     column_config={
         "ID": st.column_config.Column("ID"),
         "estabelecimento": st.column_config.Column("Estabelecimento"),
@@ -70,13 +67,13 @@ st.dataframe(
         "prazo_retorno_inspetor": st.column_config.DateColumn("Prazo Inspetor", format="DD/MM/YYYY"),
         "prazo_retorno_coord": st.column_config.DateColumn("Prazo Coord.", format="DD/MM/YYYY"),
         "inspetor_id": st.column_config.Column("Inspetor")
-    },
-    hide_index=True
+    }
 )
 
 st.markdown("---")
 
 # --- Ação Rápida: Conclusão de Processo ---
+run.stage("ações")
 st.subheader("Concluir Processo")
 
 df_active = df_user[df_user['status'] == 'Em Andamento']
@@ -88,17 +85,39 @@ if not df_active.empty:
     confirm_concluir = st.button("Marcar como Concluído", type="primary")
 
     if confirm_concluir:
-        idx = df[df['ID'] == processo_concluir].index[0]
+        idx = df_user[df_user['ID'] == processo_concluir].index[0]
         
         # Check se o usuário é o responsável (apenas inspetor)
-        if role == 'inspetor' and df.loc[idx, 'inspetor_id'] != current_user:
+        if role == 'inspetor' and df_user.loc[idx, 'inspetor_id'] != current_user:
             st.error("Você só pode concluir seus próprios processos ativos.")
         else:
-            df.loc[idx, 'status'] = 'Concluído'
-            df.loc[idx, 'data_conclusao'] = data_conclusao
-            df.loc[idx, 'comentarios'] = str(df.loc[idx, 'comentarios']) + f"\n [{current_user} em {date.today().strftime('%d/%m/%Y')}]: Processo finalizado com sucesso."
-            save_data(df)
+            # Enfileira apenas as células alteradas deste processo e registra a conclusão no histórico
+            queue_update(processo_concluir, {
+                'status': 'Concluído',
+                'data_conclusao': data_conclusao
+            })
+            queue_event(processo_concluir, "conclusão", f"Processo finalizado com sucesso em {data_conclusao.strftime('%d/%m/%Y')}.")
             st.success(f"Processo {processo_concluir} marcado como CONCLUÍDO!")
-            st.experimental_rerun()
+            st.rerun()
 else:
     st.info("Não há processos ativos para serem concluídos no momento.")
+
+st.markdown("---")
+
+# --- Anexos (Fotos e Documentos) ---
+st.subheader("Anexos do Processo")
+
+# A lista traz só os processos da página visível da tabela acima, não todos os registros
+if not pagina_visivel.empty:
+    processo_anexos = st.selectbox("Selecione o ID do Processo (da página visível da tabela)", pagina_visivel['ID'].tolist(), key="processo_anexos")
+    show_attachments(processo_anexos, key="minhas_anexos")
+
+    with st.form("novos_anexos_form", clear_on_submit=True):
+        novos_anexos = st.file_uploader("Adicionar Fotos ou Documentos", accept_multiple_files=True)
+        if st.form_submit_button("Salvar Anexos") and novos_anexos:
+            save_attachments(processo_anexos, novos_anexos)
+            st.success(f"{len(novos_anexos)} anexo(s) salvo(s) no processo {processo_anexos}.")
+else:
+    st.info("Não há processos na tabela para exibir anexos.")
+
+run.finish()
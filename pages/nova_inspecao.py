@@ -1,29 +1,50 @@
 import streamlit as st
-import pandas as pd
-from datetime import date
-from utils import load_data, save_data
 
 # Verifica o login.
 if 'logged_in' not in st.session_state or not st.session_state['logged_in']:
     st.error("Acesso negado. Faça login na página inicial.")
     st.stop()
 
+# Os demais módulos só são carregados depois da verificação de acesso
+import pandas as pd
+from datetime import date
+from utils import queue_inspection, queue_event, save_attachments, show_write_status, sync_status, normalize_cnpj, format_cnpj, open_processes_for_cnpj
+from metrics import start_page_run
+
+# Tempo de cada etapa da página (consultado na página de Latência)
+run = start_page_run("Nova Inspeção")
+run.stage("formulário")
+
 st.title("📝 Registro de Nova Inspeção")
+show_write_status()
+
+st.header("Dados do Estabelecimento")
 
-df = load_data()
+# --- Verificação do CNPJ ---
+# O CNPJ fica fora do formulário: é conferido no índice de estabelecimentos durante a digitação
+# (live: após uma pausa), sem esperar Enter ou a saída do campo
+cnpj = st.text_input("CNPJ", max_chars=18, placeholder="00.000.000/0000-00", key="nova_inspecao_cnpj", live=True)
+cnpj_normalizado = normalize_cnpj(cnpj)
+if cnpj and cnpj_normalizado is None:
+    st.warning("CNPJ inválido: confira os 14 dígitos.")
+elif cnpj_normalizado:
+    abertos = open_processes_for_cnpj(cnpj_normalizado)
+    if not abertos.empty:
+        lista = ", ".join(f"**{row.ID}** ({row.inspetor_id}, {row.estabelecimento})" for row in abertos.head(5).itertuples())
+        if len(abertos) > 5:
+            lista += f" e mais {len(abertos) - 5}"
+        st.warning(f"Já existe processo em andamento para o CNPJ {format_cnpj(cnpj_normalizado)}: {lista}. Verifique se não é o mesmo caso antes de abrir outro.")
 
 # --- Formulário de Cadastro ---
 with st.form("nova_inspecao_form"):
-    st.header("Dados do Estabelecimento")
-    col1, col2, col3 = st.columns(3)
+    col1, col3 = st.columns(2)
     
     estabelecimento = col1.text_input("Nome do Estabelecimento", required=True)
-    cnpj = col2.text_input("CNPJ", required=True, max_chars=18, placeholder="00.000.000/0000-00")
-    atividade = col3.selectbox("Atividade Principal", ["Alimentos", "Saúde", "Saneantes", "Cosméticos", "Outro"], required=True)
+    atividade = col3.selectbox("Atividade Principal", ["Alimentos", "Saúde", "Saneantes", "Cosméticos", "Outro"])
     
     col4, col5 = st.columns(2)
-    risco = col4.selectbox("Classificação de Risco", ["Alto", "Médio", "Baixo"], required=True)
-    data_visita = col5.date_input("Data da Inspeção", date.today(), required=True)
+    risco = col4.selectbox("Classificação de Risco", ["Alto", "Médio", "Baixo"])
+    data_visita = col5.date_input("Data da Inspeção", date.today())
 
     st.header("Diário de Campo e Prazos")
     obs = st.text_area("Observações e Não Conformidades Encontradas")
@@ -34,21 +55,23 @@ with st.form("nova_inspecao_form"):
 
     st.caption("A Coordenação poderá definir um prazo obrigatório posteriormente. O prazo padrão é 15 dias.")
     
-    uploaded_files = st.file_uploader("Upload de Fotos ou Documentos (Apenas para demonstração)", accept_multiple_files=True)
+    uploaded_files = st.file_uploader("Fotos ou Documentos da Inspeção", accept_multiple_files=True)
 
     submit_button = st.form_submit_button("Salvar Inspeção e Gerar Processo", type="primary")
 
     if submit_button:
         if not estabelecimento or not cnpj:
             st.error("Por favor, preencha o Nome do Estabelecimento e o CNPJ.")
+        elif cnpj_normalizado is None:
+            st.error("CNPJ inválido: confira os 14 dígitos antes de salvar.")
         else:
-            new_id = df['ID'].max() + 1 if not df.empty else 1
-            
+            # O número do processo é atribuído na fila, sem carregar os registros de toda a equipe
             new_record = {
-                "ID": new_id,
+                "ID": None,
                 "inspetor_id": st.session_state['username'],
                 "estabelecimento": estabelecimento,
-                "cnpj": cnpj,
+                # Gravado sempre no mesmo formato, qualquer que tenha sido a digitação
+                "cnpj": format_cnpj(cnpj_normalizado),
                 "atividade": atividade,
                 "risco": risco,
                 "data_inspecao": data_visita,
@@ -56,13 +79,23 @@ with st.form("nova_inspecao_form"):
                 "prazo_retorno_inspetor": prazo_retorno_inspetor,
                 "prazo_retorno_coord": None,
                 "status": "Em Andamento",
-                "comentarios": "Processo iniciado pelo inspetor.",
+                # O histórico do processo fica no registro de eventos
+                "comentarios": None,
                 "data_conclusao": None
             }
             
-            df.loc[len(df)] = new_record
-            save_data(df)
+            # O registro aparece imediatamente e é gravado em segundo plano
+            new_id = queue_inspection(new_record)
+            queue_event(new_id, "criação", "Processo iniciado pelo inspetor.")
+            # Os arquivos vão para o armazenamento de anexos, não para a tabela de inspeções
+            anexos = save_attachments(new_id, uploaded_files)
             
             st.success(f"Processo **{new_id}** (Estabelecimento: {estabelecimento}) criado com sucesso!")
             st.info(f"Prazo de Retorno definido para: **{prazo_retorno_inspetor.strftime('%d/%m/%Y')}**.")
+            if anexos:
+                st.info(f"{len(anexos)} anexo(s) salvo(s) no processo.")
+            # O registro já está guardado neste servidor; o envio ao backend segue em segundo plano
+            st.caption(f"Envio ao sistema central: {sync_status([new_id])[new_id]}")
             st.balloons()
+
+run.finish()
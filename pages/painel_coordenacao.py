@@ -1,71 +1,94 @@
 import streamlit as st
-import pandas as pd
-from utils import load_data, save_data, get_deadline_status
-from datetime import date
 
 # Verifica a permissão de acesso
 if 'logged_in' not in st.session_state or st.session_state['role'] not in ['coordenador', 'gerencia']:
     st.error("Acesso negado. Esta área é restrita a Coordenadores e Gerência.")
     st.stop()
 
+# Os demais módulos só são carregados depois da verificação de acesso
+import pandas as pd
+from utils import load_data, with_archive, queue_update, queue_event, deadline_counts, show_write_status, show_process_table, show_event_history, show_attachments, show_establishment_history, show_search, STATUS_OPTIONS
+from metrics import start_page_run
+from datetime import date
+
+# Tempo de cada etapa da página (consultado na página de Latência)
+run = start_page_run("Painel Coordenação")
+run.stage("dados")
+
 st.title("👁️ Painel de Acompanhamento da Coordenação")
+show_write_status()
 
 df = load_data()
 
-# Aplica a lógica de status de prazo
-df['status_prazo'], df['cor'] = zip(*df.apply(get_deadline_status, axis=1))
-
 # --- Dashboard de Alertas da Equipe ---
 df_pendente = df[df['status'] == 'Em Andamento']
-
-vencidos = df_pendente[df_pendente['cor'] == 'red']
-vencendo = df_pendente[df_pendente['cor'] == 'orange']
+# Contagens vindas do índice de prazos, sem classificar as linhas
+alertas = deadline_counts()
 
 col_alerts = st.columns(3)
-col_alerts[0].metric(label="Processos Em Andamento", value=len(df_pendente))
-col_alerts[1].metric(label="⚠️ Prazos Vencendo (Equipe)", value=len(vencendo), delta_color="normal")
-col_alerts[2].metric(label="❌ Prazos VENCIDOS (Equipe)", value=len(vencidos), delta=f"{len(vencidos)} processos críticos", delta_color="inverse")
+col_alerts[0].metric(label="Processos Em Andamento", value=alertas['em_andamento'])
+col_alerts[1].metric(label="⚠️ Prazos Vencendo (Equipe)", value=alertas['vencendo'], delta_color="normal")
+col_alerts[2].metric(label="❌ Prazos VENCIDOS (Equipe)", value=alertas['vencidos'], delta=f"{alertas['vencidos']} processos críticos", delta_color="inverse")
 
 st.markdown("---")
 
 # --- Tabela de Gestão (Todos os Processos) ---
+run.stage("tabela")
 st.subheader("Tabela de Processos Ativos")
 
 # Filtros
 col_f1, col_f2 = st.columns(2)
-inspetor_filtro = col_f1.selectbox("Filtrar por Inspetor", options=['Todos'] + list(df['inspetor_id'].unique()))
-status_filtro = col_f2.multiselect("Filtrar por Status", options=df['status'].unique(), default=['Em Andamento'])
+inspetor_filtro = col_f1.selectbox("Filtrar por Inspetor", options=['Todos'] + df['inspetor_id'].unique().tolist())
+status_filtro = col_f2.multiselect(
+    "Filtrar por Status",
+    options=STATUS_OPTIONS + [s for s in df['status'].dropna().unique() if s not in STATUS_OPTIONS],
+    default=['Em Andamento']
+)
 
 df_filtrado = df[df['status'].isin(status_filtro)]
 
 if inspetor_filtro != 'Todos':
     df_filtrado = df_filtrado[df_filtrado['inspetor_id'] == inspetor_filtro]
 
-# Função de estilo para destaque
-def style_status(row):
-    color = row['cor']
-    if color == 'red':
-        return ['background-color: #FFDDDD'] * len(row) 
-    elif color == 'orange':
-        return ['background-color: #FFF2CC'] * len(row)
-    return [''] * len(row)
-
-st.dataframe(
-    df_filtrado.drop(columns=['cor']).style.apply(style_status, axis=1),
-    use_container_width=True,
+# Concluídos antigos ficam no arquivo e só são lidos quando o filtro os inclui
+if 'Concluído' in status_filtro:
+    filtros_arquivo = {'inspetor_id': inspetor_filtro} if inspetor_filtro != 'Todos' else {}
+    df_filtrado = with_archive(df_filtrado, status='Concluído', **filtros_arquivo)
+
+# Tabela paginada: ordenação e filtros valem para todos os registros; status do prazo e destaque, só para a página visível
+show_process_table(
+    df_filtrado,
+    key="painel_coordenacao",
+    filter_key=(inspetor_filtro, tuple(status_filtro)),
     column_config={
         "ID": st.column_config.Column("ID"),
         "estabelecimento": st.column_config.Column("Estabelecimento"),
         "status_prazo": st.column_config.Column("Status do Prazo"),
         "prazo_retorno_inspetor": st.column_config.DateColumn("Prazo Inspetor", format="DD/MM/YYYY"),
         "prazo_retorno_coord": st.column_config.DateColumn("Prazo Coord.", format="DD/MM/YYYY"),
-    },
-    hide_index=True
+    }
 )
 
 st.markdown("---")
 
+# --- Histórico do Estabelecimento (índice por CNPJ) ---
+run.stage("estabelecimento")
+st.subheader("Histórico do Estabelecimento")
+cnpj_busca = st.text_input("CNPJ do Estabelecimento", max_chars=18, placeholder="00.000.000/0000-00", key="painel_cnpj")
+if cnpj_busca:
+    show_establishment_history(cnpj_busca, key="painel_estabelecimento")
+
+st.markdown("---")
+
+# --- Busca nas observações, comentários e histórico ---
+run.stage("busca")
+st.subheader("Busca nos Textos dos Processos")
+show_search(key="painel_busca")
+
+st.markdown("---")
+
 # --- Gestão de Prazos e Comentários (Coordenação) ---
+run.stage("ações")
 st.subheader("Ações de Coordenação: Editar Prazo ou Comentar")
 
 col_edit_1, col_edit_2 = st.columns([1, 2])
@@ -74,7 +97,7 @@ col_edit_1, col_edit_2 = st.columns([1, 2])
 active_ids = df_pendente['ID'].tolist()
 processo_edit = col_edit_1.selectbox("ID do Processo para Edição", active_ids)
 
-if processo_edit and processo_edit in df['ID'].values:
+if processo_edit and (df['ID'] == processo_edit).any():
     idx_edit = df[df['ID'] == processo_edit].index[0]
     
     # Busca o prazo atual ou usa o de hoje como default
@@ -82,13 +105,14 @@ if processo_edit and processo_edit in df['ID'].values:
     if pd.isna(prazo_atual_coord):
         # Se não houver prazo de coordenação, usa o prazo do inspetor ou hoje
         prazo_insp = df.loc[idx_edit, 'prazo_retorno_inspetor']
-        prazo_ref = prazo_insp if not pd.isna(prazo_insp) else date.today()
+        prazo_ref = prazo_insp.date() if not pd.isna(prazo_insp) else date.today()
     else:
-        prazo_ref = prazo_atual_coord
+        prazo_ref = prazo_atual_coord.date()
 
     novo_prazo_coord = col_edit_1.date_input(
         "Novo Prazo Obrigatório da Coordenação", 
-        prazo_ref, 
+        # Prazos já vencidos são sugeridos como hoje (o novo prazo não pode ser retroativo)
+        max(prazo_ref, date.today()), 
         min_value=date.today()
     )
 
@@ -97,20 +121,30 @@ if processo_edit and processo_edit in df['ID'].values:
     salvar_edicao = st.button("Salvar Edição de Prazo/Comentário", type="primary")
 
     if salvar_edicao:
-        # 1. Atualiza Prazo de Coordenação
-        df.loc[idx_edit, 'prazo_retorno_coord'] = novo_prazo_coord
+        # 1. Atualiza Prazo de Coordenação (apenas a célula alterada deste processo)
+        queue_update(processo_edit, {'prazo_retorno_coord': novo_prazo_coord})
+        if pd.isna(prazo_atual_coord) or prazo_atual_coord.date() != novo_prazo_coord:
+            queue_event(processo_edit, "prazo", f"Prazo da Coordenação definido para {novo_prazo_coord.strftime('%d/%m/%Y')}.")
         
-        # 2. Adiciona Comentário ao Histórico
+        # 2. Adiciona Comentário ao Histórico (uma linha nova, sem reescrever os anteriores)
         if novo_comentario:
-            comentario_novo = f"\n [{st.session_state['username']} em {date.today().strftime('%d/%m/%Y')} (COORD)]: {novo_comentario}"
-            current_comments = str(df.loc[idx_edit, 'comentarios'])
-            df.loc[idx_edit, 'comentarios'] = current_comments + comentario_novo
+            queue_event(processo_edit, "comentário", novo_comentario)
         
-        save_data(df)
         st.success(f"Processo {processo_edit} atualizado com novo prazo ({novo_prazo_coord.strftime('%d/%m/%Y')}) e comentários!")
-        st.experimental_rerun()
+        st.rerun()
         
     st.subheader(f"Histórico de Comentários (Processo {processo_edit})")
-    st.text(df.loc[idx_edit, 'comentarios'])
+    show_event_history(processo_edit, key="painel_historico")
+
+    # Comentários registrados antes do histórico de eventos ficavam acumulados em uma única célula
+    comentarios_antigos = df.loc[idx_edit, 'comentarios']
+    if not pd.isna(comentarios_antigos) and str(comentarios_antigos).strip():
+        with st.expander("Comentários anteriores"):
+            st.text(comentarios_antigos)
+
+    st.subheader(f"Anexos (Processo {processo_edit})")
+    show_attachments(processo_edit, key="painel_anexos")
 else:
     st.warning("Não há processos ativos para serem editados.")
+
+run.finish()
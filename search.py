@@ -0,0 +1,192 @@
+"""Busca de texto nas observações, comentários e histórico dos processos.
+
+Um índice invertido SQLite FTS5 guardado em disco: sobrevive a reinícios do servidor
+e é atualizado texto a texto, sem reconstrução. O tokenizador 'unicode61' com
+'remove_diacritics 2' ignora acentos e maiúsculas ("AREA" encontra "área").
+
+Cada texto indexado tem uma chave ('ativo:123:obs_inspetor', 'evento:45', ...), o ID do
+processo, a origem ('ativo' ou 'arquivo 2023') e uma assinatura do conteúdo, que
+permite reindexar só os textos alterados.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+import pandas as pd
+
+from metrics import timed
+
+# --- 1. CONFIGURAÇÃO ---
+# Tamanho do trecho exibido junto a cada resultado, em palavras
+SNIPPET_WORDS = 16
+RESULT_COLUMNS = ["ID", "campo", "trecho", "relevancia"]
+
+
+def normalize_text(text):
+    """Texto em minúsculas e sem acentos, como o índice o compara."""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def _match_expression(query):
+    """Consulta FTS5 com todas as palavras de 'query'; a última vale como prefixo (busca enquanto se digita)."""
+    terms = re.findall(r"\w+", normalize_text(query))
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+# --- 2. ÍNDICE ---
+class SearchIndex:
+    """Índice de texto persistente, com resultados agrupados e ordenados por processo."""
+
+    # O FTS5 guarda só o conteúdo; chave, processo e origem ficam em uma tabela comum
+    # (filtrar por colunas do FTS5 obriga a ler o registro de cada texto encontrado)
+    SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS textos USING fts5(
+            texto, tokenize = 'unicode61 remove_diacritics 2'
+        );
+        -- 'seq' é o rowid do texto na tabela 'textos'
+        CREATE TABLE IF NOT EXISTS documentos (
+            seq INTEGER PRIMARY KEY,
+            chave TEXT NOT NULL UNIQUE,
+            ID INTEGER NOT NULL,
+            origem TEXT NOT NULL,
+            campo TEXT,
+            assinatura TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_documentos_origem ON documentos (origem);
+        CREATE TABLE IF NOT EXISTS estado (
+            nome TEXT PRIMARY KEY,
+            valor TEXT
+        );
+    """
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+
+    def signatures(self, origem):
+        """{chave: assinatura} dos textos indexados de uma origem."""
+        with self.lock:
+            return dict(self._conn.execute("SELECT chave, assinatura FROM documentos WHERE origem = ?", (origem,)))
+
+    def _seqs(self, keys):
+        """{chave: seq} das chaves já indexadas (deve ser chamada com a trava adquirida)."""
+        return dict(self._conn.execute(
+            "SELECT chave, seq FROM documentos WHERE chave IN (SELECT value FROM json_each(?))", (json.dumps(keys),)
+        ))
+
+    @timed("busca: indexação")
+    def upsert(self, texts):
+        """Indexa ou substitui textos: sequência de (chave, ID, origem, campo, texto, assinatura)."""
+        texts = [(key, int(inspection_id), origem, campo, texto, assinatura)
+                 for key, inspection_id, origem, campo, texto, assinatura in texts]
+        if not texts:
+            return
+        with self.lock, self._conn:
+            existing = self._seqs([t[0] for t in texts])
+            # Textos já indexados: o conteúdo antigo sai do FTS5 e o registro é atualizado
+            self._conn.executemany("DELETE FROM textos WHERE rowid = ?", [(seq,) for seq in existing.values()])
+            self._conn.executemany(
+                "UPDATE documentos SET ID = ?, origem = ?, campo = ?, assinatura = ? WHERE seq = ?",
+                [(t[1], t[2], t[3], t[5], existing[t[0]]) for t in texts if t[0] in existing]
+            )
+            self._conn.executemany(
+                "INSERT INTO documentos (chave, ID, origem, campo, assinatura) VALUES (?, ?, ?, ?, ?)",
+                [(t[0], t[1], t[2], t[3], t[5]) for t in texts if t[0] not in existing]
+            )
+            seqs = self._seqs([t[0] for t in texts])
+            self._conn.executemany("INSERT INTO textos (rowid, texto) VALUES (?, ?)", [(seqs[t[0]], t[4]) for t in texts])
+
+    def remove(self, keys):
+        with self.lock, self._conn:
+            for key in keys:
+                row = self._conn.execute("SELECT seq FROM documentos WHERE chave = ?", (key,)).fetchone()
+                if row is not None:
+                    self._conn.execute("DELETE FROM textos WHERE rowid = ?", (row[0],))
+                    self._conn.execute("DELETE FROM documentos WHERE seq = ?", (row[0],))
+
+    def clear(self):
+        with self.lock, self._conn:
+            for table in ("textos", "documentos", "estado"):
+                self._conn.execute(f"DELETE FROM {table}")
+
+    def get_state(self, name, default=None):
+        with self.lock:
+            row = self._conn.execute("SELECT valor FROM estado WHERE nome = ?", (name,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_state(self, name, value):
+        with self.lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO estado (nome, valor) VALUES (?, ?)", (name, str(value)))
+
+    @timed("busca: consulta")
+    def search(self, query, origins=("ativo",), ids=None, limit=20, offset=0):
+        """Processos que contêm todas as palavras de 'query': (DataFrame da página, total de processos).
+
+        A relevância (BM25) de um processo soma a de todos os seus textos encontrados; o
+        trecho exibido vem do texto mais relevante, com as palavras encontradas entre « ».
+        'ids', se informado, restringe a busca a esses processos.
+        """
+        expression = _match_expression(query)
+        origins = list(origins)
+        if expression is None or not origins or (ids is not None and not len(ids)):
+            return pd.DataFrame(columns=RESULT_COLUMNS), 0
+        where = f"d.origem IN ({', '.join('?' * len(origins))})"
+        params = [expression, *origins]
+        if ids is not None:
+            # Uma lista de IDs em JSON ocupa um único parâmetro, qualquer que seja o tamanho
+            where += " AND d.ID IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps([int(i) for i in ids]))
+        # MATERIALIZED: 'rank' só vale dentro da consulta ao FTS5, e o agrupamento é feito uma vez
+        # para a página e para o total
+        sql = f"""
+            WITH encontrados AS MATERIALIZED (
+                SELECT rowid AS seq, rank AS relevancia FROM textos WHERE textos MATCH ?
+            ),
+            processos AS MATERIALIZED (
+                SELECT d.ID, e.seq, MIN(e.relevancia), SUM(e.relevancia) AS total_relevancia
+                FROM encontrados e JOIN documentos d ON d.seq = e.seq
+                WHERE {where}
+                GROUP BY d.ID
+            )
+            SELECT ID, seq, total_relevancia, (SELECT COUNT(*) FROM processos)
+            FROM processos
+            ORDER BY total_relevancia, ID DESC
+            LIMIT ? OFFSET ?
+        """
+        with self.lock:
+            rows = self._conn.execute(sql, [*params, limit, offset]).fetchall()
+            if rows or not offset:
+                total = rows[0][3] if rows else 0
+            else:
+                # Página além da última: o total vem de uma contagem à parte
+                total = self._conn.execute(
+                    f"SELECT COUNT(DISTINCT d.ID) FROM textos JOIN documentos d ON d.seq = textos.rowid "
+                    f"WHERE textos MATCH ? AND {where}", params
+                ).fetchone()[0]
+            # Trechos só dos textos exibidos na página
+            snippets = {
+                seq: (campo, trecho) for seq, campo, trecho in self._conn.execute(
+                    f"SELECT textos.rowid, d.campo, snippet(textos, 0, '«', '»', '…', {SNIPPET_WORDS}) "
+                    f"FROM textos JOIN documentos d ON d.seq = textos.rowid "
+                    f"WHERE textos MATCH ? AND textos.rowid IN (SELECT value FROM json_each(?))",
+                    (expression, json.dumps([row[1] for row in rows]))
+                )
+            } if rows else {}
+        results = pd.DataFrame(
+            [(int(inspection_id), *snippets.get(seq, (None, None)), -relevance) for inspection_id, seq, relevance, _ in rows],
+            columns=RESULT_COLUMNS
+        )
+        return results, total
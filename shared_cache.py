@@ -0,0 +1,176 @@
+"""Cache de dados compartilhado entre as réplicas do app, em disco.
+
+A primeira réplica que lê uma versão dos dados do backend grava o DataFrame já tipado
+em um arquivo Arrow (formato IPC, sem compressão); as demais o abrem com memory-map,
+sem consultar a Planilha nem converter as linhas de novo. Os arquivos são identificados
+pelo backend e pela versão dos dados: um arquivo nunca muda depois de gravado.
+
+Quando uma réplica grava no backend, ela atualiza o arquivo de aviso 'invalidacao': as
+outras percebem a mudança na data do arquivo e conferem a versão na hora, sem esperar
+o intervalo normal de sincronização.
+
+Estrutura em 'root':
+    <hash do backend e da versão>.arrow       DataFrame de uma versão dos dados
+    <hash do backend e da versão>.carregando  réplica lendo essa versão do backend
+    invalidacao                              aviso de gravação (só a data importa)
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# --- 1. CONFIGURAÇÃO ---
+# Versões mantidas em disco; as mais antigas são apagadas a cada gravação
+KEEP_VERSIONS = 4
+# Tempo máximo (em segundos) de espera pela réplica que já está lendo a mesma versão
+LOAD_WAIT = 30
+POLL_INTERVAL = 0.1
+# Tipo das colunas de texto no arquivo; vazios continuam NaN, como na leitura do backend
+TEXT_DTYPE = pd.StringDtype(na_value=np.nan)
+
+
+# --- 2. CACHE EM DISCO ---
+class SharedFrameCache:
+    """DataFrames por versão dos dados, gravados uma vez e lidos por todas as réplicas."""
+
+    def __init__(self, root, destination):
+        self.root = root
+        self.destination = destination
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, version, suffix):
+        key = hashlib.sha256(f"{self.destination}\n{version}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.root, key + suffix)
+
+    @timed("cache compartilhado: leitura (mmap)")
+    def load(self, version):
+        """(DataFrame, estado do backend) da versão, ou None se nenhuma réplica a gravou ainda."""
+        path = self._path(version, ".arrow")
+        try:
+            # O mapeamento continua válido mesmo que o arquivo seja apagado depois
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        except FileNotFoundError:
+            return None
+        metadata = json.loads(table.schema.metadata.get(b"diario", b"{}"))
+        df = table.to_pandas()
+        # Colunas de texto voltam com o tipo da leitura direta do backend
+        for col in metadata.get("object_columns", []):
+            df[col] = df[col].astype(object)
+        return df, metadata.get("state")
+
+    @timed("cache compartilhado: gravação")
+    def save(self, version, df, state=None):
+        """Grava o DataFrame da versão; devolve False (e registra o motivo no log) se não for possível convertê-lo para Arrow.
+
+        Colunas de texto (object) são gravadas como texto: uma coluna com números e textos
+        misturados (ex.: CNPJ digitado com e sem pontuação) volta com os números como texto.
+        """
+        object_columns = [col for col in df.columns if df[col].dtype == object]
+        try:
+            table = pa.Table.from_pandas(df.astype({col: TEXT_DTYPE for col in object_columns}), preserve_index=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            logger.warning("Cache compartilhado: versão %s não gravada (conversão para Arrow falhou): %s", version, e)
+            return False
+        metadata = {
+            "object_columns": object_columns,
+            "state": state,
+        }
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"diario": json.dumps(metadata).encode("utf-8")})
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, self._path(version, ".arrow"))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._prune()
+        return True
+
+    def _prune(self):
+        files = sorted(glob.glob(os.path.join(self.root, "*.arrow")), key=_mtime, reverse=True)
+        for path in files[KEEP_VERSIONS:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_or_load(self, version, load):
+        """(DataFrame, estado, veio do cache) da versão; sem o arquivo, 'load()' lê o backend e o grava.
+
+        Só uma réplica por vez lê a mesma versão do backend: as outras esperam até LOAD_WAIT
+        segundos pelo arquivo e, se ele não aparecer, fazem a própria leitura.
+        """
+        cached = self.load(version)
+        if cached is not None:
+            return (*cached, True)
+
+        lock = self._path(version, ".carregando")
+        if not self._claim(lock):
+            deadline = time.monotonic() + LOAD_WAIT
+            while os.path.exists(lock) and time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                cached = self.load(version)
+                if cached is not None:
+                    return (*cached, True)
+            cached = self.load(version)
+            if cached is not None:
+                return (*cached, True)
+            lock = None
+        try:
+            df, state = load()
+            self.save(version, df, state)
+        finally:
+            if lock is not None and os.path.exists(lock):
+                os.remove(lock)
+        return df, state, False
+
+    def _claim(self, lock):
+        """Cria o arquivo de trava; uma trava esquecida (mais velha que LOAD_WAIT) é substituída."""
+        for _ in range(2):
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                if time.time() - _mtime(lock) < LOAD_WAIT:
+                    return False
+                try:
+                    os.remove(lock)
+                except OSError:
+                    pass
+        return False
+
+    # Aviso de gravação às outras réplicas
+    def broadcast(self):
+        """Avisa as outras réplicas de que os dados mudaram; devolve a marca do aviso."""
+        path = os.path.join(self.root, "invalidacao")
+        with open(path, "a"):
+            pass
+        os.utime(path)
+        return self.last_broadcast()
+
+    def last_broadcast(self):
+        """Marca do último aviso de gravação (0 se nunca houve)."""
+        try:
+            return os.stat(os.path.join(self.root, "invalidacao")).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
@@ -0,0 +1,54 @@
+"""Inicialização do app: aquecimento do cache de dados em segundo plano.
+
+Como auth.py, este módulo não importa pandas nem o backend: a tela de login o usa sem
+pagar por eles. O aquecimento (ligado por padrão; 'warm_up_after_login = false' no
+Streamlit Secrets o desliga) começa no login e carrega os módulos de dados, o cliente
+do backend e as inspeções enquanto o navegador ainda troca de página.
+"""
+import threading
+import time
+
+import streamlit as st
+
+_lock = threading.Lock()
+_thread = None
+# Duração de cada etapa do último aquecimento, em segundos (exibida na página de Latência)
+timings = {}
+
+
+def warm_up_enabled():
+    try:
+        return bool(st.secrets.get("warm_up_after_login", True))
+    except FileNotFoundError:
+        return True
+
+
+def _warm_up():
+    global _thread
+    start = time.perf_counter()
+    try:
+        import utils
+        timings['importação dos módulos de dados'] = time.perf_counter() - start
+
+        from metrics import span
+        step = time.perf_counter()
+        with span("aquecimento do cache (após o login)"):
+            utils.initialize_data()
+        timings['primeira leitura dos dados'] = time.perf_counter() - step
+        timings['total'] = time.perf_counter() - start
+    except Exception:
+        # A página que pedir os dados mostra o erro; o próximo login tenta de novo
+        with _lock:
+            _thread = None
+
+
+def warm_up():
+    """Inicia o aquecimento em uma thread, uma vez por processo; devolve a thread (ou None, se desligado)."""
+    global _thread
+    if not warm_up_enabled():
+        return None
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_warm_up, name="aquecimento-cache", daemon=True)
+            _thread.start()
+        return _thread
@@ -0,0 +1,996 @@
+import csv
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+
+# --- 1. ESQUEMA DOS REGISTROS DE INSPEÇÃO ---
+# Colunas das inspeções, na ordem em que são gravadas
+COLUMNS = ["ID", "inspetor_id", "estabelecimento", "cnpj", "atividade", "risco",
+           "data_inspecao", "obs_inspetor", "prazo_retorno_inspetor",
+           "prazo_retorno_coord", "status", "comentarios", "data_conclusao"]
+DATE_COLUMNS = ["data_inspecao", "prazo_retorno_inspetor", "prazo_retorno_coord", "data_conclusao"]
+# Histórico de cada processo (comentários, prazos, conclusão), um evento por linha;
+# 'op_id' é o identificador da operação gerado no app, que evita gravar o mesmo evento duas vezes
+EVENT_COLUMNS = ["ID", "autor", "perfil", "data_hora", "tipo", "texto", "op_id"]
+# Os registros de inspeção também guardam o 'op_id' da operação que os criou, depois das
+# colunas de COLUMNS; ele não faz parte dos dados lidos pelas páginas
+RECORD_OP_COLUMN = "op_id"
+
+
+def normalize_value(value):
+    """Converte um valor para o formato armazenado: datas como 'YYYY-MM-DD' e vazios como None."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    # Tipos do numpy (ex.: o ID calculado com df['ID'].max()) não são serializáveis em JSON
+    if hasattr(value, 'item'):
+        return value.item()
+    if value == "":
+        return None
+    return value
+
+
+def _filter_frame(df, filters):
+    """Aplica filtros {coluna: valor ou lista de valores} a um DataFrame já carregado."""
+    for col, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            df = df[df[col].isin(list(value))]
+        else:
+            df = df[df[col] == value]
+    return df
+
+
+def _events_frame(rows):
+    """DataFrame de eventos a partir de linhas na ordem de EVENT_COLUMNS."""
+    width = len(EVENT_COLUMNS)
+    rows = [list(row[:width]) + [None] * (width - len(row)) for row in rows]
+    df = pd.DataFrame(rows, columns=EVENT_COLUMNS, dtype=object)
+    df['ID'] = pd.to_numeric(df['ID'], errors='coerce').fillna(0).astype(int)
+    return df
+
+
+def _as_id(value):
+    """ID numérico de uma célula, ou None se a célula não contém um número."""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _read_seed_csv(path):
+    """Lê o CSV de exemplo (latin-1); linhas exportadas inteiras entre aspas são desembrulhadas."""
+    with open(path, newline='', encoding='latin-1') as f:
+        rows = [row for row in csv.reader(f) if any(row)]
+    if not rows:
+        return []
+    header, data = rows[0], rows[1:]
+    data = [next(csv.reader([row[0]])) if len(row) == 1 else row for row in data]
+    return [dict(zip(header, row)) for row in data]
+
+
+# --- 2. INTERFACE DE ARMAZENAMENTO ---
+class InspectionStore:
+    """Interface comum aos backends de armazenamento das inspeções.
+
+    Os registros trafegam no formato armazenado: datas como texto 'YYYY-MM-DD',
+    células vazias como None e o ID como inteiro.
+    """
+
+    def load(self):
+        """Retorna todas as inspeções como DataFrame com as colunas de COLUMNS."""
+        raise NotImplementedError
+
+    def version(self):
+        """Sinal barato de versão: muda sempre que os dados mudam (None se o backend não oferece)."""
+        return None
+
+    def load_appended(self):
+        """Registros acrescentados desde a última leitura, ou None quando é preciso reler tudo.
+
+        Só devolve as linhas novas quando a mudança foi apenas o acréscimo de registros: se
+        um registro já lido foi alterado, removido ou mudou de linha, devolve None.
+        """
+        return None
+
+    def load_state(self):
+        """Estado da última leitura completa usado pelas leituras incrementais (JSON), ou None."""
+        return None
+
+    def restore_load_state(self, df, state):
+        """Retoma uma leitura completa feita por outra réplica: 'df' como devolvido por load() e o
+        estado de load_state()."""
+
+    def query(self, **filters):
+        """Retorna as inspeções que atendem aos filtros {coluna: valor ou lista de valores}."""
+        return _filter_frame(self.load(), filters)
+
+    def append(self, record):
+        """Acrescenta um novo registro (dicionário coluna -> valor)."""
+        raise NotImplementedError
+
+    def update(self, inspection_id, changes):
+        """Altera apenas as colunas informadas do registro com o ID dado."""
+        raise NotImplementedError
+
+    def append_many(self, records, replay=False):
+        """Acrescenta vários registros; os backends gravam o lote de uma só vez.
+
+        Cada registro pode trazer o 'op_id' da operação que o criou, gravado junto com ele.
+        Com 'replay' (repetição de um lote cuja gravação falhou), os registros cujo 'op_id'
+        já está gravado não são acrescentados de novo. O ID vem do app e pode já estar em
+        uso por um registro de outra réplica: nesse caso o registro é gravado com o próximo
+        número livre. Retorna {ID pedido: ID gravado} dos registros gravados com outro número.
+        """
+        for record in records:
+            self.append(record)
+        return {}
+
+    def update_many(self, updates):
+        """Aplica várias atualizações {ID: {coluna: valor}}; os backends gravam o lote de uma só vez."""
+        for inspection_id, changes in updates.items():
+            self.update(inspection_id, changes)
+
+    def replace_all(self, df):
+        """Substitui todos os registros pelo conteúdo do DataFrame."""
+        raise NotImplementedError
+
+    def archive_years(self):
+        """Anos que têm processos arquivados, em ordem crescente."""
+        return []
+
+    def load_archive(self, year):
+        """Processos arquivados de um ano, como DataFrame com as colunas de COLUMNS."""
+        return pd.DataFrame(columns=COLUMNS)
+
+    def archive(self, records_by_year):
+        """Move processos para o arquivo: {ano: DataFrame de registros}, removendo-os da partição ativa.
+
+        O arquivo é gravado antes da remoção: uma falha no meio deixa o processo nas duas
+        partições (a ativa prevalece na leitura), nunca em nenhuma.
+        """
+        raise NotImplementedError
+
+    def append_events(self, events):
+        """Acrescenta eventos ao histórico (dicionários com as colunas de EVENT_COLUMNS)."""
+        raise NotImplementedError
+
+    def load_events(self, inspection_id, offset=0, limit=None):
+        """Eventos de um processo, do mais recente ao mais antigo: (DataFrame da página, total)."""
+        raise NotImplementedError
+
+    def count_events(self, inspection_id):
+        """Número de eventos gravados do processo; só muda quando ele ganha eventos novos."""
+        return self.load_events(inspection_id, limit=0)[1]
+
+    def load_events_since(self, position=0):
+        """Eventos gravados depois de 'position', de todos os processos: (DataFrame, nova posição).
+
+        O histórico só recebe inserções: a posição de cada evento (o índice do DataFrame)
+        não muda, e a nova posição serve de ponto de partida para a próxima leitura.
+        """
+        return _events_frame([]), position
+
+    def applied_event_ops(self, op_ids):
+        """Identificadores de operação de 'op_ids' cujos eventos já estão gravados."""
+        return set()
+
+
+def _check_columns(changes):
+    unknown = [col for col in changes if col not in COLUMNS or col == 'ID']
+    if unknown:
+        raise ValueError(f"Colunas inválidas para atualização: {unknown}")
+
+
+# --- 3. BACKEND GOOGLE SHEETS ---
+# gspread e google-auth são importados nos métodos que os usam: com o backend SQLite,
+# ou antes do primeiro acesso aos dados, o app não carrega essas bibliotecas
+def _sheet_value(value):
+    """Valor como enviado à Planilha: vazios viram célula em branco."""
+    value = normalize_value(value)
+    return "" if value is None else value
+
+# Respostas da API que indicam credencial expirada ou revogada
+AUTH_ERROR_CODES = (401, 403)
+# Tentativas de obter um número livre para um registro cujo ID outra réplica gravou ao mesmo tempo
+MAX_RENUMBER_ROUNDS = 5
+# Coluna do cabeçalho (depois de 'op_id') com a marca de edição: um valor novo a cada
+# alteração de registros existentes feita pelo app, em qualquer réplica
+EDIT_MARK_COLUMN = len(COLUMNS) + 2
+# Coluna do cabeçalho com a trava do arquivamento: a hora (epoch) em que ele começou a remover
+# linhas da aba ativa. Enquanto ela estiver marcada, nenhuma réplica grava em linhas existentes
+ARCHIVE_LOCK_COLUMN = len(COLUMNS) + 3
+# Espera (em segundos) entre marcar a trava e remover as linhas: uma gravação que conferiu as
+# linhas antes da trava termina nesse intervalo, mesmo aguardando a cota da API
+ARCHIVE_LOCK_WAIT = 90
+# Uma trava mais antiga que isso é de um arquivamento interrompido e é ignorada
+ARCHIVE_LOCK_TIMEOUT = 15 * 60
+
+def _retry_on_auth_error(method):
+    """Repete a chamada uma vez, com cliente e handles novos, se a autenticação falhar."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        from google.auth.exceptions import RefreshError
+        from gspread.exceptions import APIError
+        try:
+            return method(self, *args, **kwargs)
+        except (APIError, RefreshError) as e:
+            if isinstance(e, APIError) and e.code not in AUTH_ERROR_CODES:
+                raise
+            self.reset_handles(reset_client=True)
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _check_archive_lock(cells):
+    """Interrompe a gravação se o arquivamento estiver removendo linhas ('cells': leitura da célula da trava).
+
+    O erro não é permanente: a fila de gravação repete a operação depois.
+    """
+    started = cells[0][0] if cells and cells[0] else ""
+    if isinstance(started, (int, float)) and time.time() - started < ARCHIVE_LOCK_TIMEOUT:
+        raise RuntimeError("Arquivamento em andamento na Planilha: a gravação será repetida em seguida.")
+
+def _edit_mark_value(header):
+    """Marca de edição lida da linha de cabeçalho (texto vazio se a aba ainda não tem uma)."""
+    return str(header[EDIT_MARK_COLUMN - 1]) if len(header) >= EDIT_MARK_COLUMN else ""
+
+
+class SheetsStore(InspectionStore):
+    """Inspeções guardadas em uma aba da Planilha Google (por padrão, 'Sheet1').
+
+    Processos arquivados ficam em abas por ano ('Arquivo 2023', 'Arquivo 2024', ...).
+    """
+
+    ARCHIVE_PREFIX = "Arquivo "
+
+    def __init__(self, get_client, url, worksheet='Sheet1', events_worksheet='Eventos', reset_client=None):
+        # 'get_client' devolve o cliente gspread autenticado (normalmente já em cache);
+        # 'reset_client' descarta esse cliente quando a autenticação falha
+        self.get_client = get_client
+        self.reset_client = reset_client
+        self.url = url
+        self.worksheet_name = worksheet
+        self.events_worksheet_name = events_worksheet
+        self._lock = threading.Lock()
+        # Cabeçalho, linha da planilha de cada ID e marca de edição, conhecidos a partir da última leitura completa
+        self._header = None
+        self._rows = {}
+        self._edit_mark = None
+        # Linhas da aba de eventos de cada ID ({ID: [linha, ...]}), e quantos eventos o índice já cobre
+        self._event_rows = {}
+        self._events_indexed = 0
+        # Planilha e abas abertas uma vez e reaproveitadas: cada abertura consulta os metadados
+        self._spreadsheet = None
+        self._worksheets = {}
+
+    @timed("sheets: open_by_url/worksheets")
+    def _open(self):
+        """Abre a Planilha e guarda os handles de todas as abas; devolve (planilha, {título: aba})."""
+        sh = self.get_client().open_by_url(self.url)
+        worksheets = {worksheet.title: worksheet for worksheet in sh.worksheets()}
+        with self._lock:
+            self._spreadsheet, self._worksheets = sh, worksheets
+        return sh, worksheets
+
+    def _spreadsheet_handle(self):
+        with self._lock:
+            sh = self._spreadsheet
+        return sh if sh is not None else self._open()[0]
+
+    def _worksheet(self, title=None):
+        """Handle da aba 'title' (por padrão, a das inspeções), sem nova consulta aos metadados."""
+        from gspread.exceptions import WorksheetNotFound
+        title = title or self.worksheet_name
+        with self._lock:
+            worksheet = self._worksheets.get(title)
+        if worksheet is None:
+            # Aba desconhecida: a lista é relida, pois outra réplica pode tê-la criado
+            worksheet = self._open()[1].get(title)
+            if worksheet is None:
+                raise WorksheetNotFound(title)
+        return worksheet
+
+    def _add_worksheet(self, title, header):
+        """Cria a aba 'title' com o cabeçalho 'header' e guarda o handle."""
+        worksheet = self._spreadsheet_handle().add_worksheet(title, rows=1000, cols=len(header))
+        worksheet.append_rows([header], value_input_option='RAW', table_range='A1')
+        with self._lock:
+            self._worksheets[title] = worksheet
+        return worksheet
+
+    def reset_handles(self, reset_client=False):
+        """Descarta os handles abertos (e, se pedido, o cliente); a próxima chamada os reabre."""
+        with self._lock:
+            self._spreadsheet, self._worksheets = None, {}
+        if reset_client and self.reset_client is not None:
+            self.reset_client()
+
+    def _to_frame(self, rows, first_row, header=None):
+        """Monta o DataFrame a partir de linhas da aba; o índice guarda a linha da planilha - 2."""
+        header = header or self._header
+        width = len(header)
+        rows = [list(row[:width]) + [""] * (width - len(row)) for row in rows]
+        df = pd.DataFrame(rows, columns=header, index=range(first_row - 2, first_row - 2 + len(rows)), dtype=object)
+
+        # Remoção de linhas completamente vazias
+        df = df.replace("", np.nan).dropna(how='all')
+
+        # Adiciona colunas se estiverem faltando (útil para o primeiro carregamento)
+        for col in COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+
+        # Converte ID para int, tratando erros e vazios como 0
+        df['ID'] = pd.to_numeric(df['ID'], errors='coerce').fillna(0).astype(int)
+        return df[COLUMNS]  # Retorna apenas as colunas na ordem correta
+
+    @timed("sheets: leitura completa (get_values)")
+    @_retry_on_auth_error
+    def load(self):
+        worksheet = self._worksheet()
+
+        # Números chegam sem formatação e datas como texto, como na leitura anterior via gspread_dataframe
+        values = worksheet.get_values(value_render_option='UNFORMATTED_VALUE', date_time_render_option='FORMATTED_STRING')
+        header = values[0] if values else list(COLUMNS)
+        self._header = [str(col) for col in header[:EDIT_MARK_COLUMN - 1]]
+        df = self._to_frame(values[1:], first_row=2)
+
+        with self._lock:
+            self._rows = {int(i): int(label) + 2 for label, i in zip(df.index, df['ID'])}
+            self._edit_mark = _edit_mark_value(header)
+        return df
+
+    def load_state(self):
+        return {'header': self._header, 'edit_mark': self._edit_mark}
+
+    def restore_load_state(self, df, state):
+        if not state or not state.get('header'):
+            return
+        # O índice guarda a linha da planilha - 2, como na leitura direta
+        ids = pd.to_numeric(df['ID'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        known = ~np.isnan(ids)
+        rows = dict(zip(ids[known].astype(np.int64).tolist(), (df.index.to_numpy()[known] + 2).tolist()))
+        with self._lock:
+            self._header = list(state['header'])
+            self._rows = rows
+            self._edit_mark = state.get('edit_mark')
+
+    @timed("sheets: versão (Drive)")
+    @_retry_on_auth_error
+    def version(self):
+        from gspread.utils import extract_id_from_url
+        # Data da última modificação da Planilha, consultada na API do Drive (uma chamada leve)
+        metadata = self.get_client().get_file_drive_metadata(extract_id_from_url(self.url))
+        return metadata['modifiedTime']
+
+    @timed("sheets: linhas novas")
+    @_retry_on_auth_error
+    def load_appended(self):
+        from gspread.utils import rowcol_to_a1
+        with self._lock:
+            known, edit_mark = dict(self._rows), self._edit_mark
+        if not known or self._header is None or edit_mark is None:
+            return None
+
+        # A marca de edição indica se algum registro conhecido foi alterado, e a coluna de
+        # IDs, se eles continuam nas mesmas linhas; as duas seguem em uma única requisição
+        worksheet = self._worksheet()
+        id_cells, mark_cells = worksheet.batch_get(["A:A", rowcol_to_a1(1, EDIT_MARK_COLUMN)],
+                                                   value_render_option='UNFORMATTED_VALUE')
+        if (str(mark_cells[0][0]) if mark_cells and mark_cells[0] else "") != edit_mark:
+            return None
+        ids = [cell[0] if cell else "" for cell in id_cells]
+        for inspection_id, row in known.items():
+            if row > len(ids) or str(ids[row - 1]) != str(inspection_id):
+                return None
+
+        last_known = max(known.values())
+        if len(ids) <= last_known:
+            # Nenhuma linha nova: a mudança foi em registros existentes
+            return None
+
+        rows = worksheet.get_values(
+            f"A{last_known + 1}:{rowcol_to_a1(len(ids), len(self._header))}",
+            value_render_option='UNFORMATTED_VALUE', date_time_render_option='FORMATTED_STRING'
+        )
+        df = self._to_frame(rows, first_row=last_known + 1)
+        with self._lock:
+            self._rows.update({int(i): int(label) + 2 for label, i in zip(df.index, df['ID'])})
+        return df
+
+    def _locate_rows(self, worksheet, inspection_ids):
+        """Linha da planilha de cada ID, conferida na coluna A antes de gravar.
+
+        Outra réplica (ou o arquivamento) pode ter removido linhas desde a última leitura;
+        nesse caso a coluna de IDs é relida e o mapeamento refeito. A trava do arquivamento
+        é lida na mesma requisição: com ela marcada, as linhas podem mudar antes da gravação.
+        """
+        from gspread.utils import rowcol_to_a1
+        lock_cell = rowcol_to_a1(1, ARCHIVE_LOCK_COLUMN)
+        inspection_ids = [int(i) for i in inspection_ids]
+        with self._lock:
+            rows = {i: self._rows.get(i) for i in inspection_ids}
+        if all(rows.values()):
+            *cells, lock = worksheet.batch_get([f"A{row}" for row in rows.values()] + [lock_cell], value_render_option='UNFORMATTED_VALUE')
+            _check_archive_lock(lock)
+            if all(cell and cell[0] and _as_id(cell[0][0]) == i for i, cell in zip(rows, cells)):
+                return rows
+
+        id_cells, lock = worksheet.batch_get(["A:A", lock_cell], value_render_option='UNFORMATTED_VALUE')
+        _check_archive_lock(lock)
+        ids = [cell[0] if cell else "" for cell in id_cells]
+        mapping = {_as_id(value): n for n, value in enumerate(ids[1:], start=2) if _as_id(value) is not None}
+        with self._lock:
+            self._rows = mapping
+        missing = [i for i in inspection_ids if i not in mapping]
+        if missing:
+            raise ValueError(f"Processo {missing[0]} não encontrado na Planilha.")
+        return {i: mapping[i] for i in inspection_ids}
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records, replay=False):
+        rows = [[_sheet_value(record.get(col)) for col in COLUMNS + [RECORD_OP_COLUMN]] for record in records]
+        # Linha da planilha -> ID pedido, dos registros do lote
+        ours = self._applied_rows(rows) if replay else {}
+        if len(ours) < len(rows):
+            applied = {rows[i][-1] for i in ours.values()}
+            new_rows = [i for i, row in enumerate(rows) if row[-1] not in applied]
+            first_row = self._append_rows([rows[i] for i in new_rows])
+            ours.update({first_row + offset: i for offset, i in enumerate(new_rows)})
+        return self._renumber_duplicates({row: _as_id(rows[i][0]) for row, i in ours.items()})
+
+    @timed("sheets: operações gravadas (registros)")
+    @_retry_on_auth_error
+    def _applied_rows(self, rows):
+        """{linha da planilha: posição em 'rows'} dos registros que uma tentativa anterior já gravou."""
+        from gspread.utils import rowcol_to_a1
+        positions = {row[-1]: i for i, row in enumerate(rows) if row[-1]}
+        op_column = rowcol_to_a1(1, len(COLUMNS) + 1)[:-1]
+        stored = self._worksheet().batch_get([f"{op_column}:{op_column}"], value_render_option='UNFORMATTED_VALUE')[0]
+        return {n: positions[cell[0]] for n, cell in enumerate(stored, start=1)
+                if n > 1 and cell and cell[0] in positions}
+
+    @timed("sheets: append_rows")
+    @_retry_on_auth_error
+    def _append_rows(self, rows):
+        """Acrescenta as linhas em uma única chamada 'append'; devolve a linha da planilha da primeira."""
+        from gspread.utils import a1_to_rowcol, rowcol_to_a1
+        worksheet = self._worksheet()
+        response = worksheet.append_rows(rows, value_input_option='USER_ENTERED', table_range='A1')
+        # Abas criadas antes do identificador de operação ganham o cabeçalho da coluna
+        if self._header is not None and RECORD_OP_COLUMN not in self._header:
+            worksheet.batch_update([{'range': rowcol_to_a1(1, len(COLUMNS) + 1), 'values': [[RECORD_OP_COLUMN]]}], value_input_option='RAW')
+            self._header = list(COLUMNS) + [RECORD_OP_COLUMN]
+
+        # A resposta informa o intervalo gravado (ex.: 'Sheet1!A42:N43')
+        updated_range = response['updates']['updatedRange']
+        first_row, _ = a1_to_rowcol(updated_range.split('!')[-1].split(':')[0])
+        return first_row
+
+    @timed("sheets: conferência de IDs repetidos")
+    @_retry_on_auth_error
+    def _renumber_duplicates(self, requested):
+        """Renumera os registros do lote ({linha: ID pedido}) cujo ID aparece em uma linha anterior da aba.
+
+        A Planilha não impede IDs repetidos: duas réplicas podem acrescentar o mesmo número
+        ao mesmo tempo. A linha mais acima fica com o número e a outra recebe o próximo
+        livre; a conferência se repete até nenhuma linha do lote estar repetida.
+        Retorna {ID pedido: ID gravado} das linhas que ficaram com outro número.
+        """
+        from gspread.utils import rowcol_to_a1
+        worksheet = self._worksheet()
+        lock_cell = rowcol_to_a1(1, ARCHIVE_LOCK_COLUMN)
+        with self._lock:
+            known = dict(self._rows)
+        last_id, last_known = max(known.items(), key=lambda item: item[1], default=(None, None))
+
+        # Caso comum: só as linhas depois da última conhecida são lidas e conferidas com o
+        # mapeamento da última leitura; a coluna inteira só é lida se houver repetição ou se
+        # o mapeamento estiver desatualizado (a última linha conhecida mudou)
+        if last_known is not None and requested and min(requested) > last_known:
+            tail, lock = worksheet.batch_get([f"A{last_known}:A{max(requested)}", lock_cell], value_render_option='UNFORMATTED_VALUE')
+            _check_archive_lock(lock)
+            ids = [_as_id(cell[0]) if cell else None for cell in tail]
+            if ids and ids[0] == last_id:
+                seen, repeated = set(known), False
+                for n, inspection_id in enumerate(ids[1:], start=last_known + 1):
+                    if n in requested and (inspection_id != requested[n] or inspection_id in seen):
+                        repeated = True
+                        break
+                    seen.add(inspection_id)
+                if not repeated:
+                    self._remember_rows(last_known, requested, ids[1:])
+                    return {}
+
+        for _ in range(MAX_RENUMBER_ROUNDS):
+            id_cells, lock = worksheet.batch_get(["A:A", lock_cell], value_render_option='UNFORMATTED_VALUE')
+            _check_archive_lock(lock)
+            ids = [cell[0] if cell else "" for cell in id_cells]
+            # Um registro repetido de uma tentativa anterior pode já ter sido renumerado
+            stored = {row: _as_id(ids[row - 1]) if row <= len(ids) else inspection_id
+                      for row, inspection_id in requested.items()}
+            first_row = {}
+            for n, value in enumerate(ids[1:], start=2):
+                first_row.setdefault(_as_id(value), n)
+            last = max((i for i in first_row if i is not None), default=0)
+            changes = {}
+            for row, inspection_id in stored.items():
+                if inspection_id is not None and first_row.get(inspection_id, row) < row:
+                    last += 1
+                    changes[row] = last
+            if not changes:
+                break
+            worksheet.batch_update([{'range': f"A{row}", 'values': [[new_id]]} for row, new_id in changes.items()],
+                                   value_input_option='RAW')
+            ids = [_as_id(value) for value in ids]
+            for row, new_id in changes.items():
+                ids[row - 1] = new_id
+        else:
+            raise RuntimeError("Não foi possível obter um número de processo livre na Planilha.")
+
+        if last_known is not None:
+            self._remember_rows(last_known, stored, [_as_id(value) for value in ids[last_known:]])
+        return {requested[row]: inspection_id for row, inspection_id in stored.items() if inspection_id != requested[row]}
+
+    def _remember_rows(self, last_known, ours, tail):
+        """Acrescenta ao mapeamento as linhas do lote ({linha: ID}), se 'tail' (IDs depois de 'last_known') só tiver as nossas.
+
+        Com linhas de outra réplica no meio, o mapeamento fica como está: load_appended lê a
+        partir da última linha conhecida e não pode pular registros que este servidor não leu.
+        """
+        if any(inspection_id is not None and n not in ours for n, inspection_id in enumerate(tail, start=last_known + 1)):
+            return
+        with self._lock:
+            self._rows.update({inspection_id: row for row, inspection_id in ours.items() if inspection_id is not None})
+
+    def update(self, inspection_id, changes):
+        self.update_many({inspection_id: changes})
+
+    @timed("sheets: batch_update")
+    @_retry_on_auth_error
+    def update_many(self, updates):
+        from gspread.utils import rowcol_to_a1
+        for changes in updates.values():
+            _check_columns(changes)
+        worksheet = self._worksheet()
+        rows = self._locate_rows(worksheet, updates)
+
+        # Todas as células alteradas, de todos os registros, seguem em uma única chamada, com
+        # uma nova marca de edição: as outras réplicas relerão tudo em vez de só as linhas novas
+        data = [{'range': rowcol_to_a1(1, EDIT_MARK_COLUMN), 'values': [[uuid.uuid4().hex]]}]
+        for inspection_id, changes in updates.items():
+            row_number = rows[int(inspection_id)]
+            data.extend(
+                {'range': rowcol_to_a1(row_number, COLUMNS.index(col) + 1), 'values': [[_sheet_value(value)]]}
+                for col, value in changes.items()
+            )
+        worksheet.batch_update(data, value_input_option='USER_ENTERED')
+
+    @timed("sheets: set_with_dataframe")
+    @_retry_on_auth_error
+    def replace_all(self, df):
+        from gspread.utils import rowcol_to_a1
+        from gspread_dataframe import set_with_dataframe
+        worksheet = self._worksheet()
+        df_save = df[COLUMNS].copy()
+        for col in DATE_COLUMNS:
+            df_save[col] = df_save[col].map(normalize_value)
+
+        # row=1 e col=1 garantem que começamos na célula A1
+        set_with_dataframe(worksheet, df_save, row=1, col=1, include_index=False, resize=True)
+        # O redimensionamento removeu as colunas de 'op_id', da marca de edição e da trava do arquivamento
+        worksheet.resize(cols=ARCHIVE_LOCK_COLUMN)
+        worksheet.batch_update([{'range': rowcol_to_a1(1, len(COLUMNS) + 1), 'values': [[RECORD_OP_COLUMN, uuid.uuid4().hex]]}],
+                               value_input_option='RAW')
+        with self._lock:
+            self._rows = {int(i): n + 2 for n, i in enumerate(df_save['ID'])}
+            self._header = list(COLUMNS) + [RECORD_OP_COLUMN]
+
+    @_retry_on_auth_error
+    def archive_years(self):
+        # Relê a lista de abas: o arquivamento pode ter rodado em outra réplica
+        titles = self._open()[1]
+        return sorted(int(t[len(self.ARCHIVE_PREFIX):]) for t in titles
+                      if t.startswith(self.ARCHIVE_PREFIX) and t[len(self.ARCHIVE_PREFIX):].isdigit())
+
+    @timed("sheets: leitura do arquivo")
+    @_retry_on_auth_error
+    def load_archive(self, year):
+        from gspread.exceptions import WorksheetNotFound
+        try:
+            worksheet = self._worksheet(f"{self.ARCHIVE_PREFIX}{year}")
+        except WorksheetNotFound:
+            return pd.DataFrame(columns=COLUMNS)
+        values = worksheet.get_values(value_render_option='UNFORMATTED_VALUE', date_time_render_option='FORMATTED_STRING')
+        if len(values) < 2:
+            return pd.DataFrame(columns=COLUMNS)
+        return self._to_frame(values[1:], first_row=2, header=[str(col) for col in values[0]])
+
+    @timed("sheets: arquivamento")
+    def archive(self, records_by_year):
+        """Ver InspectionStore.archive. Antes de remover as linhas, marca a trava do arquivamento e
+        espera ARCHIVE_LOCK_WAIT segundos, para que nenhuma réplica grave em uma linha deslocada."""
+        from gspread.utils import rowcol_to_a1
+        worksheet = self._worksheet()
+        lock_cell = rowcol_to_a1(1, ARCHIVE_LOCK_COLUMN)
+        locked_at = time.time()
+        worksheet.batch_update([{'range': lock_cell, 'values': [[locked_at]]}], value_input_option='RAW')
+        try:
+            self._archive_locked(records_by_year, locked_at)
+        finally:
+            worksheet.batch_update([{'range': lock_cell, 'values': [[""]]}], value_input_option='RAW')
+
+    def _archive_locked(self, records_by_year, locked_at):
+        from gspread.exceptions import WorksheetNotFound
+        for year, df in records_by_year.items():
+            title = f"{self.ARCHIVE_PREFIX}{year}"
+            try:
+                worksheet = self._worksheet(title)
+            except WorksheetNotFound:
+                worksheet = self._add_worksheet(title, COLUMNS)
+            rows = [[_sheet_value(value) for value in row] for row in df[COLUMNS].itertuples(index=False)]
+            worksheet.append_rows(rows, value_input_option='USER_ENTERED', table_range='A1')
+
+        # As gravações que conferiram as linhas antes da trava já terminaram
+        time.sleep(max(0.0, locked_at + ARCHIVE_LOCK_WAIT - time.time()))
+
+        # Remove as linhas da aba ativa em blocos contíguos, de baixo para cima, em uma única chamada
+        worksheet = self._worksheet()
+        archived = {int(i) for df in records_by_year.values() for i in df['ID']}
+        ids = worksheet.col_values(1, value_render_option='UNFORMATTED_VALUE')
+        rows = sorted((n for n, value in enumerate(ids, start=1) if n > 1 and _as_id(value) in archived), reverse=True)
+        blocks = []
+        for row in rows:
+            if blocks and blocks[-1][0] == row + 1:
+                blocks[-1][0] = row
+            else:
+                blocks.append([row, row])
+        if blocks:
+            self._spreadsheet_handle().batch_update({'requests': [
+                {'deleteDimension': {'range': {'sheetId': worksheet.id, 'dimension': 'ROWS',
+                                               'startIndex': start - 1, 'endIndex': end}}}
+                for start, end in blocks
+            ]})
+        # As linhas restantes mudaram de posição: a próxima leitura refaz o mapeamento
+        with self._lock:
+            self._rows = {}
+
+    def _events_worksheet(self, create=False):
+        from gspread.exceptions import WorksheetNotFound
+        try:
+            return self._worksheet(self.events_worksheet_name)
+        except WorksheetNotFound:
+            if not create:
+                return None
+            # Primeiro evento gravado: cria a aba com o cabeçalho
+            return self._add_worksheet(self.events_worksheet_name, EVENT_COLUMNS)
+
+    @timed("sheets: append_rows (eventos)")
+    @_retry_on_auth_error
+    def append_events(self, events):
+        rows = [[_sheet_value(event.get(col)) for col in EVENT_COLUMNS] for event in events]
+        # RAW: o texto digitado é gravado como está (um comentário iniciado por '=' não vira fórmula)
+        self._events_worksheet(create=True).append_rows(rows, value_input_option='RAW', table_range='A1')
+
+    def _index_events(self, position, ids):
+        """Acrescenta ao índice de eventos os IDs dos eventos lidos a partir de 'position' (eventos já lidos antes deles)."""
+        with self._lock:
+            # Outra leitura pode ter coberto parte destes eventos
+            skip = self._events_indexed - position
+            if skip < 0:
+                return
+            for n, value in enumerate(ids[skip:], start=self._events_indexed + 2):
+                inspection_id = _as_id(value)
+                if inspection_id is not None:
+                    self._event_rows.setdefault(inspection_id, []).append(n)
+            self._events_indexed = max(self._events_indexed, position + len(ids))
+
+    def _event_rows_of(self, worksheet, inspection_id):
+        """Linhas dos eventos do processo; só os IDs dos eventos gravados desde a última consulta são lidos."""
+        with self._lock:
+            position = self._events_indexed
+        cells = worksheet.get_values(f"A{position + 2}:A", value_render_option='UNFORMATTED_VALUE')
+        self._index_events(position, [cell[0] if cell else "" for cell in cells])
+        with self._lock:
+            return list(self._event_rows.get(int(inspection_id), []))
+
+    @timed("sheets: eventos do processo")
+    @_retry_on_auth_error
+    def load_events(self, inspection_id, offset=0, limit=None):
+        from gspread.utils import rowcol_to_a1
+        worksheet = self._events_worksheet()
+        if worksheet is None:
+            return _events_frame([]), 0
+
+        # O índice por ID localiza as linhas do processo; só as linhas da página são lidas
+        rows = self._event_rows_of(worksheet, inspection_id)
+        page = rows[::-1][offset:None if limit is None else offset + limit]
+        if not page:
+            return _events_frame([]), len(rows)
+
+        last_column = rowcol_to_a1(1, len(EVENT_COLUMNS))[:-1]
+        ranges = worksheet.batch_get([f"A{row}:{last_column}{row}" for row in page], value_render_option='UNFORMATTED_VALUE')
+        return _events_frame([values[0] if values else [] for values in ranges]), len(rows)
+
+    @timed("sheets: eventos novos")
+    @_retry_on_auth_error
+    def load_events_since(self, position=0):
+        from gspread.utils import rowcol_to_a1
+        worksheet = self._events_worksheet()
+        if worksheet is None:
+            return _events_frame([]), position
+        # A posição é o número de eventos já lidos: a leitura começa na linha seguinte
+        last_column = rowcol_to_a1(1, len(EVENT_COLUMNS))[:-1]
+        rows = worksheet.get_values(f"A{position + 2}:{last_column}", value_render_option='UNFORMATTED_VALUE')
+        # As linhas lidas também atualizam o índice de eventos por ID
+        self._index_events(position, [row[0] if row else "" for row in rows])
+        df = _events_frame(rows)
+        df.index = range(position + 1, position + 1 + len(df))
+        return df, position + len(df)
+
+    @timed("sheets: operações gravadas (eventos)")
+    @_retry_on_auth_error
+    def applied_event_ops(self, op_ids):
+        worksheet = self._events_worksheet()
+        if worksheet is None:
+            return set()
+        stored = worksheet.col_values(EVENT_COLUMNS.index("op_id") + 1)
+        return set(stored[1:]) & set(op_ids)
+
+
+# --- 4. BACKEND SQLITE LOCAL ---
+class SQLiteStore(InspectionStore):
+    """Inspeções guardadas em um banco SQLite local, com índices para as consultas das páginas."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS inspecoes (
+            ID INTEGER PRIMARY KEY,
+            inspetor_id TEXT,
+            estabelecimento TEXT,
+            cnpj TEXT,
+            atividade TEXT,
+            risco TEXT,
+            data_inspecao TEXT,
+            obs_inspetor TEXT,
+            prazo_retorno_inspetor TEXT,
+            prazo_retorno_coord TEXT,
+            status TEXT,
+            comentarios TEXT,
+            data_conclusao TEXT,
+            op_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_inspecoes_inspetor ON inspecoes (inspetor_id);
+        CREATE INDEX IF NOT EXISTS idx_inspecoes_status ON inspecoes (status);
+        CREATE INDEX IF NOT EXISTS idx_inspecoes_cnpj ON inspecoes (cnpj);
+        -- Prazo efetivo: o da Coordenação tem prioridade sobre o do inspetor
+        CREATE INDEX IF NOT EXISTS idx_inspecoes_prazo
+            ON inspecoes (COALESCE(prazo_retorno_coord, prazo_retorno_inspetor));
+
+        -- Contador de versão, incrementado por gatilhos a cada alteração (de qualquer processo)
+        CREATE TABLE IF NOT EXISTS versao (id INTEGER PRIMARY KEY CHECK (id = 1), valor INTEGER NOT NULL);
+        INSERT OR IGNORE INTO versao (id, valor) VALUES (1, 0);
+        CREATE TRIGGER IF NOT EXISTS trg_inspecoes_insert AFTER INSERT ON inspecoes
+            BEGIN UPDATE versao SET valor = valor + 1; END;
+        CREATE TRIGGER IF NOT EXISTS trg_inspecoes_update AFTER UPDATE ON inspecoes
+            BEGIN UPDATE versao SET valor = valor + 1; END;
+        CREATE TRIGGER IF NOT EXISTS trg_inspecoes_delete AFTER DELETE ON inspecoes
+            BEGIN UPDATE versao SET valor = valor + 1; END;
+
+        -- Processos arquivados (concluídos há mais tempo), particionados por ano
+        CREATE TABLE IF NOT EXISTS inspecoes_arquivo (
+            ID INTEGER PRIMARY KEY,
+            inspetor_id TEXT,
+            estabelecimento TEXT,
+            cnpj TEXT,
+            atividade TEXT,
+            risco TEXT,
+            data_inspecao TEXT,
+            obs_inspetor TEXT,
+            prazo_retorno_inspetor TEXT,
+            prazo_retorno_coord TEXT,
+            status TEXT,
+            comentarios TEXT,
+            data_conclusao TEXT,
+            ano INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_arquivo_ano ON inspecoes_arquivo (ano);
+
+        -- Histórico dos processos: só recebe inserções, lido por processo do mais recente ao mais antigo
+        CREATE TABLE IF NOT EXISTS eventos (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            ID INTEGER NOT NULL,
+            autor TEXT,
+            perfil TEXT,
+            data_hora TEXT,
+            tipo TEXT,
+            texto TEXT,
+            op_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_eventos_processo ON eventos (ID, seq);
+        CREATE TRIGGER IF NOT EXISTS trg_eventos_insert AFTER INSERT ON eventos
+            BEGIN UPDATE versao SET valor = valor + 1; END;
+    """
+
+    def __init__(self, path, seed_csv=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+            # Bancos criados antes do identificador de operação ganham a coluna
+            for table in ("eventos", "inspecoes"):
+                if "op_id" not in {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN op_id TEXT")
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_eventos_op ON eventos (op_id)")
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_inspecoes_op ON inspecoes (op_id)")
+            empty = self._conn.execute("SELECT COUNT(*) FROM inspecoes").fetchone()[0] == 0
+
+        # Um banco novo é populado a partir do CSV de exemplo, se houver
+        if empty and seed_csv and os.path.exists(seed_csv):
+            self.append_many(_read_seed_csv(seed_csv))
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            df = pd.read_sql_query(sql, self._conn, params=params)
+        return df[COLUMNS]
+
+    @timed("sqlite: leitura completa")
+    def load(self):
+        return self._read(f"SELECT {', '.join(COLUMNS)} FROM inspecoes ORDER BY ID")
+
+    def version(self):
+        with self._lock:
+            return self._conn.execute("SELECT valor FROM versao").fetchone()[0]
+
+    @timed("sqlite: consulta")
+    def query(self, **filters):
+        clauses, params = [], []
+        for col, value in filters.items():
+            if col not in COLUMNS:
+                raise ValueError(f"Coluna inválida para consulta: {col}")
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                clauses.append(f"{col} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                clauses.append(f"{col} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._read(f"SELECT {', '.join(COLUMNS)} FROM inspecoes {where} ORDER BY ID", params)
+
+    def append(self, record):
+        self.append_many([record])
+
+    @timed("sqlite: inserção")
+    def append_many(self, records, replay=False):
+        rows = [[normalize_value(record.get(col)) for col in COLUMNS + [RECORD_OP_COLUMN]] for record in records]
+        renumbered = {}
+        with self._lock, self._conn:
+            # A transação reserva a escrita desde a consulta: outra réplica não grava o mesmo
+            # número entre a verificação e a inserção
+            self._conn.execute("BEGIN IMMEDIATE")
+            if replay:
+                stored = dict(self._conn.execute(
+                    "SELECT op_id, ID FROM inspecoes WHERE op_id IN (SELECT value FROM json_each(?))",
+                    (json.dumps([row[-1] for row in rows if row[-1]]),)
+                ))
+                renumbered.update({_as_id(row[0]): stored[row[-1]] for row in rows
+                                   if row[-1] in stored and stored[row[-1]] != _as_id(row[0])})
+                rows = [row for row in rows if row[-1] not in stored]
+
+            ids = [_as_id(row[0]) for row in rows]
+            taken = {row[0] for row in self._conn.execute(
+                "SELECT ID FROM inspecoes WHERE ID IN (SELECT value FROM json_each(?))",
+                (json.dumps([i for i in ids if i is not None]),)
+            )}
+            last = max([self._conn.execute("SELECT COALESCE(MAX(ID), 0) FROM inspecoes").fetchone()[0]]
+                       + [i for i in ids if i is not None])
+            for row, inspection_id in zip(rows, ids):
+                if inspection_id in taken:
+                    # Número já usado por outra réplica: o registro recebe o próximo livre
+                    last += 1
+                    row[0] = renumbered[inspection_id] = last
+            self._conn.executemany(
+                f"INSERT INTO inspecoes ({', '.join(COLUMNS)}, {RECORD_OP_COLUMN}) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                rows
+            )
+        return renumbered
+
+    def update(self, inspection_id, changes):
+        self.update_many({inspection_id: changes})
+
+    @timed("sqlite: atualização")
+    def update_many(self, updates):
+        for changes in updates.values():
+            _check_columns(changes)
+        # Um único commit para o lote inteiro; um ID inexistente desfaz todas as alterações
+        with self._lock, self._conn:
+            for inspection_id, changes in updates.items():
+                assignments = ", ".join(f"{col} = ?" for col in changes)
+                params = [normalize_value(value) for value in changes.values()] + [int(inspection_id)]
+                cursor = self._conn.execute(f"UPDATE inspecoes SET {assignments} WHERE ID = ?", params)
+                if cursor.rowcount == 0:
+                    raise ValueError(f"Processo {inspection_id} não encontrado no banco local.")
+
+    @timed("sqlite: regravação completa")
+    def replace_all(self, df):
+        rows = [[normalize_value(v) for v in row] for row in df[COLUMNS].itertuples(index=False)]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM inspecoes")
+            self._conn.executemany(
+                f"INSERT INTO inspecoes ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows
+            )
+
+    def archive_years(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT ano FROM inspecoes_arquivo ORDER BY ano")]
+
+    @timed("sqlite: leitura do arquivo")
+    def load_archive(self, year):
+        return self._read(f"SELECT {', '.join(COLUMNS)} FROM inspecoes_arquivo WHERE ano = ? ORDER BY ID", (int(year),))
+
+    @timed("sqlite: arquivamento")
+    def archive(self, records_by_year):
+        rows = [[normalize_value(v) for v in row] + [int(year)]
+                for year, df in records_by_year.items() for row in df[COLUMNS].itertuples(index=False)]
+        # Cópia para o arquivo e remoção da partição ativa na mesma transação
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO inspecoes_arquivo ({', '.join(COLUMNS)}, ano) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                rows
+            )
+            self._conn.executemany("DELETE FROM inspecoes WHERE ID = ?", [(row[0],) for row in rows])
+
+    @timed("sqlite: inserção (eventos)")
+    def append_events(self, events):
+        rows = [[normalize_value(event.get(col)) for col in EVENT_COLUMNS] for event in events]
+        # Um evento repetido (mesmo op_id) é ignorado
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO eventos ({', '.join(EVENT_COLUMNS)}) VALUES ({', '.join('?' * len(EVENT_COLUMNS))})",
+                rows
+            )
+
+    @timed("sqlite: eventos do processo")
+    def load_events(self, inspection_id, offset=0, limit=None):
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM eventos WHERE ID = ?", (int(inspection_id),)).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(EVENT_COLUMNS)} FROM eventos WHERE ID = ? ORDER BY seq DESC LIMIT ? OFFSET ?",
+                (int(inspection_id), -1 if limit is None else limit, offset)
+            ).fetchall()
+        return _events_frame(rows), total
+
+    def count_events(self, inspection_id):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM eventos WHERE ID = ?", (int(inspection_id),)).fetchone()[0]
+
+    @timed("sqlite: eventos novos")
+    def load_events_since(self, position=0):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT seq, {', '.join(EVENT_COLUMNS)} FROM eventos WHERE seq > ? ORDER BY seq", (int(position),)
+            ).fetchall()
+        df = _events_frame([row[1:] for row in rows])
+        df.index = [row[0] for row in rows]
+        return df, rows[-1][0] if rows else position
+
+    def applied_event_ops(self, op_ids):
+        with self._lock:
+            return {op_id for op_id in op_ids
+                    if self._conn.execute("SELECT 1 FROM eventos WHERE op_id = ?", (op_id,)).fetchone()}
@@ -0,0 +1,138 @@
+"""Fila de gravação (write-behind) sobre o SQLiteStore: repetição após falha, recusas e IDs repetidos."""
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+
+def _record(inspection_id, **fields):
+    return {'ID': inspection_id, 'inspetor_id': "inspetor01", 'estabelecimento': "Padaria Central",
+            'status': "Em Andamento", 'data_inspecao': "2026-10-01", **fields}
+
+def _append(inspection_id, **fields):
+    return {'kind': 'append', 'id': inspection_id, 'record': _record(inspection_id, **fields), 'op_id': uuid.uuid4().hex}
+
+def _update(inspection_id, **changes):
+    return {'kind': 'update', 'id': inspection_id, 'changes': changes, 'op_id': uuid.uuid4().hex}
+
+def _event(inspection_id, texto):
+    op_id = uuid.uuid4().hex
+    event = {'ID': inspection_id, 'autor': "coord01", 'perfil': "coordenador", 'data_hora': "2026-10-02 10:00:00",
+             'tipo': "comentário", 'texto': texto, 'op_id': op_id}
+    return {'kind': 'event', 'id': inspection_id, 'event': event, 'op_id': op_id}
+
+
+class FailingAfterWrite(SQLiteStore):
+    """Aplica a primeira gravação de registros e então falha, como uma resposta perdida por tempo esgotado."""
+
+    failures = 1
+
+    def append_many(self, records, replay=False):
+        result = super().append_many(records, replay=replay)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("tempo esgotado")
+        return result
+
+
+@pytest.fixture(autouse=True)
+def _manual_flush(monkeypatch):
+    # A thread da fila não grava sozinha durante o teste: as gravações são feitas por flush()
+    monkeypatch.setattr(utils, "FLUSH_INTERVAL", 3600)
+    monkeypatch.setattr(utils, "FLUSH_MAX_OPS", 10_000)
+
+def _queue(store, tmp_path, name="diario.db"):
+    utils.set_store(store)
+    journal = utils._WriteJournal(str(tmp_path / name), "teste")
+    return utils._WriteBehindQueue(store, utils._InspectionCache(), journal)
+
+def _put(queue, *mutations):
+    for mutation in mutations:
+        queue.put(mutation)
+
+
+def test_retry_after_crash_does_not_duplicate_or_lose_changes(tmp_path):
+    store = FailingAfterWrite(str(tmp_path / "banco.db"))
+    queue = _queue(store, tmp_path)
+    _put(queue, _append(1), _update(1, status="Concluído"), _event(1, "Retorno agendado."))
+
+    assert queue.flush() is False
+    assert isinstance(queue.last_error, ConnectionError)
+    assert len(store.load()) == 1
+
+    # O servidor reinicia: a fila é recriada a partir do diário
+    restarted = _queue(store, tmp_path)
+    assert restarted.count() == 3
+    assert restarted.flush() is True
+
+    df = store.load()
+    assert df['ID'].tolist() == [1]
+    assert df.loc[0, 'status'] == "Concluído"
+    assert store.load_events(1)[1] == 1
+    assert restarted.count() == 0
+    assert restarted.journal.unsent() == []
+
+
+def test_update_of_missing_id_goes_to_failures_without_blocking_the_queue(tmp_path):
+    store = SQLiteStore(str(tmp_path / "banco.db"))
+    store.append_many([_record(1)])
+    queue = _queue(store, tmp_path)
+    missing = _update(999, status="Concluído")
+    _put(queue, missing, _update(1, comentarios="Conferido."), _append(2))
+
+    assert queue.flush() is True
+    assert queue.count() == 0
+    assert queue.rejected == 1
+    assert isinstance(queue.last_rejection, ValueError)
+    assert queue.failed_ids() == {999}
+    assert [m['op_id'] for m in queue.journal.failed()] == [missing['op_id']]
+
+    df = store.load().set_index('ID')
+    assert df.loc[1, 'comentarios'] == "Conferido."
+    assert 2 in df.index
+
+    # A recusa não volta à fila: novas alterações seguem normalmente
+    _put(queue, _update(2, status="Concluído"))
+    assert queue.flush() is True
+    assert store.load().set_index('ID').loc[2, 'status'] == "Concluído"
+    assert queue.rejected == 1
+
+
+def test_id_taken_by_another_replica_is_renumbered(tmp_path):
+    path = str(tmp_path / "banco.db")
+    first, second = SQLiteStore(path), SQLiteStore(path)
+    first_queue = _queue(first, tmp_path, "diario_1.db")
+    second_queue = _queue(second, tmp_path, "diario_2.db")
+
+    # As duas réplicas escolhem o mesmo número provisório
+    _put(first_queue, _append(1, estabelecimento="Mercado Bom Preço"))
+    _put(second_queue, _append(1, estabelecimento="Farmácia Popular"), _event(1, "Amostra coletada."))
+    assert first_queue.flush() is True
+    assert second_queue.flush() is True
+
+    df = first.load().set_index('ID')
+    assert df.loc[1, 'estabelecimento'] == "Mercado Bom Preço"
+    assert df.loc[2, 'estabelecimento'] == "Farmácia Popular"
+    assert second_queue.renumbered == [(1, 2, "inspetor01")]
+    events, total = first.load_events(2)
+    assert total == 1 and events['texto'].tolist() == ["Amostra coletada."]
+    assert first.load_events(1)[1] == 0
+
+
+def test_new_record_on_cold_cache_follows_stored_ids(tmp_path):
+    store = SQLiteStore(str(tmp_path / "banco.db"))
+    store.append_many([_record(1), _record(7)])
+    utils.set_store(store)
+    record = _record(None)
+    del record['ID']
+
+    # Nenhuma página carregou os dados ainda: o número segue o maior ID gravado
+    assert utils.queue_inspection(record) == 8
+    utils.flush_writes()
+    assert sorted(store.load()['ID'].tolist()) == [1, 7, 8]
@@ -1,153 +1,2159 @@
+import numpy as np
 import pandas as pd
-from datetime import date
+from datetime import date, datetime
 import streamlit as st
-import gspread
-from gspread_dataframe import set_with_dataframe, get_as_dataframe
+import json
+import math
+import random
+from bisect import bisect_left, bisect_right, insort
 import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from metrics import api_calls, count_api_call, count_requests, span, timed
+from storage import COLUMNS, DATE_COLUMNS, EVENT_COLUMNS, SheetsStore, SQLiteStore, normalize_value
 
-# --- 1. CONFIGURAÇÃO DE USUÁRIOS (Inalterada) ---
-USERS = {
-    "joao.insp": ("insp123", "inspetor"),
-    "maria.coord": ("coord456", "coordenador"),
-    "chefe.geren": ("geren789", "gerencia")
-}
+# Com Copy-on-Write (padrão a partir do pandas 3), as cópias rasas entregues às páginas
+# compartilham a memória do cache, e qualquer alteração feita por uma página fica só nela
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# --- 1. USUÁRIOS E AUTENTICAÇÃO ---
+# Ficam em auth.py, que a tela de login importa sem carregar este módulo
+
+# --- 2. CONFIGURAÇÃO DO ARMAZENAMENTO ---
+def _get_secret(key, default=None):
+    """Lê uma chave do Streamlit Secrets; sem um arquivo de secrets válido, usa o padrão."""
+    try:
+        return st.secrets.get(key, default)
+    except FileNotFoundError:
+        return default
+
+def _stop_with_error(message):
+    """Mostra o erro e interrompe a página.
 
-# --- 2. CONFIGURAÇÃO DO GOOGLE SHEETS ---
-# A URL e as credenciais são obtidas do Streamlit Secrets
-SHEETS_URL = st.secrets.get("gsheets_url")
-# Garante que a aplicação pare se as chaves não forem configuradas
-if not SHEETS_URL:
-    # Esta mensagem só aparece no Streamlit Cloud se a chave estiver faltando
-    st.error("ERRO DE CONFIGURAÇÃO: A chave 'gsheets_url' não foi encontrada no Streamlit Secrets. Verifique o arquivo .streamlit/secrets.toml.")
+    Fora de uma execução de página (jobs.py, aquecimento do cache) st.stop() não tem
+    efeito, e o erro é levantado como RuntimeError.
+    """
+    st.error(message)
     st.stop()
+    raise RuntimeError(message)
 
+# O backend é escolhido no Streamlit Secrets:
+#   storage_backend = "sheets" (padrão, Planilha Google em 'gsheets_url')
+#   storage_backend = "sqlite" (banco local em 'sqlite_path', por padrão data/banco.db)
+STORAGE_BACKEND = _get_secret("storage_backend", "sheets")
+SQLITE_PATH = _get_secret("sqlite_path", os.path.join("data", "banco.db"))
+SEED_CSV = os.path.join("data", "banco.csv")
+# Diário local das alterações ainda não enviadas ao backend (ver a fila de gravação); é próprio
+# de cada réplica e não deve ficar na pasta do cache compartilhado
+WRITE_JOURNAL_PATH = _get_secret("write_journal_path", os.path.join("data", "diario_gravacao.db"))
+# Fotos e documentos dos processos ficam em disco, fora da tabela de inspeções
+ATTACHMENTS_PATH = _get_secret("attachments_path", os.path.join("data", "anexos"))
+# Pasta do cache de dados comum às réplicas; vazio desliga. O padrão, na pasta temporária do
+# sistema, atende às réplicas de uma mesma máquina; entre máquinas, use um volume compartilhado
+SHARED_CACHE_PATH = _get_secret("shared_cache_path", os.path.join(tempfile.gettempdir(), "diario_campo_cache"))
+# Índice da busca nos textos (observações, comentários e histórico), mantido entre reinícios
+SEARCH_INDEX_PATH = _get_secret("search_index_path", os.path.join("data", "busca.db"))
+# Processos concluídos há mais dias que isso são movidos para o arquivo (ver jobs.py)
+ARCHIVE_AFTER_DAYS = int(_get_secret("archive_after_days", 365))
 
-# --- 3. FUNÇÕES DE AUTENTICAÇÃO ---
-def authenticate(username, password):
-    """Verifica credenciais e retorna o perfil."""
-    if username in USERS and USERS[username][0] == password:
-        return True, USERS[username][1]
-    return False, None
+# A URL e as credenciais são obtidas do Streamlit Secrets (e verificadas no primeiro acesso aos dados)
+SHEETS_URL = _get_secret("gsheets_url")
 
-# --- 4. FUNÇÕES DE DADOS (GOOGLE SHEETS) ---
+
+# --- 3. FUNÇÕES DE DADOS ---
 
 # O cache de recurso garante que a conexão só seja estabelecida uma vez por sessão
 # O ttl=3600 (3600 segundos = 1 hora) evita que o Streamlit tente reconectar a cada 5 minutos
 @st.cache_resource(ttl=3600) 
+@timed("get_sheets_client")
 def get_sheets_client():
     """Conecta-se ao Google Sheets usando as credenciais do Streamlit Secrets."""
     # st.secrets["gcp_service_account"] é o dicionário JSON que você colou no secrets
-    credentials = st.secrets.get("gcp_service_account")
+    credentials = _get_secret("gcp_service_account")
     if not credentials:
-        st.error("ERRO DE CONFIGURAÇÃO: A chave 'gcp_service_account' não foi encontrada no Streamlit Secrets. Verifique o arquivo .streamlit/secrets.toml.")
-        st.stop()
+        _stop_with_error("ERRO DE CONFIGURAÇÃO: A chave 'gcp_service_account' não foi encontrada no Streamlit Secrets. Verifique o arquivo .streamlit/secrets.toml.")
         
     try:
+        # O gspread só é carregado aqui, no primeiro acesso à Planilha
+        import gspread
         # Cria a conexão a partir do dicionário de credenciais
         gc = gspread.service_account_from_dict(credentials)
-        return gc
+        # Toda requisição feita pelo cliente entra na contagem de chamadas à API e passa
+        # pelo agendador, que respeita a cota e repete as recusadas por excesso de uso
+        return _get_request_scheduler().install(count_requests(gc))
     except Exception as e:
-        st.error(f"Erro ao conectar ao Google Sheets. Verifique o JSON da Service Account no Secrets. Erro: {e}")
-        st.stop()
+        _stop_with_error(f"Erro ao conectar ao Google Sheets. Verifique o JSON da Service Account no Secrets. Erro: {e}")
+
+# Backend definido em código (benchmarks e execução offline); tem prioridade sobre o Secrets
+_store_override = None
+
+def get_store():
+    """Retorna o backend de armazenamento em uso."""
+    if _store_override is not None:
+        return _store_override
+    return _get_configured_store()
+
+def set_store(store):
+    """Passa a usar 'store' como backend (ex.: benchmarks e testes offline) e descarta os caches."""
+    global _store_override
+    # As mutações pendentes do backend configurado ficam no diário e seguem quando ele voltar
+    # a ser usado; criá-lo aqui só para esvaziar a fila carregaria o backend à toa
+    if _store_override is not None:
+        flush_writes()
+    _store_override = store
+    _get_data_cache.clear()
+    _get_write_queue.clear()
+    _get_shared_cache.clear()
+    get_search_index.clear()
+
+@st.cache_resource
+def _get_configured_store():
+    """Cria o backend de armazenamento configurado no Streamlit Secrets."""
+    if STORAGE_BACKEND == "sqlite":
+        # O banco local é criado (e populado com o CSV de exemplo) na primeira execução
+        return SQLiteStore(SQLITE_PATH, seed_csv=SEED_CSV)
+    if STORAGE_BACKEND == "sheets":
+        # Sem a URL a aplicação para, mas só ao acessar os dados: a tela de login não depende dela
+        if not SHEETS_URL:
+            # Esta mensagem só aparece no Streamlit Cloud se a chave estiver faltando
+            _stop_with_error("ERRO DE CONFIGURAÇÃO: A chave 'gsheets_url' não foi encontrada no Streamlit Secrets. Verifique o arquivo .streamlit/secrets.toml.")
+        # Se a autenticação expirar, o cliente em cache é descartado e recriado
+        return SheetsStore(get_sheets_client, SHEETS_URL, reset_client=get_sheets_client.clear)
+    _stop_with_error(f"ERRO DE CONFIGURAÇÃO: backend de armazenamento desconhecido: '{STORAGE_BACKEND}'. Use 'sheets' ou 'sqlite'.")
+
+# Leituras independentes feitas ao mesmo tempo (ex.: uma aba por ano do arquivo)
+MAX_PARALLEL_FETCHES = 8
+
+def fetch_parallel(calls, max_workers=MAX_PARALLEL_FETCHES):
+    """Executa as funções sem argumentos de 'calls' ({chave: função}) em paralelo; retorna {chave: resultado}.
+
+    O tempo total passa a ser o da leitura mais lenta, e não a soma de todas. As threads
+    usam o contexto da sessão (caches do Streamlit) e suas chamadas à API entram na
+    contagem da página. Um erro em qualquer leitura é propagado.
+    """
+    calls = dict(calls)
+    if len(calls) <= 1:
+        return {key: call() for key, call in calls.items()}
+
+    ctx = get_script_run_ctx()
+    lock = threading.Lock()
+    counted = [0]
+
+    def run(call):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        start = api_calls()
+        try:
+            return call()
+        finally:
+            with lock:
+                counted[0] += api_calls() - start
 
-# O cache de dados (ttl=5) garante que a leitura não ocorra a cada interação do usuário,
-# mas que os dados sejam atualizados a cada 5 segundos ou após um 'save_data'.
-@st.cache_data(ttl=5) 
-def initialize_data():
-    """Conecta, lê os dados da Planilha e faz o tratamento inicial."""
-    gc = get_sheets_client()
     try:
-        sh = gc.open_by_url(SHEETS_URL)
-        # Assumimos que os dados estão na primeira aba ('Sheet1')
-        worksheet = sh.worksheet('Sheet1') 
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as pool:
+            futures = {key: pool.submit(run, call) for key, call in calls.items()}
+            return {key: future.result() for key, future in futures.items()}
+    finally:
+        count_api_call(counted[0])
 
-        # Tenta ler a planilha como DataFrame
-        df = get_as_dataframe(worksheet, header=0)
-        
-        # Remoção de linhas completamente vazias
-        df = df.dropna(how='all')
-        
-        # Garante que as colunas essenciais existam
-        COLUMNS = ["ID", "inspetor_id", "estabelecimento", "cnpj", "atividade", "risco", 
-                   "data_inspecao", "obs_inspetor", "prazo_retorno_inspetor", 
-                   "prazo_retorno_coord", "status", "comentarios", "data_conclusao"]
-        
-        # Adiciona colunas se estiverem faltando (útil para o primeiro carregamento)
-        for col in COLUMNS:
-            if col not in df.columns:
-                df[col] = None
-
-        # Trata IDs
-        if not df.empty and 'ID' in df.columns:
-             # Converte ID para int, tratando erros e NaN como 0 temporariamente
-             df['ID'] = pd.to_numeric(df['ID'], errors='coerce').fillna(0).astype(int)
-        
-        return df[COLUMNS] # Retorna apenas as colunas na ordem correta
+# Colunas com poucos valores distintos, guardadas como categorias
+CATEGORY_COLUMNS = ["inspetor_id", "atividade", "risco", "status"]
+STATUS_OPTIONS = ["Em Andamento", "Concluído", "Indeferido"]
+
+@timed("conversão de tipos e datas")
+def _to_typed_frame(df):
+    """Converte registros no formato armazenado para os tipos usados pelas páginas.
+
+    Datas viram datetime64, as colunas de CATEGORY_COLUMNS viram categorias e o ID
+    vira inteiro anulável. A conversão é feita uma vez por versão dos dados.
+    """
+    df = df.copy()
+    df['ID'] = pd.to_numeric(df['ID'], errors='coerce').astype('Int64')
+    for col in DATE_COLUMNS:
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype('category')
+    return df
+
+def _concat_typed(base, extra):
+    """Acrescenta registros já tipados ao DataFrame do cache, unindo as categorias."""
+    base, extra = base.copy(deep=False), extra.copy(deep=False)
+    for col in CATEGORY_COLUMNS:
+        categories = base[col].cat.categories.union(extra[col].cat.categories)
+        base[col] = base[col].cat.set_categories(categories)
+        extra[col] = extra[col].cat.set_categories(categories)
+    return pd.concat([base, extra], ignore_index=True)
+
+def _set_typed_value(df, mask, col, value):
+    """Atualiza uma coluna do DataFrame tipado nas linhas de 'mask', preservando o tipo."""
+    value = normalize_value(value)
+    if col in DATE_COLUMNS:
+        value = pd.to_datetime(value, errors='coerce')
+    elif col in CATEGORY_COLUMNS and value is not None and value not in df[col].cat.categories:
+        df[col] = df[col].cat.add_categories([value])
+    df.loc[mask, col] = value
+
+def _apply_mutation(df, mutation, summary=None):
+    """Aplica uma mutação da fila de gravação ao DataFrame tipado e retorna o resultado.
+
+    Se 'summary' for informado, as contagens dos indicadores são ajustadas junto.
+    """
+    if mutation['kind'] == 'event':
+        # Eventos do histórico ficam fora da tabela de inspeções
+        return df
+    if mutation['kind'] == 'append':
+        # Um registro que o backend já devolveu (ex.: numa releitura) não é duplicado
+        if (df['ID'] == mutation['id']).any():
+            return df
+        record = mutation['record']
+        new_row = _to_typed_frame(pd.DataFrame([[normalize_value(record.get(col)) for col in COLUMNS]], columns=COLUMNS))
+        if summary is not None:
+            summary.add(new_row)
+        return _concat_typed(df, new_row)
+
+    mask = df['ID'] == mutation['id']
+    before = df.loc[mask, SUMMARY_COLUMNS] if summary is not None else None
+    for col, value in mutation['changes'].items():
+        _set_typed_value(df, mask, col, value)
+    if summary is not None:
+        summary.remove(before)
+        summary.add(df.loc[mask, SUMMARY_COLUMNS])
+    return df
+
+
+# --- Indicadores pré-agregados ---
+# Colunas que influenciam as contagens dos indicadores
+SUMMARY_COLUMNS = ["risco", "inspetor_id", "status", "data_inspecao"]
+
+
+class _IndicatorSummary:
+    """Contagens de processos por status, risco×status e inspetor×status.
+
+    Calculadas uma vez por leitura completa e ajustadas a cada registro acrescentado ou
+    alterado, para que o painel de indicadores não percorra o histórico a cada execução.
+    """
+
+    GROUPS = {
+        'status': ['status'],
+        'risco_status': ['risco', 'status'],
+        'inspetor_status': ['inspetor_id', 'status'],
+    }
+
+    def __init__(self):
+        self.total = 0
+        self.counts = {name: Counter() for name in self.GROUPS}
+
+    @classmethod
+    def from_frame(cls, df):
+        summary = cls()
+        summary.add(df)
+        return summary
 
+    def _update(self, df, sign):
+        self.total += sign * len(df)
+        if df.empty:
+            return
+        keyed = df[["risco", "inspetor_id", "status"]]
+        for name, cols in self.GROUPS.items():
+            # Linhas sem valor em alguma das colunas não entram na contagem (como no groupby padrão)
+            for key, n in keyed.groupby(cols, observed=True).size().items():
+                self.counts[name][key] += sign * int(n)
+
+    def add(self, df):
+        self._update(df, 1)
+
+    def merged(self, other):
+        """Nova contagem somando as duas (ex.: partição ativa + anos arquivados)."""
+        result = _IndicatorSummary()
+        result.total = self.total + other.total
+        for name in self.GROUPS:
+            result.counts[name] = self.counts[name] + other.counts[name]
+        return result
+
+    def remove(self, df):
+        self._update(df, -1)
+
+    def table(self, name, value_name='Contagem'):
+        """Retorna as contagens de um grupo como DataFrame (colunas do grupo + 'Contagem')."""
+        cols = self.GROUPS[name]
+        items = [(key if isinstance(key, tuple) else (key,)) + (n,) for key, n in self.counts[name].items() if n]
+        return pd.DataFrame(items, columns=cols + [value_name]).sort_values(cols, ignore_index=True)
+
+# Intervalo mínimo (em segundos) entre consultas ao sinal de versão do backend
+SYNC_CHECK_INTERVAL = 5
+# Releitura completa periódica, como salvaguarda para mudanças que a leitura incremental não detecta
+FULL_SYNC_INTERVAL = 120
+
+
+class _InspectionCache:
+    """DataFrame de inspeções compartilhado entre as sessões e atualizado registro a registro."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.df = None
+        self.version = None
+        self.summary = None
+        # Posições das linhas de cada inspetor em 'df' ({inspetor_id: array}); None = a reconstruir
+        self.by_inspector = None
+        # Posições das linhas de cada estabelecimento ({CNPJ só com dígitos: array}); None = a reconstruir
+        self.by_cnpj = None
+        # Processos em andamento ordenados por prazo efetivo (_DeadlineIndex); None = a reconstruir
+        self.deadlines = None
+        # IDs com textos a reindexar na busca; None = comparar todos os textos com o índice
+        self.search_pending = None
+        # Comentários registrados nesta réplica, indexados na próxima busca
+        self.search_events = []
+        self.search_checked_at = 0.0
+        # Último aviso de gravação de outra réplica já considerado (cache compartilhado)
+        self.broadcast_seen = 0
+        # Incrementada a cada mudança do DataFrame em cache (leituras e mutações locais)
+        self.generation = 0
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+
+
+# Diferente do st.cache_data, o cache de recurso devolve sempre o mesmo objeto,
+# o que permite acrescentar linhas ao DataFrame sem invalidar e reler o backend.
+@st.cache_resource
+def _get_data_cache():
+    return _InspectionCache()
+
+@st.cache_resource
+def _get_shared_cache():
+    """Cache em disco comum às réplicas (shared_cache.py), ou None se desligado ou sem o pyarrow."""
+    # Como o diário de gravação, acompanha apenas o backend configurado
+    if not SHARED_CACHE_PATH or _store_override is not None:
+        return None
+    try:
+        from shared_cache import SharedFrameCache
+    except ImportError:
+        return None
+    return SharedFrameCache(SHARED_CACHE_PATH, _journal_destination())
+
+def _load_full(store, version):
+    """Leitura completa e tipada; vem do cache compartilhado quando outra réplica já leu esta versão."""
+    shared = _get_shared_cache()
+    if shared is None or version is None:
+        return _to_typed_frame(store.load())
+
+    def load():
+        return _to_typed_frame(store.load()), store.load_state()
+    df, state, cached = shared.get_or_load(version, load)
+    if cached:
+        store.restore_load_state(df, state)
+    return df
+
+def _broadcast_change():
+    """Avisa as outras réplicas de uma gravação feita por esta; o aviso não volta para ela mesma."""
+    shared = _get_shared_cache()
+    if shared is None:
+        return
+    cache = _get_data_cache()
+    with cache.lock:
+        cache.broadcast_seen = shared.broadcast()
+
+def _inspector_index(cache):
+    """Índice por inspetor do DataFrame em cache, reconstruído só após uma releitura completa."""
+    if cache.by_inspector is None:
+        cache.by_inspector = dict(cache.df.groupby('inspetor_id', observed=True).indices)
+    return cache.by_inspector
+
+def _group_by_cnpj(values, start=0):
+    """{CNPJ normalizado: posições} das linhas de 'values', somadas a 'start'; CNPJs inválidos ficam de fora.
+
+    Cada valor distinto é validado uma vez, e variações de digitação do mesmo CNPJ
+    caem na mesma chave.
+    """
+    codes, uniques = pd.factorize(values)
+    if not len(uniques):
+        return {}
+    key_codes, keys = pd.factorize(pd.Series(_normalize_cnpjs(uniques), dtype=object))
+    row_keys = np.where(codes >= 0, key_codes[codes], -1)
+    order = np.argsort(row_keys, kind='stable')
+    order = order[row_keys[order] >= 0]
+    bounds = np.flatnonzero(np.diff(row_keys[order])) + 1
+    return {keys[row_keys[group[0]]]: group + start for group in np.split(order, bounds) if len(group)}
+
+def _cnpj_index(cache):
+    """Índice por CNPJ do DataFrame em cache, reconstruído só após uma releitura completa."""
+    if cache.by_cnpj is None:
+        cache.by_cnpj = _group_by_cnpj(cache.df['cnpj'])
+    return cache.by_cnpj
+
+def _deadline_index(cache):
+    """Índice de prazos do DataFrame em cache, reconstruído só após uma releitura completa."""
+    if cache.deadlines is None:
+        cache.deadlines = _DeadlineIndex.from_frame(cache.df)
+    return cache.deadlines
+
+def _index_new_rows(cache, start):
+    """Acrescenta aos índices as linhas de 'cache.df' a partir da posição 'start'."""
+    if cache.deadlines is not None:
+        cache.deadlines.update_rows(cache.df.iloc[start:])
+    if cache.by_cnpj is not None:
+        for cnpj, positions in _group_by_cnpj(cache.df['cnpj'].iloc[start:], start).items():
+            previous = cache.by_cnpj.get(cnpj, np.empty(0, dtype=np.intp))
+            cache.by_cnpj[cnpj] = np.concatenate([previous, positions])
+    if cache.search_pending is not None:
+        cache.search_pending.update(cache.df['ID'].iloc[start:].dropna().astype(int))
+    if cache.by_inspector is None:
+        return
+    new_rows = cache.df['inspetor_id'].iloc[start:]
+    for inspetor, positions in new_rows.groupby(new_rows, observed=True).indices.items():
+        previous = cache.by_inspector.get(inspetor, np.empty(0, dtype=np.intp))
+        cache.by_inspector[inspetor] = np.concatenate([previous, positions + start])
+
+def _index_updated_row(cache, inspection_id, changes):
+    """Atualiza os índices após a alteração de um registro."""
+    if 'inspetor_id' in changes:
+        cache.by_inspector = None
+    if 'cnpj' in changes:
+        cache.by_cnpj = None
+    if cache.search_pending is not None and SEARCH_TEXT_COLUMNS.intersection(changes):
+        cache.search_pending.add(int(inspection_id))
+    if cache.deadlines is not None and _DeadlineIndex.COLUMNS.intersection(changes):
+        cache.deadlines.update_rows(cache.df[cache.df['ID'] == inspection_id])
+
+def _sync_cache(cache):
+    """Atualiza o cache somente quando o sinal de versão do backend indica mudança.
+
+    Se apenas novas linhas foram acrescentadas, busca só essas linhas; caso contrário relê tudo.
+    Deve ser chamada com 'cache.lock' adquirido.
+    """
+    now = time.monotonic()
+    shared = _get_shared_cache()
+    if shared is not None:
+        # Outra réplica gravou: a versão é conferida já, sem esperar SYNC_CHECK_INTERVAL
+        broadcast = shared.last_broadcast()
+        if broadcast != cache.broadcast_seen:
+            cache.broadcast_seen = broadcast
+            cache.checked_at = float('-inf')
+    if cache.df is not None and now - cache.checked_at < SYNC_CHECK_INTERVAL:
+        return
+
+    store = get_store()
+    try:
+        # A versão é lida antes dos dados: uma mudança durante a leitura dispara nova sincronização
+        version = store.version()
+        cache.checked_at = now
+
+        if cache.df is not None and now - cache.loaded_at < FULL_SYNC_INTERVAL:
+            if version is not None and version == cache.version:
+                return
+            appended = store.load_appended()
+            if appended is not None:
+                # Linhas gravadas pela fila deste processo já estão no cache
+                appended = _to_typed_frame(appended[~appended['ID'].isin(cache.df['ID'].dropna())])
+                cache.summary.add(appended)
+                start = len(cache.df)
+                cache.df = _concat_typed(cache.df, appended)
+                _index_new_rows(cache, start)
+                cache.generation += 1
+                cache.version = version
+                return
+
+        df = _load_full(store, version)
+        # Mutações ainda não gravadas continuam visíveis após a releitura
+        for mutation in _get_write_queue().unsent():
+            df = _apply_mutation(df, mutation)
+        cache.df = df
+        cache.summary = _IndicatorSummary.from_frame(df)
+        cache.by_inspector = None
+        cache.by_cnpj = None
+        cache.deadlines = None
+        cache.search_pending = None
+        cache.generation += 1
+        cache.version = version
+        cache.loaded_at = now
     except Exception as e:
-        st.error(f"Erro ao carregar dados da Planilha Google (Planilha ou Aba não encontrada? Verifique a URL e o nome da aba 'Sheet1'). Erro: {e}")
-        st.stop()
+        if cache.df is not None:
+            # Os dados já carregados continuam em uso; a sincronização é tentada de novo na próxima verificação
+            cache.checked_at = now
+            st.warning(f"Não foi possível sincronizar com o backend ({STORAGE_BACKEND}); exibindo os últimos dados carregados. Erro: {e}")
+            return
+        _stop_with_error(f"Erro ao carregar dados ({STORAGE_BACKEND}). Se estiver usando a Planilha Google, verifique a URL e o nome da aba 'Sheet1'. Erro: {e}")
 
-def load_data():
-    """Carrega os dados e formata as colunas de data como objetos date do Python."""
-    df = initialize_data()
-    # Tratamento de datas (Crucial para o cálculo de prazo)
-    date_cols = ["data_inspecao", "prazo_retorno_inspetor", "prazo_retorno_coord", "data_conclusao"]
-    for col in date_cols:
-        # Converte a coluna para datetime e depois para date (apenas a parte da data)
-        df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
+@timed("initialize_data")
+def initialize_data():
+    """Retorna o DataFrame tipado em cache, sincronizado com o backend.
+
+    O resultado é uma cópia rasa: não duplica os dados e, com Copy-on-Write,
+    alterações feitas pela página não chegam ao cache compartilhado.
+    """
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        return cache.df.copy(deep=False)
+
+def data_version():
+    """Identificador da versão dos dados em cache, útil como chave de caches derivados."""
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        return cache.version, cache.generation
+
+def get_indicator_summary(archive_years=()):
+    """Retorna os indicadores pré-agregados, sincronizados com o backend.
+
+    Dicionário com 'total' (número de processos) e as tabelas 'status', 'risco_status' e
+    'inspetor_status' (colunas do grupo + 'Contagem'). Os anos de 'archive_years' somam
+    os processos arquivados desses anos.
+    """
+    # As abas do arquivo são lidas em paralelo, fora da trava do cache
+    archived = fetch_parallel({year: partial(_archive_summary, year) for year in archive_years})
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        summary = cache.summary
+        for year in archive_years:
+            summary = summary.merged(archived[year])
+        result = {'total': summary.total}
+        for name in _IndicatorSummary.GROUPS:
+            result[name] = summary.table(name)
+        return result
+
+def _invalidate_cache():
+    """Descarta os dados em cache para que o próximo 'load' busque a versão atualizada."""
+    cache = _get_data_cache()
+    with cache.lock:
+        cache.df = None
+        cache.summary = None
+        cache.by_inspector = None
+        cache.by_cnpj = None
+        cache.deadlines = None
+        cache.search_pending = None
+        cache.version = None
 
+def _allowed_inspector(inspetor_id):
+    """Aplica a regra de acesso: um inspetor logado só consulta os próprios processos."""
+    if st.session_state.get('role') != 'inspetor':
+        return inspetor_id
+    username = st.session_state.get('username')
+    if inspetor_id is not None and inspetor_id != username:
+        raise PermissionError("Inspetores só podem consultar os próprios processos.")
+    return username
+
+def load_data(inspetor_id=None, status=None):
+    """Carrega os dados com as datas já convertidas (datetime64) e colunas categóricas.
+
+    Retorna a partição ativa: processos em andamento e os concluídos há menos de
+    ARCHIVE_AFTER_DAYS dias. Os arquivados são lidos sob demanda com load_archive().
+
+    'inspetor_id' e 'status' (valor ou lista) filtram os registros; as linhas de um
+    inspetor vêm de um índice mantido no cache, sem percorrer os dos demais. Para
+    usuários com perfil 'inspetor', o filtro pelo próprio usuário é sempre aplicado.
+    """
+    inspetor_id = _allowed_inspector(inspetor_id)
+    if inspetor_id is None and status is None:
+        return initialize_data()
+
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        df = cache.df
+        if inspetor_id is not None:
+            df = df.take(_inspector_index(cache).get(inspetor_id, np.empty(0, dtype=np.intp)))
+    if status is not None:
+        df = df[df['status'].isin(list(status) if isinstance(status, (list, tuple, set)) else [status])]
+    return df.copy(deep=False)
+
+def next_inspection_id():
+    """Próximo número de processo pelos dados em cache e pelos registros ainda na fila.
+
+    Não consulta o backend: quem chama sincroniza o cache antes (ver queue_inspection).
+
+    O número é provisório: se outra réplica o gravar antes, a fila de gravação grava o
+    registro com o próximo número livre (ver _WriteBehindQueue._renumber).
+    """
+    cache = _get_data_cache()
+    with cache.lock:
+        known = cache.df['ID'].max() if cache.df is not None and len(cache.df) else None
+    queued = [m['id'] for m in _get_write_queue().unsent() if m['kind'] == 'append']
+    return max(queued + ([] if known is None or pd.isna(known) else [int(known)]), default=0) + 1
+
+
+# --- Arquivo de processos concluídos ---
+# O arquivo só muda quando o arquivamento roda; outras réplicas o releem após este intervalo
+ARCHIVE_CACHE_TTL = 600
+
+@st.cache_data(ttl=ARCHIVE_CACHE_TTL, show_spinner=False)
+def get_archive_years():
+    """Anos com processos arquivados."""
+    return get_store().archive_years()
+
+# Cache de recurso: o mesmo DataFrame de cada ano serve a todas as sessões, sem ser copiado
+# (desserializado) a cada execução da página; quem o recebe não o altera
+@st.cache_resource(ttl=ARCHIVE_CACHE_TTL, max_entries=20, show_spinner="Carregando processos arquivados...")
+def _load_archive_year(year):
+    return _to_typed_frame(get_store().load_archive(year))
+
+@st.cache_resource(ttl=ARCHIVE_CACHE_TTL, max_entries=20, show_spinner=False)
+def _archive_summary(year):
+    return _IndicatorSummary.from_frame(_load_archive_year(year))
+
+def load_archive(years=None, **filters):
+    """Processos arquivados (de todos os anos ou dos anos em 'years'), já tipados.
+
+    'filters' são {coluna: valor ou lista de valores}; inspetores só recebem os próprios
+    processos. Cada ano é lido do backend apenas na primeira vez que é pedido e fica em cache;
+    os anos ainda não lidos são buscados em paralelo.
+    """
+    inspetor_id = _allowed_inspector(filters.pop('inspetor_id', None))
+    if inspetor_id is not None:
+        filters['inspetor_id'] = inspetor_id
+    years = list(get_archive_years() if years is None else years)
+    by_year = fetch_parallel({year: partial(_load_archive_year, year) for year in years})
+    frames = [by_year[year] for year in years]
+    if not frames:
+        return _to_typed_frame(pd.DataFrame(columns=COLUMNS))
+    df = frames[0]
+    for frame in frames[1:]:
+        df = _concat_typed(df, frame)
+    for col, value in filters.items():
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        df = df[df[col].isin(values)]
     return df
 
+def with_archive(df, **filters):
+    """Acrescenta a 'df' os processos arquivados que atendem aos filtros."""
+    archived = load_archive(**filters)
+    archived = archived[~archived['ID'].isin(df['ID'].dropna())]
+    if archived.empty:
+        return df
+    return _concat_typed(df, archived)
+
+def archive_concluded(max_age_days=ARCHIVE_AFTER_DAYS, dry_run=False):
+    """Move para o arquivo os processos concluídos há mais de 'max_age_days' dias.
+
+    O ano da partição é o da conclusão (ou da inspeção, se a conclusão não tiver data).
+    O processo de maior ID nunca é arquivado, para que a numeração de novos processos
+    continue a partir da partição ativa. Retorna {ano: quantidade}.
+    """
+    if not flush_writes():
+        raise RuntimeError(f"Há alterações pendentes que não puderam ser gravadas: {_get_write_queue().last_error}")
+    df = initialize_data()
+
+    concluded_at = df['data_conclusao'].fillna(df['data_inspecao'])
+    limit = pd.Timestamp(date.today()) - pd.Timedelta(days=max_age_days)
+    selected = df[(df['status'] == 'Concluído') & (concluded_at < limit) & (df['ID'] != df['ID'].max())]
+    years = concluded_at[selected.index].dt.year
+    records_by_year = {int(year): group for year, group in selected.groupby(years)}
+    counts = {year: len(group) for year, group in records_by_year.items()}
+    if dry_run or not records_by_year:
+        return counts
+
+    get_store().archive(records_by_year)
+    _invalidate_cache()
+    get_archive_years.clear()
+    _load_archive_year.clear()
+    _archive_summary.clear()
+    return counts
+
+@timed("save_data")
 def save_data(df):
-    """Salva os dados de volta para a Planilha Google."""
-    gc = get_sheets_client()
-    sh = gc.open_by_url(SHEETS_URL)
-    worksheet = sh.worksheet('Sheet1') 
-    
-    # 1. Converte objetos date para string ('YYYY-MM-DD') antes de salvar no Sheets
-    date_cols = ["data_inspecao", "prazo_retorno_inspetor", "prazo_retorno_coord", "data_conclusao"]
-    # Cria uma cópia para evitar SettingWithCopyWarning no Pandas
-    df_save = df.copy() 
-    for col in date_cols:
-         # Converte para string se for um objeto date válido
-         df_save[col] = df_save[col].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) and isinstance(x, date) else None)
-
-    # 2. Invalida o cache para que o próximo 'load' busque a versão atualizada da Planilha
-    initialize_data.clear() 
-    load_data.clear()
-
-    # 3. Sobrescreve a planilha com o novo DataFrame
-    # row=1 e col=1 garantem que começamos na célula A1
-    set_with_dataframe(worksheet, df_save, row=1, col=1, include_index=False, resize=True)
-
-
-# --- 5. FUNÇÃO DE GESTÃO DE PRAZOS ---
-def get_deadline_status(row):
-    """Calcula e retorna o status do prazo com base nas datas."""
-    
-    # Se o status for 'Concluído', o prazo é 'Concluído'
-    if row['status'] == 'Concluído':
-        return "Concluído", "green"
-
-    # Determina o prazo mais relevante (Coordenação tem prioridade)
-    prazo_ref = row['prazo_retorno_coord'] if row['prazo_retorno_coord'] else row['prazo_retorno_inspetor']
-    
-    # Se não houver prazo definido
-    if pd.isna(prazo_ref) or prazo_ref is None:
-        return "Sem Prazo", "gray"
-
-    hoje = date.today()
-    
-    # Verifica se prazo_ref é um objeto date (para segurança após o load_data)
-    if not isinstance(prazo_ref, date):
-        return "Erro de Data", "gray"
-
-    dias_restantes = (prazo_ref - hoje).days
-    
+    """Substitui todos os registros pelo conteúdo do DataFrame."""
+    # Invalida o cache para que o próximo 'load' busque a versão atualizada
+    _invalidate_cache()
+    get_store().replace_all(df)
+    _broadcast_change()
+
+def append_inspection(record):
+    """Acrescenta um novo registro e aguarda a gravação no backend.
+
+    Envia apenas a nova linha (junto com o que mais estiver na fila) e a adiciona ao DataFrame em cache.
+    """
+    queue_inspection(record)
+    _flush_or_raise()
+
+def update_inspection(inspection_id, changes):
+    """Atualiza apenas as colunas informadas do registro com o ID dado e aguarda a gravação.
+
+    'changes' é um dicionário {coluna: novo valor}; na Planilha, todas as células seguem
+    em uma única chamada 'batch_update'. O registro em cache é atualizado no lugar.
+    """
+    queue_update(inspection_id, changes)
+    _flush_or_raise()
+
+
+# --- 4. FUNÇÃO DE GESTÃO DE PRAZOS ---
+# Prazos que vencem em até DEADLINE_WARNING_DAYS dias são destacados em laranja
+DEADLINE_WARNING_DAYS = 3
+DEADLINE_COLORS = ["red", "orange", "green", "gray"]
+
+def _deadline_label(dias_restantes):
+    """Texto do status de um prazo em aberto, a partir dos dias restantes."""
     if dias_restantes < 0:
-        return f"VENCIDO há {-dias_restantes} dias", "red"
-    elif dias_restantes <= 3:
-        return f"VENCE em {dias_restantes} dias", "orange"
+        return f"VENCIDO há {-dias_restantes} dias"
+    elif dias_restantes <= DEADLINE_WARNING_DAYS:
+        return f"VENCE em {dias_restantes} dias"
     else:
-        return f"OK ({dias_restantes} dias)", "green"
+        return f"OK ({dias_restantes} dias)"
+
+def _effective_deadline(df):
+    """Prazo mais relevante de cada linha: o da Coordenação e, na falta dele, o do inspetor."""
+    prazo_coord = pd.to_datetime(df['prazo_retorno_coord'], errors='coerce')
+    prazo_insp = pd.to_datetime(df['prazo_retorno_inspetor'], errors='coerce')
+    return prazo_coord.fillna(prazo_insp)
+
+@timed("classify_deadlines")
+def classify_deadlines(df):
+    """Calcula o status do prazo de todas as linhas de uma vez.
+
+    O prazo efetivo é o da Coordenação e, na falta dele, o do inspetor. Retorna um
+    DataFrame com as colunas categóricas 'status_prazo' e 'cor', no mesmo índice de 'df'.
+    """
+    prazo_ref = _effective_deadline(df)
+
+    concluido = (df['status'] == 'Concluído').to_numpy()
+    dias = (prazo_ref.dt.normalize() - pd.Timestamp(date.today())).dt.days.to_numpy(dtype=float)
+    dias = np.where(concluido, np.nan, dias)
+
+    # Os textos são montados uma vez por valor distinto de dias restantes, não por linha
+    codes, uniques = pd.factorize(dias)
+    labels = [_deadline_label(int(d)) for d in uniques] + ["Sem Prazo", "Concluído"]
+    codes[codes == -1] = len(uniques)
+    codes[concluido] = len(uniques) + 1
+    status_prazo = pd.Categorical.from_codes(codes, categories=labels)
+
+    cor = np.select(
+        [concluido, np.isnan(dias), dias < 0, dias <= DEADLINE_WARNING_DAYS],
+        ["green", "gray", "red", "orange"],
+        default="green"
+    )
+
+    return pd.DataFrame({
+        'status_prazo': status_prazo.remove_unused_categories(),
+        'cor': pd.Categorical(cor, categories=DEADLINE_COLORS)
+    }, index=df.index)
+
+def get_deadline_status(row):
+    """Status do prazo de uma única linha (rótulo, cor), calculado por classify_deadlines."""
+    result = classify_deadlines(pd.DataFrame([row]))
+    return str(result['status_prazo'].iloc[0]), str(result['cor'].iloc[0])
+
+
+class _DeadlineIndex:
+    """Processos em andamento ordenados por prazo efetivo, no total e por inspetor.
+
+    As chaves são (dia do prazo, ID), com o dia contado a partir de 1970-01-01; como
+    são datas absolutas, a virada do dia não exige reconstrução: só os limites das
+    consultas mudam. Contagens e listas por intervalo de prazo usam busca binária.
+    """
+
+    # Processos em andamento sem prazo ficam no fim da ordem, fora de qualquer intervalo
+    NO_DEADLINE = np.iinfo(np.int64).max
+    # Colunas cuja alteração muda a posição de um processo no índice
+    COLUMNS = {'status', 'prazo_retorno_coord', 'prazo_retorno_inspetor', 'inspetor_id'}
+
+    def __init__(self):
+        self.keys = []
+        self.by_inspector = {}
+        # ID -> (chave, inspetor) dos processos presentes no índice
+        self.entries = {}
+
+    @staticmethod
+    def _rows(df):
+        """(ID, dia do prazo, inspetor) dos processos em andamento de 'df'."""
+        active = df[df['status'] == 'Em Andamento']
+        days = _effective_deadline(active).dt.normalize().to_numpy(dtype='datetime64[D]')
+        keys = np.where(np.isnat(days), _DeadlineIndex.NO_DEADLINE, days.astype(np.int64))
+        inspectors = active['inspetor_id'].astype(object).where(active['inspetor_id'].notna(), None)
+        return zip(active['ID'].astype(int).tolist(), keys.tolist(), inspectors.tolist())
+
+    @classmethod
+    def from_frame(cls, df):
+        index = cls()
+        for inspection_id, key, inspetor in cls._rows(df):
+            index.entries[inspection_id] = (key, inspetor)
+            index.keys.append((key, inspection_id))
+            index.by_inspector.setdefault(inspetor, []).append((key, inspection_id))
+        index.keys.sort()
+        for keys in index.by_inspector.values():
+            keys.sort()
+        return index
+
+    @staticmethod
+    def _discard(keys, item):
+        i = bisect_left(keys, item)
+        if i < len(keys) and keys[i] == item:
+            del keys[i]
+
+    def update_rows(self, df):
+        """Reposiciona os processos de 'df' (linhas novas ou alteradas) no índice."""
+        for inspection_id in df['ID'].dropna().astype(int):
+            old = self.entries.pop(inspection_id, None)
+            if old is not None:
+                self._discard(self.keys, (old[0], inspection_id))
+                self._discard(self.by_inspector.get(old[1], []), (old[0], inspection_id))
+        for inspection_id, key, inspetor in self._rows(df):
+            self.entries[inspection_id] = (key, inspetor)
+            insort(self.keys, (key, inspection_id))
+            insort(self.by_inspector.setdefault(inspetor, []), (key, inspection_id))
+
+    def _range(self, keys, first_day, last_day):
+        lo = 0 if first_day is None else bisect_left(keys, (first_day,))
+        hi = bisect_right(keys, (self.NO_DEADLINE - 1 if last_day is None else last_day, float('inf')))
+        return lo, hi
+
+    def count(self, first_day=None, last_day=None, inspetor_id=None):
+        keys = self.keys if inspetor_id is None else self.by_inspector.get(inspetor_id, [])
+        lo, hi = self._range(keys, first_day, last_day)
+        return max(0, hi - lo)
+
+    def ids(self, first_day=None, last_day=None, inspetor_id=None):
+        keys = self.keys if inspetor_id is None else self.by_inspector.get(inspetor_id, [])
+        lo, hi = self._range(keys, first_day, last_day)
+        return [inspection_id for _, inspection_id in keys[lo:hi]]
+
+    def total(self, inspetor_id=None):
+        return len(self.keys if inspetor_id is None else self.by_inspector.get(inspetor_id, []))
+
+
+def _today_key():
+    return int(np.datetime64(date.today(), 'D').astype(np.int64))
+
+def deadline_counts(inspetor_id=None, warning_days=DEADLINE_WARNING_DAYS):
+    """Contagens para os alertas de prazo dos processos em andamento (da equipe ou de um inspetor).
+
+    Retorna {'em_andamento', 'vencidos', 'vencendo'}; 'vencendo' são os que vencem entre
+    hoje e daqui a 'warning_days' dias, como na classificação por cores.
+    """
+    inspetor_id = _allowed_inspector(inspetor_id)
+    today = _today_key()
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        index = _deadline_index(cache)
+        return {
+            'em_andamento': index.total(inspetor_id),
+            'vencidos': index.count(last_day=today - 1, inspetor_id=inspetor_id),
+            'vencendo': index.count(today, today + warning_days, inspetor_id=inspetor_id),
+        }
+
+def deadline_counts_by_inspector(warning_days=DEADLINE_WARNING_DAYS):
+    """deadline_counts() de cada inspetor com processos em andamento, em uma única consulta ao índice."""
+    today = _today_key()
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        index = _deadline_index(cache)
+        return {
+            inspetor: {
+                'em_andamento': index.total(inspetor),
+                'vencidos': index.count(last_day=today - 1, inspetor_id=inspetor),
+                'vencendo': index.count(today, today + warning_days, inspetor_id=inspetor),
+            }
+            for inspetor, keys in index.by_inspector.items() if keys
+        }
+
+def due_processes(first_day=None, last_day=None, inspetor_id=None):
+    """IDs dos processos em andamento com prazo efetivo entre hoje+first_day e hoje+last_day, por prazo.
+
+    Os limites são dias relativos a hoje (inclusive) e None deixa o intervalo aberto:
+    due_processes(last_day=-1) são os vencidos; due_processes(0, 7), os que vencem na semana.
+    """
+    inspetor_id = _allowed_inspector(inspetor_id)
+    today = _today_key()
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        return _deadline_index(cache).ids(
+            None if first_day is None else today + first_day,
+            None if last_day is None else today + last_day,
+            inspetor_id=inspetor_id,
+        )
+
+
+# --- 5. FILA DE GRAVAÇÃO (WRITE-BEHIND) ---
+# As páginas enfileiram as alterações e seguem imediatamente; uma thread em segundo plano
+# agrupa as mutações pendentes e as grava em lote a cada FLUSH_INTERVAL segundos
+# ou assim que FLUSH_MAX_OPS mutações se acumulam.
+FLUSH_INTERVAL = 0.5
+FLUSH_MAX_OPS = 50
+# Espera máxima (em segundos) entre novas tentativas após uma falha de gravação
+FLUSH_RETRY_MAX = 30
+# Processos renumerados na gravação (número já usado por outra réplica) avisados na barra lateral
+RENUMBERED_SHOWN = 20
+
+
+def _coalesce(mutations, merge=True):
+    """Agrupa mutações em (registros novos, atualizações, eventos), mantendo a última alteração de cada célula.
+
+    Cada grupo leva as mutações que o compõem: [(registro, mutações)], {ID: (alterações,
+    mutações)} e [(evento, [mutação])]. Com 'merge', as alterações em um registro ainda
+    não gravado entram no próprio registro.
+    """
+    appends, updates, events = {}, {}, []
+    for mutation in mutations:
+        if mutation['kind'] == 'event':
+            events.append((mutation['event'], [mutation]))
+        elif mutation['kind'] == 'append':
+            # O registro leva o identificador da operação, que torna seu reenvio idempotente
+            appends[mutation['id']] = ({**mutation['record'], 'op_id': mutation['op_id']}, [mutation])
+        elif merge and mutation['id'] in appends:
+            record, group = appends[mutation['id']]
+            record.update(mutation['changes'])
+            group.append(mutation)
+        else:
+            changes, group = updates.setdefault(mutation['id'], ({}, []))
+            changes.update(mutation['changes'])
+            group.append(mutation)
+    return list(appends.values()), updates, events
+
+def _is_permanent(error):
+    """Erro que repetir a gravação não resolve (ex.: processo inexistente, coluna inválida)."""
+    # Os erros de rede do 'requests' derivam de OSError, inclusive os de JSON (que derivam também de ValueError)
+    return isinstance(error, (ValueError, TypeError)) and not isinstance(error, OSError)
+
+def _describe_mutation(mutation):
+    if mutation['kind'] == 'append':
+        return "novo processo"
+    if mutation['kind'] == 'event':
+        return f"histórico ({mutation['event'].get('tipo')})"
+    return f"alteração de {', '.join(mutation['changes'])}"
+
+
+class _WriteJournal:
+    """Diário local das mutações ainda não confirmadas pelo backend (SQLite em modo WAL).
+
+    Cada mutação é gravada em disco (fsync) antes de a página seguir: sem conexão, ou se
+    o servidor reiniciar, nada se perde, e a fila reenvia tudo quando o backend responder.
+    'destino' identifica o backend, para que um diário nunca seja enviado a outro.
+    As mutações recusadas pelo backend passam para a tabela 'falhas' e não são reenviadas.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS operacoes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            op_id TEXT NOT NULL UNIQUE,
+            destino TEXT NOT NULL,
+            mutacao TEXT NOT NULL,
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            criada_em TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS falhas (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            op_id TEXT NOT NULL UNIQUE,
+            destino TEXT NOT NULL,
+            mutacao TEXT NOT NULL,
+            erro TEXT NOT NULL,
+            criada_em TEXT NOT NULL,
+            falhou_em TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path, destino):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.destino = destino
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            # Cada gravação só é confirmada depois de chegar ao disco
+            self.conn.execute("PRAGMA synchronous=FULL")
+            self.conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _payload(mutation):
+        payload = {key: value for key, value in mutation.items() if key not in ('op_id', 'attempts')}
+        return json.dumps(payload, default=normalize_value, ensure_ascii=False)
+
+    def append(self, mutation):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO operacoes (op_id, destino, mutacao, criada_em) VALUES (?, ?, ?, ?)",
+                (mutation['op_id'], self.destino, self._payload(mutation), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+
+    def unsent(self):
+        """Mutações registradas e ainda não confirmadas, na ordem em que foram feitas."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT op_id, mutacao, tentativas FROM operacoes WHERE destino = ? ORDER BY seq", (self.destino,)
+            ).fetchall()
+        return [{**json.loads(payload), 'op_id': op_id, 'attempts': attempts} for op_id, payload, attempts in rows]
+
+    def mark_attempt(self, op_ids):
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE operacoes SET tentativas = tentativas + 1 WHERE op_id = ?", [(i,) for i in op_ids])
+
+    def rewrite(self, mutations):
+        """Regrava as mutações alteradas depois de registradas (ex.: processo renumerado)."""
+        with self.lock, self.conn:
+            self.conn.executemany("UPDATE operacoes SET mutacao = ? WHERE op_id = ?",
+                                  [(self._payload(m), m['op_id']) for m in mutations])
+
+    def remove(self, op_ids):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM operacoes WHERE op_id = ?", [(i,) for i in op_ids])
+
+    def fail(self, mutations, error):
+        """Passa as mutações para a tabela de falhas, com o erro que o backend devolveu."""
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO falhas (op_id, destino, mutacao, erro, criada_em, falhou_em) "
+                "SELECT op_id, destino, mutacao, ?, criada_em, ? FROM operacoes WHERE op_id = ?",
+                [(str(error), now, m['op_id']) for m in mutations]
+            )
+            self.conn.executemany("DELETE FROM operacoes WHERE op_id = ?", [(m['op_id'],) for m in mutations])
+
+    def failed(self):
+        """Mutações recusadas pelo backend, da mais antiga à mais recente."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT op_id, mutacao, erro, falhou_em FROM falhas WHERE destino = ? ORDER BY seq", (self.destino,)
+            ).fetchall()
+        return [{**json.loads(payload), 'op_id': op_id, 'error': erro, 'failed_at': falhou_em}
+                for op_id, payload, erro, falhou_em in rows]
+
+    def discard_failed(self, op_ids):
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM falhas WHERE op_id = ?", [(i,) for i in op_ids])
+
+
+class _WriteBehindQueue:
+    """Fila de mutações pendentes, gravadas em lote no backend por uma thread dedicada.
+
+    Com um diário ('journal'), as mutações sobrevivem a falhas de conexão e reinícios:
+    as que ficaram no diário voltam para a fila ao criá-la.
+    """
+
+    def __init__(self, store, cache, journal=None):
+        self.store = store
+        self.cache = cache
+        self.journal = journal
+        self.cond = threading.Condition()
+        self.pending = journal.unsent() if journal is not None else []
+        self.in_flight = []
+        self.flush_lock = threading.Lock()
+        self.last_error = None
+        self.failures = 0
+        # Mutações recusadas pelo backend (não voltam à fila) e o último erro que as recusou
+        self.failed = journal.failed() if journal is not None else []
+        self.rejected = 0
+        self.last_rejection = None
+        # Processos gravados com outro número: [(ID provisório, ID gravado, inspetor)]
+        self.renumbered = []
+        self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self.thread.start()
+
+    def put(self, mutation):
+        # A mutação só entra na fila depois de gravada no diário local
+        if self.journal is not None:
+            self.journal.append(mutation)
+        with self.cond:
+            self.pending.append(mutation)
+            self.cond.notify()
+
+    def unsent(self):
+        """Mutações ainda não confirmadas pelo backend, na ordem em que foram feitas."""
+        with self.cond:
+            return self.in_flight + self.pending
+
+    def count(self):
+        with self.cond:
+            return len(self.in_flight) + len(self.pending)
+
+    def pending_ids(self):
+        """IDs dos processos com alterações ainda não confirmadas pelo backend."""
+        with self.cond:
+            return {mutation['id'] for mutation in self.in_flight + self.pending}
+
+    def failed_ids(self):
+        """IDs dos processos com alterações recusadas pelo backend."""
+        with self.cond:
+            return {mutation['id'] for mutation in self.failed}
+
+    def discard_failed(self):
+        """Esquece as mutações recusadas (depois de conferidas por quem administra o app)."""
+        with self.cond:
+            op_ids, self.failed = [m['op_id'] for m in self.failed], []
+        if self.journal is not None:
+            self.journal.discard_failed(op_ids)
+
+    def _write(self, write, groups, written, rejected):
+        """Grava os grupos [(dado, mutações)] em uma única chamada write([dados]); devolve os resultados.
+
+        Num erro permanente, os grupos são gravados um a um, e só os recusados vão para
+        'rejected' ([(mutações, erro)]); os gravados entram em 'written' (op_id). Erros
+        passageiros são propagados, e o que não foi gravado volta à fila.
+        """
+        if not groups:
+            return []
+        try:
+            result = write([data for data, _ in groups])
+        except Exception as e:
+            if not _is_permanent(e):
+                raise
+            if len(groups) == 1:
+                rejected.append((groups[0][1], e))
+                return []
+            return [result for group in groups for result in self._write(write, [group], written, rejected)]
+        written.update(mutation['op_id'] for _, mutations in groups for mutation in mutations)
+        return [result]
+
+    def _renumber(self, renumbered, batch):
+        """Passa as mutações de cada registro para o número com que ele foi gravado ({ID pedido: ID gravado}).
+
+        Outro registro ainda na fila com um dos números recebidos ganha um novo número
+        provisório, para que suas mutações não se misturem às do registro renumerado.
+        Os anexos enviados com o número antigo acompanham o processo.
+        """
+        with self.cond:
+            queued = batch + self.pending
+            # As mutações de cada registro são separadas antes de qualquer troca de número
+            moves = [(old_id, new_id, [m for m in queued if m['id'] == old_id]) for old_id, new_id in renumbered.items()]
+            moving = {id(m) for _, _, group in moves for m in group}
+            last = max([new_id for _, new_id, _ in moves] + [m['id'] for m in queued])
+            for new_id in renumbered.values():
+                clashing = [m for m in queued if m['id'] == new_id and id(m) not in moving]
+                if clashing:
+                    last += 1
+                    moves.append((new_id, last, clashing))
+            for old_id, new_id, group in moves:
+                for mutation in group:
+                    mutation['id'] = new_id
+                    if mutation['kind'] == 'append':
+                        mutation['record']['ID'] = new_id
+                        self.renumbered.append((old_id, new_id, mutation['record'].get('inspetor_id')))
+                    elif mutation['kind'] == 'event':
+                        mutation['event']['ID'] = new_id
+            del self.renumbered[:-RENUMBERED_SHOWN]
+
+        if self.journal is not None:
+            self.journal.rewrite([m for _, _, group in moves for m in group])
+        for old_id, new_id, group in moves:
+            hashes = [sha256 for mutation in group for sha256 in mutation.get('anexos', ())]
+            if hashes:
+                get_attachment_store().move(hashes, old_id, new_id)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                # Espera mais mutações até completar o intervalo ou o tamanho máximo do lote
+                deadline = time.monotonic() + FLUSH_INTERVAL
+                while len(self.pending) < FLUSH_MAX_OPS and time.monotonic() < deadline:
+                    self.cond.wait(deadline - time.monotonic())
+            if not self.flush():
+                time.sleep(min(FLUSH_RETRY_MAX, 2 ** self.failures))
+
+    def flush(self):
+        """Grava em lote as mutações pendentes. Retorna False se a gravação falhar e elas voltarem à fila.
+
+        Registros novos, atualizações e eventos seguem cada um em uma chamada. Uma falha
+        passageira (conexão, cota) devolve à fila o que ainda não foi gravado; um erro
+        permanente (ex.: processo já arquivado) faz o grupo ser gravado mutação a mutação,
+        e só as recusadas vão para a lista de falhas, sem bloquear as demais.
+        """
+        with self.flush_lock:
+            with self.cond:
+                batch, self.pending = self.pending, []
+                self.in_flight = batch
+            if not batch:
+                return True
+
+            # Repetição de um lote: a tentativa anterior pode ter sido aplicada antes da falha
+            retried = any(mutation.get('attempts') for mutation in batch)
+            for mutation in batch:
+                mutation['attempts'] = mutation.get('attempts', 0) + 1
+            written, rejected, renumbered = set(), [], {}
+            error = None
+            try:
+                if self.journal is not None:
+                    self.journal.mark_attempt([mutation['op_id'] for mutation in batch])
+                with span("fila de gravação (flush)"):
+                    # Na repetição, as alterações não entram no registro novo: se ele já
+                    # estiver gravado, elas ainda seguem como atualizações
+                    appends, _, _ = _coalesce(batch, merge=not retried)
+                    for result in self._write(partial(self.store.append_many, replay=retried), appends, written, rejected):
+                        renumbered.update(result)
+                    if renumbered:
+                        self._renumber(renumbered, batch)
+
+                    # Atualizações e eventos seguem com o número definitivo dos registros
+                    done = written | {m['op_id'] for mutations, _ in rejected for m in mutations}
+                    _, updates, events = _coalesce([m for m in batch if m['op_id'] not in done])
+                    self._write(lambda items: self.store.update_many(dict(items)),
+                                [((inspection_id, changes), mutations) for inspection_id, (changes, mutations) in updates.items()],
+                                written, rejected)
+                    if retried and events:
+                        applied = self.store.applied_event_ops([event['op_id'] for event, _ in events])
+                        written.update(applied)
+                        events = [(event, mutations) for event, mutations in events if event['op_id'] not in applied]
+                    self._write(self.store.append_events, events, written, rejected)
+            except Exception as e:
+                error = e
+            return self._settle(batch, written, rejected, bool(renumbered), error)
+
+    def _settle(self, batch, written, rejected, resync, error):
+        """Tira do diário o que foi gravado, registra as recusas e devolve à fila o restante."""
+        if self.journal is not None:
+            try:
+                self.journal.remove(sorted(written))
+                for mutations, e in rejected:
+                    self.journal.fail(mutations, e)
+            except Exception as e:
+                # O que ficou no diário é reenviado após um reinício, sem duplicar (ver op_id)
+                error = error or e
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        failed = [{**m, 'error': str(e), 'failed_at': now} for mutations, e in rejected for m in mutations]
+        done = written | {m['op_id'] for m in failed}
+        with self.cond:
+            self.pending = [m for m in batch if m['op_id'] not in done] + self.pending
+            self.in_flight = []
+            self.failed.extend(failed)
+            if rejected:
+                self.rejected += len(rejected)
+                self.last_rejection = rejected[-1][1]
+            if error is not None:
+                self.last_error = error
+                self.failures += 1
+            else:
+                self.last_error = None
+                self.failures = 0
+
+        if rejected or resync:
+            # O cache tem mutações recusadas ou números provisórios: a próxima leitura relê tudo
+            with self.cache.lock:
+                self.cache.loaded_at = float('-inf')
+                self.cache.checked_at = float('-inf')
+        elif written:
+            # O cache já contém as alterações: a versão resultante não deve disparar uma releitura
+            try:
+                version = self.store.version()
+            except Exception:
+                # Sem a versão, a próxima sincronização relê os dados
+                version = None
+            with self.cache.lock:
+                if self.cache.df is not None and version is not None:
+                    self.cache.version = version
+                    self.cache.checked_at = time.monotonic()
+        if written:
+            _broadcast_change()
+        return error is None
+
+
+def _journal_destination():
+    if STORAGE_BACKEND == "sqlite":
+        return f"sqlite:{os.path.abspath(SQLITE_PATH)}"
+    return f"{STORAGE_BACKEND}:{SHEETS_URL}"
+
+@st.cache_resource
+def _get_write_queue():
+    # O diário acompanha apenas o backend configurado: um backend definido com set_store
+    # (benchmarks, testes) não recebe nem grava mutações do diário
+    journal = _WriteJournal(WRITE_JOURNAL_PATH, _journal_destination()) if _store_override is None else None
+    return _WriteBehindQueue(get_store(), _get_data_cache(), journal)
+
+def _enqueue(mutation):
+    """Grava a mutação no diário local, aplica-a ao cache e a coloca na fila de gravação.
+
+    Cada mutação recebe um identificador de operação ('op_id'), gerado aqui, que torna
+    seu reenvio ao backend idempotente.
+    """
+    mutation['op_id'] = uuid.uuid4().hex
+    if mutation['kind'] == 'event':
+        mutation['event']['op_id'] = mutation['op_id']
+    cache = _get_data_cache()
+    # Cache e fila são atualizados juntos: uma releitura concorrente reaplica a mutação
+    with cache.lock:
+        _get_write_queue().put(mutation)
+        if cache.df is not None:
+            start = len(cache.df)
+            cache.df = _apply_mutation(cache.df, mutation, cache.summary)
+            if mutation['kind'] == 'append':
+                _index_new_rows(cache, start)
+            elif mutation['kind'] == 'update':
+                _index_updated_row(cache, mutation['id'], mutation['changes'])
+            cache.generation += 1
+        if mutation['kind'] == 'event' and mutation['event']['tipo'] in SEARCH_EVENT_KINDS:
+            cache.search_events.append(mutation['event'])
+
+def queue_inspection(record):
+    """Enfileira um novo registro; ele aparece imediatamente nos dados e é gravado em segundo plano.
+
+    Sem 'ID', o registro recebe o próximo número livre pelos dados deste servidor, reservado
+    sob o mesmo bloqueio que o acrescenta ao cache (duas sessões simultâneas não recebem o
+    mesmo número). O cache é sincronizado antes: com o cache ainda vazio o número seguiria
+    só a fila. Retorna o ID do registro, que é provisório: se outra réplica gravar o mesmo
+    número antes, o registro é gravado com o próximo livre.
+    """
+    record = dict(record)
+    cache = _get_data_cache()
+    with cache.lock:
+        if record.get('ID') is None:
+            _sync_cache(cache)
+            record['ID'] = next_inspection_id()
+        inspection_id = int(normalize_value(record['ID']))
+        _enqueue({'kind': 'append', 'id': inspection_id, 'record': record})
+    return inspection_id
+
+def queue_update(inspection_id, changes):
+    """Enfileira a alteração das colunas informadas (conclusão, prazo da Coordenação, comentários)."""
+    unknown = [col for col in changes if col not in COLUMNS or col == 'ID']
+    if unknown:
+        raise ValueError(f"Colunas inválidas para atualização: {unknown}")
+    _enqueue({'kind': 'update', 'id': int(normalize_value(inspection_id)), 'changes': dict(changes)})
+
+def queue_event(inspection_id, tipo, texto, anexos=None):
+    """Registra um evento no histórico do processo (uma linha nova, sem reescrever os anteriores).
+
+    'tipo' identifica o evento (ex.: 'comentário', 'prazo', 'conclusão'); autor e perfil
+    são os do usuário logado. 'anexos' são os SHA-256 dos arquivos de um evento 'anexo',
+    que acompanham o processo se ele for gravado com outro número.
+    """
+    event = {
+        'ID': int(inspection_id),
+        'autor': st.session_state.get('username'),
+        'perfil': st.session_state.get('role'),
+        'data_hora': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'tipo': tipo,
+        'texto': texto,
+    }
+    mutation = {'kind': 'event', 'id': int(inspection_id), 'event': event}
+    if anexos:
+        mutation['anexos'] = list(anexos)
+    _enqueue(mutation)
+
+def pending_writes():
+    """Número de mutações ainda não confirmadas pelo backend."""
+    return _get_write_queue().count()
+
+SYNC_LABELS = {True: "⏳ Aguardando envio", False: "✅ Sincronizado"}
+SYNC_FAILED_LABEL = "❌ Não gravado"
+
+def sync_status(inspection_ids):
+    """Situação de envio de cada processo: {ID: 'Aguardando envio', 'Sincronizado' ou 'Não gravado'}."""
+    queue = _get_write_queue()
+    pending, failed = queue.pending_ids(), queue.failed_ids()
+    return {int(i): SYNC_FAILED_LABEL if int(i) in failed and int(i) not in pending else SYNC_LABELS[int(i) in pending]
+            for i in inspection_ids}
+
+def flush_writes():
+    """Grava imediatamente as mutações pendentes. Retorna False se a gravação falhar (elas continuam na fila)."""
+    return _get_write_queue().flush()
+
+def _flush_or_raise():
+    queue = _get_write_queue()
+    rejected = queue.rejected
+    if not queue.flush():
+        # A mutação continua na fila e será gravada na próxima tentativa
+        raise queue.last_error
+    if queue.rejected != rejected:
+        # Recusada pelo backend: está na lista de falhas e não será reenviada
+        raise queue.last_rejection
+
+def show_write_status():
+    """Mostra na barra lateral as alterações aguardando gravação, as recusadas e os processos renumerados."""
+    queue = _get_write_queue()
+    pending = queue.count()
+    if pending:
+        st.sidebar.caption(f"💾 Salvando… ({pending} alteração(ões) guardada(s) neste servidor, aguardando envio)")
+    if queue.last_error is not None:
+        st.sidebar.warning(f"Falha ao gravar alterações; nova tentativa automática em breve. Erro: {queue.last_error}")
+
+    role, username = st.session_state.get('role'), st.session_state.get('username')
+    for old_id, new_id, inspetor in queue.renumbered:
+        if role != 'inspetor' or inspetor == username:
+            st.sidebar.info(f"O processo {old_id} foi gravado com o número **{new_id}** (o {old_id} já tinha sido usado em outro servidor).")
+
+    if queue.failed:
+        with st.sidebar.expander(f"⚠️ {len(queue.failed)} alteração(ões) recusada(s) pelo backend"):
+            st.dataframe(
+                pd.DataFrame([{'ID': m['id'], 'alteração': _describe_mutation(m), 'erro': m['error'], 'data_hora': m['failed_at']}
+                              for m in queue.failed]),
+                hide_index=True, use_container_width=True
+            )
+            st.caption("Estas alterações não serão reenviadas (ex.: o processo foi arquivado ou removido). Refaça-as se ainda forem necessárias.")
+            if role in ('coordenador', 'gerencia') and st.button("Descartar a lista", key="descartar_falhas"):
+                queue.discard_failed()
+                st.rerun()
+
+
+# --- 6. TABELAS DE PROCESSOS PAGINADAS ---
+PAGE_SIZE_OPTIONS = [25, 50, 100, 200]
+SORT_OPTIONS = {
+    "prazo": "Prazo",
+    "prazo_retorno_inspetor": "Prazo Inspetor",
+    "prazo_retorno_coord": "Prazo Coord.",
+    "data_inspecao": "Data da Inspeção",
+    "ID": "ID",
+    "estabelecimento": "Estabelecimento",
+    "inspetor_id": "Inspetor",
+}
+# Destaque das linhas com prazo vencido (vermelho claro) ou vencendo (laranja claro)
+ROW_HIGHLIGHT = {'red': 'background-color: #FFDDDD', 'orange': 'background-color: #FFF2CC'}
+
+def _style_status(row):
+    """Estilo da linha (alerta visual) conforme a cor do prazo."""
+    return [ROW_HIGHLIGHT.get(row['cor'], '')] * len(row)
+
+def _sorted_positions(df, sort_by, ascending, filter_key, key):
+    """Posições das linhas de 'df' na ordem pedida, guardadas na sessão.
+
+    A ordenação só é refeita quando mudam os dados, os filtros ou a ordem; trocar de
+    página apenas fatia as posições já calculadas.
+    """
+    signature = (data_version(), filter_key, len(df), sort_by, ascending)
+    cached = st.session_state.get(f"{key}_ordem")
+    if cached is None or cached[0] != signature:
+        if sort_by == "prazo":
+            order = _deadline_positions(df, ascending)
+        else:
+            order = (df[[sort_by]].reset_index(drop=True)
+                     .sort_values(sort_by, ascending=ascending, na_position='last', kind='stable')
+                     .index.to_numpy())
+        cached = (signature, order)
+        st.session_state[f"{key}_ordem"] = cached
+    return cached[1]
+
+def _deadline_positions(df, ascending):
+    """Posições das linhas de 'df' por prazo efetivo, na ordem já mantida pelo índice de prazos.
+
+    Processos fora do índice (concluídos, arquivados ou sem prazo) ficam no fim, na ordem de 'df'.
+    """
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        keys = _deadline_index(cache).keys
+        # Os sem prazo ficam no fim da lista do índice e também no fim da ordem decrescente
+        split = bisect_left(keys, (_DeadlineIndex.NO_DEADLINE,))
+        dated = [inspection_id for _, inspection_id in keys[:split]]
+        ids = (dated if ascending else dated[::-1]) + [inspection_id for _, inspection_id in keys[split:]]
+    positions = pd.Index(df['ID']).get_indexer_for(ids)
+    positions = positions[positions >= 0]
+    rest = np.ones(len(df), dtype=bool)
+    rest[positions] = False
+    return np.concatenate([positions, np.flatnonzero(rest)])
+
+@timed("show_process_table")
+def show_process_table(df, column_config, key, filter_key=()):
+    """Mostra a tabela de processos paginada.
+
+    'df' já deve estar filtrado; 'filter_key' identifica os filtros aplicados. O status do
+    prazo ('status_prazo'/'cor') é calculado, estilizado e enviado ao navegador apenas para
+    as linhas da página visível, que são devolvidas (ex.: para as ações sobre elas).
+    """
+    col_sort, col_dir, col_size, col_page = st.columns([2, 1, 1, 1])
+    sort_by = col_sort.selectbox("Ordenar por", list(SORT_OPTIONS), format_func=SORT_OPTIONS.get, key=f"{key}_sort_by")
+    ascending = col_dir.selectbox("Ordem", ["Crescente", "Decrescente"], key=f"{key}_sort_dir") == "Crescente"
+    page_size = col_size.selectbox("Linhas por página", PAGE_SIZE_OPTIONS, key=f"{key}_page_size")
+
+    n_pages = max(1, math.ceil(len(df) / page_size))
+    # Se os filtros reduziram o número de páginas, volta para a primeira
+    if st.session_state.get(f"{key}_page", 1) > n_pages:
+        st.session_state[f"{key}_page"] = 1
+    page = col_page.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, step=1, key=f"{key}_page")
+
+    order = _sorted_positions(df, sort_by, ascending, filter_key, key)
+    start = (page - 1) * page_size
+    window = df.iloc[order[start:start + page_size]]
+    # Status do prazo e situação de envio ao backend, calculados só para as linhas visíveis
+    window = window.join(classify_deadlines(window))
+    window = window.assign(sincronizacao=window['ID'].map(sync_status(window['ID'])))
+
+    st.dataframe(
+        window.style.apply(_style_status, axis=1),
+        use_container_width=True,
+        column_config={**column_config, "cor": None, "sincronizacao": st.column_config.Column("Envio")},
+        hide_index=True
+    )
+    if len(df):
+        st.caption(f"Exibindo {start + 1}–{start + len(window)} de {len(df)} processos.")
+    return window
+
+
+# --- 7. HISTÓRICO DE EVENTOS DOS PROCESSOS ---
+EVENTS_PAGE_SIZE = 10
+EVENT_KINDS = {"criação": "🆕", "comentário": "💬", "prazo": "📅", "conclusão": "✅", "anexo": "📎"}
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _count_events(inspection_id, versao):
+    """Eventos gravados do processo; consultado de novo só quando os dados mudam ('versao', de data_version)."""
+    return get_store().count_events(inspection_id)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _load_events_page(inspection_id, offset, limit, total):
+    """Página de eventos lida do backend; o histórico só recebe inserções, então a página só
+    muda quando o processo ganha eventos ('total')."""
+    return get_store().load_events(inspection_id, offset=offset, limit=limit)
+
+def get_events(inspection_id, page=1, page_size=EVENTS_PAGE_SIZE):
+    """Eventos de um processo, do mais recente ao mais antigo: (DataFrame da página, total).
+
+    Eventos ainda na fila de gravação aparecem no topo; só a página pedida é lida do backend.
+    """
+    inspection_id = int(inspection_id)
+    pending = [m['event'] for m in _get_write_queue().unsent() if m['kind'] == 'event' and m['id'] == inspection_id][::-1]
+    offset = (page - 1) * page_size
+    head = pending[offset:offset + page_size]
+
+    stored, total = _load_events_page(inspection_id, max(0, offset - len(pending)), page_size - len(head),
+                                      _count_events(inspection_id, data_version()))
+    page_df = pd.concat([pd.DataFrame(head, columns=EVENT_COLUMNS), stored], ignore_index=True) if head else stored
+    return page_df, total + len(pending)
+
+def show_event_history(inspection_id, key):
+    """Mostra o histórico paginado de eventos do processo."""
+    page_key = f"{key}_{inspection_id}"
+    events, total = get_events(inspection_id, page=st.session_state.get(page_key, 1))
+    total_pages = max(1, math.ceil(total / EVENTS_PAGE_SIZE))
+    if st.session_state.get(page_key, 1) > total_pages:
+        st.session_state[page_key] = 1
+        events, total = get_events(inspection_id)
+    if not total:
+        st.caption("Nenhum evento registrado para este processo.")
+        return
+
+    events = events.assign(tipo=events['tipo'].map(lambda t: f"{EVENT_KINDS.get(t, '•')} {t}"))
+    st.dataframe(
+        events[["data_hora", "autor", "perfil", "tipo", "texto"]],
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "data_hora": st.column_config.Column("Data/Hora"),
+            "autor": st.column_config.Column("Autor"),
+            "perfil": st.column_config.Column("Perfil"),
+            "tipo": st.column_config.Column("Tipo"),
+            "texto": st.column_config.Column("Texto", width="large"),
+        }
+    )
+    # Trocar de página relê apenas a fatia seguinte do histórico
+    st.number_input(f"Página do histórico (de {total_pages}, {total} evento(s))", min_value=1, max_value=total_pages, step=1, key=page_key)
+
+
+# --- 8. AGENDADOR DE REQUISIÇÕES À API (COTA DO GOOGLE SHEETS) ---
+# Cota por minuto da Sheets API para a conta de serviço; leituras e gravações têm cotas separadas
+SHEETS_QUOTA_PER_MINUTE = int(_get_secret("sheets_quota_per_minute", 60))
+# Recusas por cota (429) e falhas temporárias (5xx) são repetidas com espera exponencial e aleatória
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 16.0
+
+class _TokenBucket:
+    """Balde de fichas: permite rajadas de até 'per_minute' requisições e repõe as fichas no ritmo da cota."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Reserva uma ficha e devolve quantos segundos esperar por ela (0 se já disponível).
+
+        O saldo pode ficar negativo: cada chamada recebe o próximo horário livre, e as
+        requisições são atendidas na ordem em que chegaram.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def available(self):
+        with self.lock:
+            return min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate)
+
+class _Flight:
+    """Leitura em andamento, compartilhada pelas sessões que pedirem a mesma requisição."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+class _RequestScheduler:
+    """Por aqui passa toda requisição do cliente gspread, de todas as sessões deste processo.
+
+    - cota: um balde de fichas para leituras e outro para gravações da Sheets API;
+    - novas tentativas: 429 e 5xx com espera exponencial e aleatória (5xx só em
+      requisições que podem ser repetidas sem efeito duplicado, como leituras e
+      gravações de valores em células fixas; um 'append' nunca é repetido após 5xx);
+    - coalescência: leituras idênticas simultâneas compartilham uma única requisição.
+    """
+
+    def __init__(self, per_minute):
+        self.buckets = {'leitura': _TokenBucket(per_minute), 'gravação': _TokenBucket(per_minute)}
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.waiting = 0
+        self.max_waiting = 0
+        self.wait_seconds = 0.0
+        self.counts = Counter()
+
+    def install(self, client):
+        """Passa as requisições HTTP do cliente gspread pelo agendador."""
+        http_client = getattr(client, 'http_client', None)
+        if http_client is None or getattr(http_client, '_scheduled', False):
+            return client
+        send = http_client.request
+
+        def scheduled_request(method, endpoint, **kwargs):
+            return self.request(send, method, endpoint, **kwargs)
+
+        http_client.request = scheduled_request
+        http_client._scheduled = True
+        return client
+
+    @staticmethod
+    def _is_read(method, endpoint):
+        return method == 'GET' or endpoint.endswith('values:batchGet')
+
+    @staticmethod
+    def _is_repeatable(method, endpoint):
+        # Gravações de valores em intervalos fixos dão o mesmo resultado se repetidas
+        return method in ('GET', 'PUT') or endpoint.endswith(('values:batchGet', 'values:batchUpdate', 'values:batchClear'))
+
+    def _bucket(self, method, endpoint):
+        # Outras APIs (ex.: a consulta de versão no Drive) têm cotas próprias, bem maiores
+        if 'sheets.googleapis.com' not in endpoint:
+            return None
+        return self.buckets['leitura' if self._is_read(method, endpoint) else 'gravação']
+
+    def request(self, send, method, endpoint, **kwargs):
+        method = method.upper()
+        if method != 'GET':
+            return self._send(send, method, endpoint, kwargs)
+
+        key = (endpoint, repr(sorted((kwargs.get('params') or {}).items())))
+        with self.lock:
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[key] = _Flight()
+            else:
+                self.counts['coalescidas'] += 1
+        if not leader:
+            return flight.wait()
+        try:
+            flight.response = self._send(send, method, endpoint, kwargs)
+            return flight.response
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            flight.done.set()
+
+    def _wait_for_token(self, bucket):
+        delay = bucket.reserve()
+        if delay <= 0:
+            return
+        with self.lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            self.counts['aguardaram a cota'] += 1
+            self.wait_seconds += delay
+        try:
+            with span("cota da API (espera)"):
+                time.sleep(delay)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def _send(self, send, method, endpoint, kwargs):
+        import requests
+        from gspread.exceptions import APIError
+        bucket = self._bucket(method, endpoint)
+        repeatable = self._is_repeatable(method, endpoint)
+        for attempt in range(MAX_RETRIES + 1):
+            if bucket is not None:
+                self._wait_for_token(bucket)
+            try:
+                response = send(method, endpoint, **kwargs)
+                with self.lock:
+                    self.counts['requisições'] += 1
+                return response
+            except APIError as e:
+                status = getattr(e.response, 'status_code', e.code)
+                with self.lock:
+                    self.counts['requisições'] += 1
+                    if status == 429:
+                        self.counts['recusadas pela cota (429)'] += 1
+                if status not in RETRY_STATUS or (status != 429 and not repeatable) or attempt == MAX_RETRIES:
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                if not repeatable or attempt == MAX_RETRIES:
+                    raise
+            with self.lock:
+                self.counts['novas tentativas'] += 1
+            # Espera exponencial com variação aleatória, para que as sessões não repitam juntas
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+            with span("cota da API (nova tentativa)"):
+                time.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                'na fila': self.waiting,
+                'pico da fila': self.max_waiting,
+                'leituras em andamento': len(self.in_flight),
+                'espera total (s)': round(self.wait_seconds, 1),
+            }
+            stats.update(self.counts)
+        for name, bucket in self.buckets.items():
+            stats[f'fichas de {name}'] = round(bucket.available(), 1)
+        return stats
+
+@st.cache_resource
+def _get_request_scheduler():
+    # Compartilhado por todas as sessões e mantido quando o cliente é recriado (ttl do cliente)
+    return _RequestScheduler(SHEETS_QUOTA_PER_MINUTE)
+
+def api_quota_status():
+    """Fila, recusas por cota, novas tentativas e leituras coalescidas do agendador de requisições."""
+    return _get_request_scheduler().stats()
+
+
+# --- 9. ANEXOS DOS PROCESSOS (FOTOS E DOCUMENTOS) ---
+@st.cache_resource
+def get_attachment_store():
+    # Pillow só é carregado quando uma página usa anexos
+    from attachments import AttachmentStore
+    return AttachmentStore(ATTACHMENTS_PATH)
+
+def save_attachments(inspection_id, files):
+    """Grava os arquivos enviados (st.file_uploader) como anexos do processo e registra no histórico."""
+    files = [f for f in (files or []) if f is not None]
+    if not files:
+        return []
+    store = get_attachment_store()
+    autor = st.session_state.get('username')
+    hashes = [store.add(inspection_id, f, f.name, mime=f.type, autor=autor) for f in files]
+    queue_event(inspection_id, "anexo", f"{len(files)} arquivo(s) anexado(s): {', '.join(f.name for f in files)}", anexos=hashes)
+    return hashes
+
+def list_attachments(inspection_id):
+    """Anexos do processo (nome, tipo, tamanho, autor, data); os arquivos em si não são lidos."""
+    return get_attachment_store().list(inspection_id)
+
+def _format_size(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def show_attachments(inspection_id, key):
+    """Lista os anexos do processo; miniaturas e downloads só são carregados quando pedidos."""
+    from attachments import is_image
+    attachments = list_attachments(inspection_id)
+    if attachments.empty:
+        st.caption("Nenhum anexo neste processo.")
+        return
+
+    st.dataframe(
+        attachments.assign(tamanho=attachments['tamanho'].map(_format_size))[["nome", "tipo", "tamanho", "autor", "data_hora"]],
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "nome": st.column_config.Column("Arquivo", width="large"),
+            "tipo": st.column_config.Column("Tipo"),
+            "tamanho": st.column_config.Column("Tamanho"),
+            "autor": st.column_config.Column("Enviado por"),
+            "data_hora": st.column_config.Column("Data/Hora"),
+        }
+    )
+    if not st.toggle("Mostrar miniaturas e downloads", key=f"{key}_{inspection_id}"):
+        return
+
+    store = get_attachment_store()
+    columns = st.columns(4)
+    for n, row in enumerate(attachments.itertuples(index=False)):
+        with columns[n % 4]:
+            thumbnail = store.thumbnail(row.sha256) if is_image(row.tipo) else None
+            if thumbnail is not None:
+                st.image(thumbnail, caption=row.nome)
+            else:
+                st.caption(f"📄 {row.nome}")
+            # O arquivo só é lido do disco quando o download é clicado
+            st.download_button(
+                "Baixar", data=partial(store.read, row.sha256), file_name=row.nome, mime=row.tipo or None,
+                key=f"{key}_{inspection_id}_{row.sha256}", on_click="ignore"
+            )
+
+
+# --- 10. ESTABELECIMENTOS (ÍNDICE POR CNPJ) ---
+CNPJ_WEIGHTS = ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+
+def _normalize_cnpjs(values):
+    """normalize_cnpj aplicada a um array de valores, com a validação vetorizada."""
+    digits = pd.Series(values, dtype=object).astype(str).str.replace(r'[^0-9]', '', regex=True)
+    result = np.full(len(digits), None, dtype=object)
+    candidates = np.flatnonzero((digits.str.len() == 14).to_numpy())
+    if not len(candidates):
+        return result
+    text = digits.to_numpy()[candidates]
+    numbers = np.frombuffer("".join(text).encode('ascii'), dtype=np.uint8).reshape(-1, 14).astype(np.int64) - ord('0')
+    # Sequências repetidas (00000000000000, 11111111111111, ...) passam no cálculo, mas não são CNPJs
+    valid = (numbers != numbers[:, :1]).any(axis=1)
+    for size, weights in zip((12, 13), CNPJ_WEIGHTS):
+        rest = numbers[:, :size] @ np.array(weights) % 11
+        valid &= numbers[:, size] == np.where(rest < 2, 0, 11 - rest)
+    result[candidates[valid]] = text[valid]
+    return result
+
+def normalize_cnpj(value):
+    """Os 14 dígitos do CNPJ, sem pontuação, se os dígitos verificadores conferirem; None caso contrário."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return _normalize_cnpjs([value])[0]
+
+def format_cnpj(cnpj):
+    """CNPJ no formato 00.000.000/0000-00 (o valor original, se não for um CNPJ válido)."""
+    digits = normalize_cnpj(cnpj)
+    if digits is None:
+        return cnpj
+    return f"{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}"
+
+def _establishment_rows(cache, cnpj):
+    return cache.df.take(_cnpj_index(cache).get(normalize_cnpj(cnpj), np.empty(0, dtype=np.intp)))
+
+def establishment_history(cnpj):
+    """Processos do estabelecimento na partição ativa, da inspeção mais recente à mais antiga.
+
+    As linhas vêm do índice por CNPJ, sem percorrer a tabela. Para usuários com perfil
+    'inspetor', só os próprios processos são retornados.
+    """
+    inspetor_id = _allowed_inspector(None)
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        df = _establishment_rows(cache, cnpj)
+    if inspetor_id is not None:
+        df = df[df['inspetor_id'] == inspetor_id]
+    return df.sort_values(['data_inspecao', 'ID'], ascending=False, na_position='last')
+
+def open_processes_for_cnpj(cnpj):
+    """Processos em andamento do estabelecimento, de qualquer inspetor (aviso de processo duplicado)."""
+    cache = _get_data_cache()
+    with cache.lock:
+        _sync_cache(cache)
+        df = _establishment_rows(cache, cnpj)
+    return df[df['status'] == 'Em Andamento'][['ID', 'inspetor_id', 'estabelecimento', 'data_inspecao']]
+
+def show_establishment_history(cnpj, key):
+    """Mostra os processos do estabelecimento (CNPJ) e um resumo das visitas."""
+    if normalize_cnpj(cnpj) is None:
+        st.warning("CNPJ inválido: confira os 14 dígitos.")
+        return
+    history = establishment_history(cnpj)
+    if history.empty:
+        st.caption(f"Nenhum processo ativo para o CNPJ {format_cnpj(cnpj)}.")
+        return
+
+    nomes = history['estabelecimento'].dropna().unique()
+    st.markdown(f"**{nomes[0] if len(nomes) else '(sem nome)'}** — CNPJ {format_cnpj(cnpj)}")
+    col_hist = st.columns(3)
+    col_hist[0].metric("Processos", len(history))
+    col_hist[1].metric("Em Andamento", int((history['status'] == 'Em Andamento').sum()))
+    ultima = history['data_inspecao'].max()
+    col_hist[2].metric("Última Inspeção", ultima.strftime('%d/%m/%Y') if not pd.isna(ultima) else "-")
+    st.dataframe(
+        history[["ID", "data_inspecao", "inspetor_id", "estabelecimento", "risco", "status", "data_conclusao"]],
+        hide_index=True,
+        use_container_width=True,
+        key=key,
+        column_config={
+            "ID": st.column_config.Column("ID"),
+            "data_inspecao": st.column_config.DateColumn("Data da Inspeção", format="DD/MM/YYYY"),
+            "inspetor_id": st.column_config.Column("Inspetor"),
+            "estabelecimento": st.column_config.Column("Estabelecimento"),
+            "risco": st.column_config.Column("Risco"),
+            "status": st.column_config.Column("Status"),
+            "data_conclusao": st.column_config.DateColumn("Conclusão", format="DD/MM/YYYY"),
+        }
+    )
+    if len(nomes) > 1:
+        st.caption(f"{len(nomes)} nomes registrados para este CNPJ, entre eles: {', '.join(nomes[:5])}.")
+    st.caption("Processos arquivados não entram neste histórico.")
+
+
+# --- 11. BUSCA NOS TEXTOS (OBSERVAÇÕES, COMENTÁRIOS E HISTÓRICO) ---
+SEARCH_TEXT_COLUMNS = {"obs_inspetor", "comentarios"}
+SEARCH_EVENT_KINDS = {"comentário"}
+SEARCH_FIELD_LABELS = {"obs_inspetor": "Observações do inspetor", "comentarios": "Comentários da Coordenação", "historico": "Histórico (comentário)"}
+SEARCH_PAGE_SIZE = 20
+
+_search_sync_lock = threading.Lock()
+
+@st.cache_resource
+def get_search_index():
+    from search import SearchIndex
+    # Como o diário de gravação, o índice em disco acompanha apenas o backend configurado
+    if _store_override is not None:
+        return SearchIndex(":memory:")
+    index = SearchIndex(SEARCH_INDEX_PATH)
+    if index.get_state("destino") != _journal_destination():
+        index.clear()
+        index.set_state("destino", _journal_destination())
+    return index
+
+def _text_records(df, origem):
+    """Textos pesquisáveis das linhas de 'df' no formato de SearchIndex.upsert (DataFrame)."""
+    parts = []
+    for campo in sorted(SEARCH_TEXT_COLUMNS):
+        texts = df[campo].astype("string").str.strip()
+        present = (texts.notna() & (texts != "")).to_numpy()
+        ids = df['ID'].to_numpy()[present].astype(int)
+        parts.append(pd.DataFrame({
+            'chave': [f"{origem}:{i}:{campo}" for i in ids],
+            'ID': ids,
+            'origem': origem,
+            'campo': campo,
+            'texto': texts.to_numpy()[present].astype(object),
+        }))
+    records = pd.concat(parts, ignore_index=True)
+    records['assinatura'] = pd.util.hash_pandas_object(records['texto'], index=False).astype(str).to_numpy()
+    return records
+
+def _upsert_changed(index, records, indexed):
+    """Indexa os textos de 'records' que não estão em 'indexed' ({chave: assinatura}) com o mesmo conteúdo."""
+    changed = records['assinatura'].to_numpy() != records['chave'].map(indexed).to_numpy()
+    index.upsert(records[changed].astype(object).itertuples(index=False, name=None))
+
+def _event_records(events):
+    """Comentários do histórico no formato de SearchIndex.upsert; a chave é a operação ou a posição do evento."""
+    events = events[events['tipo'].isin(SEARCH_EVENT_KINDS) & events['texto'].notna()]
+    return [
+        (f"evento:{op_id}" if isinstance(op_id, str) and op_id else f"evento:#{position}", int(inspection_id), "historico", "historico",
+         str(texto), "")
+        for position, inspection_id, texto, op_id in zip(events.index, events['ID'], events['texto'], events['op_id'])
+    ]
+
+@timed("busca: atualização do índice")
+def _sync_search_index(archive_years=()):
+    """Leva ao índice o que mudou desde a última busca.
+
+    Após uma releitura completa do cache, os textos são comparados com o índice pela
+    assinatura e só os diferentes são reindexados; depois disso, só os processos
+    acrescentados ou alterados. Os comentários do histórico são lidos a partir da
+    última posição indexada, no máximo a cada SYNC_CHECK_INTERVAL segundos.
+    """
+    index = get_search_index()
+    cache = _get_data_cache()
+    # Uma busca por vez atualiza o índice; a trava do cache fica livre durante a indexação
+    with _search_sync_lock:
+        with cache.lock:
+            _sync_cache(cache)
+            df = cache.df.copy(deep=False)
+            pending, cache.search_pending = cache.search_pending, set()
+            events, cache.search_events = cache.search_events, []
+            now = time.monotonic()
+            check_events = now - cache.search_checked_at >= SYNC_CHECK_INTERVAL
+            if check_events:
+                cache.search_checked_at = now
+        try:
+            if pending is None:
+                records = _text_records(df, "ativo")
+                indexed = index.signatures("ativo")
+                _upsert_changed(index, records, indexed)
+                # Processos arquivados (ou apagados) saem da origem 'ativo'
+                index.remove(set(indexed) - set(records['chave']))
+            elif pending:
+                records = _text_records(df[df['ID'].isin(pending)], "ativo")
+                index.upsert(records.astype(object).itertuples(index=False, name=None))
+                index.remove({f"ativo:{i}:{campo}" for i in pending for campo in SEARCH_TEXT_COLUMNS} - set(records['chave']))
+
+            if events:
+                index.upsert(_event_records(pd.DataFrame(events, columns=EVENT_COLUMNS)))
+            if check_events:
+                new_events, position = get_store().load_events_since(int(index.get_state("eventos", 0)))
+                index.upsert(_event_records(new_events))
+                index.set_state("eventos", position)
+        except Exception:
+            with cache.lock:
+                cache.search_pending = None
+                cache.search_events = events + cache.search_events
+            raise
+
+        # Um ano do arquivo só é reindexado quando seu número de processos muda (após um arquivamento)
+        archived = fetch_parallel({year: partial(_load_archive_year, year) for year in archive_years})
+        for year, archive_df in archived.items():
+            origem = f"arquivo {year}"
+            if index.get_state(origem) != str(len(archive_df)):
+                records = _text_records(archive_df, origem)
+                indexed = index.signatures(origem)
+                _upsert_changed(index, records, indexed)
+                index.remove(set(indexed) - set(records['chave']))
+                index.set_state(origem, len(archive_df))
+    return df, archived
+
+def search_texts(query, page=1, page_size=SEARCH_PAGE_SIZE, include_archive=False):
+    """Processos cujos textos contêm todas as palavras de 'query', do mais ao menos relevante.
+
+    A busca ignora acentos e maiúsculas, e a última palavra vale como prefixo. Retorna
+    (DataFrame da página, total de processos); cada linha traz o trecho mais relevante e
+    os dados do processo. Para usuários com perfil 'inspetor', só os próprios processos.
+    """
+    archive_years = get_archive_years() if include_archive else []
+    df, archived = _sync_search_index(archive_years)
+    processes = pd.concat([df, *archived.values()], ignore_index=True) if archived else df
+
+    inspetor_id = _allowed_inspector(None)
+    ids = None
+    if inspetor_id is not None:
+        ids = processes.loc[processes['inspetor_id'] == inspetor_id, 'ID'].dropna().astype(int).unique()
+    origins = ["ativo", "historico", *(f"arquivo {year}" for year in archive_years)]
+    results, total = get_search_index().search(query, origins, ids=ids, limit=page_size, offset=(page - 1) * page_size)
+
+    info = processes.dropna(subset=['ID']).drop_duplicates('ID')[['ID', 'estabelecimento', 'inspetor_id', 'status']]
+    results = results.merge(info.astype({'ID': int}), on='ID', how='left')
+    # Comentários do histórico de processos fora da partição ativa e dos anos pedidos
+    results['status'] = results['status'].astype(object).fillna("Arquivado")
+    results['campo'] = results['campo'].map(lambda c: SEARCH_FIELD_LABELS.get(c, c))
+    return results, total
+
+def show_search(key):
+    """Caixa de busca nos textos dos processos, com resultados ordenados por relevância e paginados.
+
+    A busca é feita durante a digitação, após uma pausa (a última palavra pode estar incompleta).
+    """
+    page_key = f"{key}_pagina"
+    col_query, col_archive = st.columns([3, 1])
+    query = col_query.text_input(
+        "Buscar nas observações, comentários e histórico", key=f"{key}_consulta",
+        placeholder="Ex.: extintor vencido", help="Acentos e maiúsculas são ignorados; a última palavra pode estar incompleta.",
+        on_change=lambda: st.session_state.pop(page_key, None), live=True
+    )
+    include_archive = col_archive.toggle("Incluir arquivados", key=f"{key}_arquivo")
+    if not query.strip():
+        return
+
+    results, total = search_texts(query, page=st.session_state.get(page_key, 1), include_archive=include_archive)
+    total_pages = max(1, math.ceil(total / SEARCH_PAGE_SIZE))
+    if st.session_state.get(page_key, 1) > total_pages:
+        st.session_state[page_key] = 1
+        results, total = search_texts(query, include_archive=include_archive)
+    if not total:
+        st.info("Nenhum processo encontrado com todas as palavras buscadas.")
+        return
+
+    st.caption(f"{total} processo(s) encontrado(s), do mais ao menos relevante.")
+    st.dataframe(
+        results[["ID", "estabelecimento", "inspetor_id", "status", "campo", "trecho"]],
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "ID": st.column_config.Column("ID"),
+            "estabelecimento": st.column_config.Column("Estabelecimento"),
+            "inspetor_id": st.column_config.Column("Inspetor"),
+            "status": st.column_config.Column("Status"),
+            "campo": st.column_config.Column("Encontrado em"),
+            "trecho": st.column_config.Column("Trecho", width="large"),
+        }
+    )
+    st.number_input(f"Página da busca (de {total_pages})", min_value=1, max_value=total_pages, step=1, key=page_key)
+
+
+# --- 12. SÉRIES TEMPORAIS DOS INDICADORES ---
+TIME_SERIES_FREQS = {"M": "Mensal", "W": "Semanal"}
+TIME_SERIES_DIMENSIONS = {"risco": "Risco", "atividade": "Atividade", "inspetor_id": "Inspetor"}
+# Faixas do tempo até a conclusão, em dias (a partir da data da inspeção)
+DURATION_BINS = [-1, 7, 15, 30, 60, 90, 180, np.inf]
+DURATION_LABELS = ["até 7 dias", "8 a 15 dias", "16 a 30 dias", "31 a 60 dias", "61 a 90 dias", "91 a 180 dias", "mais de 180 dias"]
+
+def _period_start(dates, freq):
+    """Início do mês ou da semana (segunda-feira) de cada data."""
+    return dates.dt.to_period(freq).dt.start_time
+
+@timed("séries temporais (cálculo)")
+def _build_time_series(df):
+    """Séries de todas as combinações de periodicidade e detalhamento: {(freq, dimensão ou None): tabelas}.
+
+    'fluxo' tem, por período e grupo, os processos abertos (pela data da inspeção) e os
+    concluídos (pela data de conclusão), com a soma dos dias até a conclusão e quantos
+    foram concluídos até o prazo efetivo; 'duracao' conta os concluídos por faixa de
+    DURATION_BINS. Tudo é calculado com operações vetorizadas, uma vez por versão dos dados.
+    """
+    closed = df[((df['status'] == 'Concluído') & df['data_conclusao'].notna()).to_numpy()]
+    prazo = _effective_deadline(closed)
+    dias = (closed['data_conclusao'] - closed['data_inspecao']).dt.days.clip(lower=0)
+    measures = pd.DataFrame({
+        'concluidos': 1,
+        'dias': dias.fillna(0),
+        'com_prazo': prazo.notna().astype(int),
+        'no_prazo': (closed['data_conclusao'].dt.normalize() <= prazo.dt.normalize()).astype(int),
+    }, index=closed.index)
+    faixa = pd.cut(dias, DURATION_BINS, labels=DURATION_LABELS).rename('faixa')
+
+    series = {}
+    for freq in TIME_SERIES_FREQS:
+        opened_at = _period_start(df['data_inspecao'], freq).rename('periodo')
+        closed_at = _period_start(closed['data_conclusao'], freq).rename('periodo')
+        for by in [None, *TIME_SERIES_DIMENSIONS]:
+            grupo = (df[by] if by else pd.Series("Todos", index=df.index)).rename('grupo')
+            grupo_closed = grupo[closed.index]
+            abertos = opened_at.groupby([opened_at, grupo], observed=True).size().rename('abertos')
+            fechados = measures.groupby([closed_at, grupo_closed], observed=True).sum()
+            fluxo = pd.concat([abertos, fechados], axis=1).fillna(0).astype({'abertos': int, 'concluidos': int, 'com_prazo': int, 'no_prazo': int})
+            duracao = faixa.groupby([closed_at, grupo_closed, faixa], observed=True).size().rename('processos')
+            series[freq, by] = {
+                'fluxo': fluxo.reset_index().sort_values(['periodo', 'grupo'], ignore_index=True),
+                'duracao': duracao.reset_index(),
+            }
+    return series
+
+# A chave é a versão dos dados: as séries são recalculadas só quando os dados mudam
+@st.cache_data(max_entries=4, show_spinner=False)
+def _time_series(versao, archive_years):
+    archived = fetch_parallel({year: partial(_load_archive_year, year) for year in archive_years})
+    df = initialize_data()
+    if archived:
+        df = pd.concat([df, *archived.values()], ignore_index=True)
+    return _build_time_series(df)
+
+def time_series_range(archive_years=()):
+    """Primeiro e último dia com processos abertos ou concluídos (ou None, sem dados)."""
+    fluxo = _time_series(data_version(), tuple(archive_years))["M", None]['fluxo']
+    if fluxo.empty:
+        return None
+    return fluxo['periodo'].min().date(), (fluxo['periodo'].max() + pd.offsets.MonthEnd(0)).date()
+
+def get_time_series(freq="M", by=None, start=None, end=None, archive_years=()):
+    """Indicadores no tempo entre 'start' e 'end', por mês ('M') ou semana ('W'), detalhados por 'by'.
+
+    Retorna um dicionário com 'fluxo' (abertos e concluídos por período e grupo), 'prazo'
+    (por grupo: concluídos, concluídos com prazo, no prazo, '% no prazo', a soma e a
+    'média de dias' até a conclusão) e 'duracao' (concluídos por faixa de dias e grupo). As séries vêm
+    prontas do cache; aqui só são recortadas pelo intervalo e somadas.
+    """
+    series = _time_series(data_version(), tuple(archive_years))[freq, by]
+    fluxo, duracao = series['fluxo'], series['duracao']
+    if start is not None:
+        first = _period_start(pd.Series([pd.Timestamp(start)]), freq).iloc[0]
+        fluxo, duracao = fluxo[fluxo['periodo'] >= first], duracao[duracao['periodo'] >= first]
+    if end is not None:
+        fluxo, duracao = fluxo[fluxo['periodo'] <= pd.Timestamp(end)], duracao[duracao['periodo'] <= pd.Timestamp(end)]
+
+    prazo = fluxo.groupby('grupo', observed=True)[['concluidos', 'com_prazo', 'no_prazo', 'dias']].sum()
+    prazo['% no prazo'] = (prazo['no_prazo'] / prazo['com_prazo'].where(prazo['com_prazo'] > 0) * 100).round(1)
+    prazo['média de dias'] = (prazo['dias'] / prazo['concluidos'].where(prazo['concluidos'] > 0)).round(1)
+    return {
+        'fluxo': fluxo[['periodo', 'grupo', 'abertos', 'concluidos']],
+        'prazo': prazo.reset_index(),
+        'duracao': duracao.groupby(['grupo', 'faixa'], observed=True)['processos'].sum().reset_index(),
+    }